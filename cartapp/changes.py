@@ -0,0 +1,56 @@
+"""Per-user cart version stamps.
+
+Every cart write bumps the owner's version. Derived data cached per cart,
+such as shipping quotes, is keyed by the version and never needs explicit
+invalidation. Signals cover ``save()``/``delete()``; bulk writes such as
+``queryset.update()`` at checkout call :func:`cart_changed` themselves.
+
+Saved or deleted lines also refresh the stored ``post_fee`` of the cart after
+commit (:func:`lines_changed`), so cart reads never write.
+"""
+from __future__ import annotations
+
+from django.db import transaction
+
+from crossborder_trade.cache_utils import bump_version, get_version
+
+_VERSION_TIMEOUT = 7 * 24 * 3600
+
+
+def _version_key(user_id: int) -> str:
+    return f'cartapp:cart:version:{user_id}'
+
+
+def get_cart_version(user_id: int) -> int:
+    return get_version(_version_key(user_id), _VERSION_TIMEOUT)
+
+
+def bump_cart_version(user_id: int) -> int:
+    return bump_version(_version_key(user_id), _VERSION_TIMEOUT)
+
+
+def cart_changed(user_id: int) -> None:
+    bump_cart_version(user_id)
+    # 提交后再递增一次：事务提交前读到旧数据的请求不会以新版本号写入缓存
+    try:
+        transaction.on_commit(lambda: bump_cart_version(user_id))
+    except Exception:  # TransactionManagementError when outside atomic
+        bump_cart_version(user_id)
+
+
+def _store_shipping_fees(user_id: int) -> None:
+    from pricingapp.shipping import store_cart_fees
+
+    store_cart_fees(user_id)
+
+
+def lines_changed(user_id: int) -> None:
+    """A cart line was saved or deleted: bump the version and store the new line fees after commit."""
+    cart_changed(user_id)
+    try:
+        transaction.on_commit(lambda: _store_shipping_fees(user_id))
+    except Exception:  # TransactionManagementError when outside atomic
+        _store_shipping_fees(user_id)
+
+
+__all__ = ['bump_cart_version', 'cart_changed', 'get_cart_version', 'lines_changed']
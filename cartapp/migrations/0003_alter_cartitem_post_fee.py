@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cartapp', '0002_alter_cartitem_goods'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartitem',
+            name='post_fee',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=7),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.db import models
-from django.db.models.signals import post_save  # 导入 post_save 信号
+from django.db.models.signals import post_delete, post_save  # 导入 post_save 信号
 from django.dispatch import receiver  # 导入 receiver 装饰器
 
 from userapp.models import UserInfo
@@ -14,7 +14,7 @@ class CartItem(models.Model):
     userInfo = models.ForeignKey(UserInfo, on_delete=models.CASCADE)
     count = models.IntegerField(default=0)  # 总价
     num = models.IntegerField(default=1)  # 数量
-    post_fee = models.IntegerField(default=0)  # 运费
+    post_fee = models.DecimalField(max_digits=7, decimal_places=2, default=0)  # 运费（按重量/件数分摊的购物车运费）
     price = models.IntegerField(default=0)  # 单价
 
     def __str__(self):
@@ -34,3 +34,12 @@ def create_cart(sender, instance=None, created=False, some_default_goods_id=None
     if created and some_default_goods_id:
         if Goods.objects.filter(pk=some_default_goods_id).exists():
             CartItem.objects.create(userInfo=instance, goods_id=some_default_goods_id)
+
+
+# 购物车变更后递增该用户的购物车版本号，按版本缓存的运费报价随之失效；提交后重新写入各行运费
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed_handler(sender, instance=None, **kwargs):
+    from cartapp.changes import lines_changed
+
+    lines_changed(instance.userInfo_id)
@@ -9,7 +9,7 @@ class CartItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CartItem
-        fields = ['id', 'goods', 'num', 'price', 'total_price']
+        fields = ['id', 'goods', 'num', 'price', 'total_price', 'post_fee']
 
     def get_total_price(self, obj):
         return obj.num * obj.price
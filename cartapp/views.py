@@ -8,7 +8,12 @@ from goodsapp.models import Goods
 from userapp.models import Address, RealName
 from cartapp.models import CartItem
 from orderapp.models import Order, Orderitem
+from orderapp import flash_sale
 from .serializers import CartItemSerializer
+from pricingapp.currency import base_currency, localize_amounts, localize_goods, localize_lines
+from pricingapp.landed_cost import destination_for
+from pricingapp.shipping import quote_cart
+from pricingapp.decorators import currency_param
 
 from django.utils import timezone
 import uuid
@@ -84,6 +89,14 @@ def add_to_cart(request, goods_id):
                 'message': '商品数量必须大于0'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        # 秒杀中的商品令牌已用完时直接拒绝，不查询数据库（加购不占用令牌，下单时才扣减）
+        tokens = flash_sale.remaining(goods_id)
+        if tokens is not None and tokens < quantity:
+            return Response({
+                'status': 'error',
+                'message': '商品已抢光'
+            }, status=status.HTTP_409_CONFLICT)
+
         # 根据传入的商品 ID 获取商品实例
         goods = get_object_or_404(Goods, id=goods_id)
 
@@ -131,20 +144,35 @@ def add_to_cart(request, goods_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@currency_param
 def cart_detail(request):
     """
-    获取购物车详情
+    获取购物车详情（运费按默认收货地址计算）
     """
     try:
         # 获取当前请求用户的购物车项，并预加载商品信息
-        items = CartItem.objects.select_related('goods').filter(
+        items = list(CartItem.objects.select_related('goods').filter(
             userInfo=request.user,
             is_delete=False
-        )
+        ))
+        address = Address.objects.filter(aUserInfo=request.user, isdefault=True).first()
+        # 计算运费并写入各购物车项的 post_fee（按购物车版本缓存，未变化时不重复计算）
+        shipping = quote_cart(request.user.id, items, destination_for(address))
 
         # 使用序列化器处理数据
-        serializer = CartItemSerializer(items, many=True)
-        return Response({'status': 'success', 'cart': serializer.data}, status=status.HTTP_200_OK)
+        cart = CartItemSerializer(items, many=True).data
+        # 按 ?currency= 换算单价、小计、运费和商品价格
+        localize_lines(cart, request.currency)
+        converted_fees = localize_amounts(cart, request.currency, ('post_fee',))
+        localize_goods([line['goods'] for line in cart], request.currency)
+        return Response({
+            'status': 'success',
+            'cart': cart,
+            'shipping_fee': str(shipping.fee if converted_fees is None else converted_fees['post_fee']),
+            'shipping_zone': shipping.zone,
+            'free_shipping': shipping.free_shipping,
+            'currency': request.currency or base_currency(),
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         print(f"Error in cart_detail: {str(e)}")  # 添加日志
         return Response({'status': 'error', 'message': '获取购物车信息失败'},
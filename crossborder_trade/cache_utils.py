@@ -0,0 +1,56 @@
+"""Small helpers around the Django cache shared by several apps."""
+from __future__ import annotations
+
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(key: str, *, timeout: int = 10, wait: float = 1.0, poll: float = 0.02) -> Iterator[bool]:
+    """Best-effort mutex built on ``cache.add``.
+
+    Yields ``True`` when the lock was acquired within ``wait`` seconds. Callers
+    must handle ``False`` themselves (usually by invalidating instead of
+    patching), since the cache gives no stronger guarantee.
+    """
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    acquired = cache.add(lock_key, token, timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(poll)
+        acquired = cache.add(lock_key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def get_version(key: str, timeout: int | None = None) -> int:
+    """Current value of the version stamp under ``key``, created if missing.
+
+    Stamps are seeded from the clock in milliseconds, so a stamp that was
+    evicted never repeats a value readers may still hold.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout)
+        version = cache.get(key, 0)
+    return int(version)
+
+
+def bump_version(key: str, timeout: int | None = None) -> int:
+    """Increment the version stamp under ``key`` and return the new value."""
+    try:
+        return cache.incr(key)
+    except ValueError:  # key missing or evicted
+        cache.add(key, int(time.time() * 1000), timeout)
+        return cache.incr(key)
+
+
+__all__ = ["bump_version", "cache_lock", "get_version"]
@@ -0,0 +1,165 @@
+"""Serve files below ``MEDIA_ROOT``.
+
+With ``MEDIA_SENDFILE_BACKEND`` set, the view only resolves and validates the
+path and hands the transfer to the front-end server (``X-Accel-Redirect`` for
+nginx, ``X-Sendfile`` for Apache/lighttpd). Otherwise files are returned as a
+``FileResponse`` so the WSGI server can use ``sendfile`` through
+``wsgi.file_wrapper``. Single byte ranges and conditional requests are
+supported. Content-addressed derivatives are cached as immutable.
+"""
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+SENDFILE_BACKENDS = ('x-accel-redirect', 'x-sendfile')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 文件名中带 sha256 内容哈希的派生文件（例如 derivatives/ab/<hash>-thumb.webp）
+_CONTENT_HASHED = re.compile(r'(?:^|/)[0-9a-f]{64}-[\w-]+\.\w+$')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CHUNK_SIZE = 64 * 1024
+
+
+def is_content_hashed(path: str) -> bool:
+    return bool(_CONTENT_HASHED.search(path))
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Return ``(start, end)`` (inclusive) for a single byte range.
+
+    ``None`` means "serve the whole file" (no header, a multi-range or a
+    malformed value, which RFC 9110 lets servers ignore). Raises ``ValueError``
+    when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _iter_range(path: str, start: int, length: int):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _cache_control(path: str) -> str:
+    if is_content_hashed(path):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+
+
+def _offload(path: str, full_path: str, backend: str) -> HttpResponse:
+    response = HttpResponse()
+    if backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path)
+    else:
+        response['X-Sendfile'] = full_path
+    # 由前端服务器负责 Range、Content-Length 和实际的文件传输
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """媒体文件下载：优先交给 nginx/Apache 发送，否则用 FileResponse（支持 Range）"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('文件不存在')
+    try:
+        stat_result = os.stat(full_path)
+    except OSError:
+        raise Http404('文件不存在')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('文件不存在')
+
+    mtime = stat_result.st_mtime
+    headers = {
+        'Last-Modified': http_date(mtime),
+        'Cache-Control': _cache_control(path),
+    }
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    backend = (getattr(settings, 'MEDIA_SENDFILE_BACKEND', '') or '').lower()
+    if backend in SENDFILE_BACKENDS:
+        response = _offload(path, full_path, backend)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    size = stat_result.st_size
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and parse_http_date_safe(if_range) != int(mtime):
+        range_header = None  # 文件已变化，按 If-Range 语义返回完整内容
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(full_path, start, length), status=206, content_type=content_type,
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+__all__ = ['IMMUTABLE_CACHE_CONTROL', 'is_content_hashed', 'parse_range', 'serve_media']
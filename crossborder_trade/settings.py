@@ -76,6 +76,7 @@ INSTALLED_APPS = [
     'cartapp.apps.CartappConfig',
     'paymentapp.apps.PaymentappConfig',
     'eventstream.apps.EventstreamConfig',
+    'pricingapp.apps.PricingappConfig',
     # 跨域处理
     'corsheaders',
 ]
@@ -294,6 +295,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # 媒体文件配置
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# 媒体文件服务：生产环境建议配置 MEDIA_SENDFILE_BACKEND，由 nginx/Apache 直接发送文件
+MEDIA_SERVE_ENABLED = env_bool('MEDIA_SERVE_ENABLED', DEBUG)
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND', '')  # '', 'x-accel-redirect' 或 'x-sendfile'
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -318,6 +324,7 @@ KAFKA_PRODUCER_COMPRESSION = os.getenv('KAFKA_PRODUCER_COMPRESSION', 'zstd')
 KAFKA_TOPICS = {
     'orders': os.getenv('KAFKA_ORDERS_TOPIC', 'order-events'),
     'stock': os.getenv('KAFKA_STOCK_TOPIC', 'stock-events'),
+    'catalog': os.getenv('KAFKA_CATALOG_TOPIC', 'catalog-events'),
 }
 KAFKA_PRODUCER_CONFIG = {
     'compression_type': KAFKA_PRODUCER_COMPRESSION,
@@ -330,8 +337,91 @@ OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', '30'))
 OUTBOX_MAX_BACKOFF_SECONDS = int(os.getenv('OUTBOX_MAX_BACKOFF_SECONDS', '600'))
 OUTBOX_PRODUCER_SEND_TIMEOUT = int(os.getenv('OUTBOX_PRODUCER_SEND_TIMEOUT', '10'))
 
+# 商品联想索引（多个 uwsgi 进程通过 mmap 共享同一份快照文件）
+AUTOCOMPLETE_SNAPSHOT_PATH = os.getenv('AUTOCOMPLETE_SNAPSHOT_PATH', str(BASE_DIR / 'var' / 'autocomplete.idx'))
+AUTOCOMPLETE_MAX_RESULTS = int(os.getenv('AUTOCOMPLETE_MAX_RESULTS', '10'))
+# 增量快照覆盖的商品数超过该值时并入基础快照
+AUTOCOMPLETE_DELTA_MAX_GOODS = int(os.getenv('AUTOCOMPLETE_DELTA_MAX_GOODS', '1000'))
+
+# 商品列表分面筛选的价格区间边界
+GOODS_PRICE_BANDS = tuple(
+    int(edge) for edge in os.getenv('GOODS_PRICE_BANDS', '0,50,100,200,500,1000').split(',') if edge.strip()
+)
+# 分面位图的缓存时间（写入时已打补丁，超时兜底漏掉的失效）
+GOODS_FACET_INDEX_TIMEOUT = int(os.getenv('GOODS_FACET_INDEX_TIMEOUT', '3600'))
+# 每个进程保留的已反序列化分面索引个数（按分类），分类戳变化时才重新从缓存读取
+GOODS_FACET_LOCAL_CACHE_SIZE = int(os.getenv('GOODS_FACET_LOCAL_CACHE_SIZE', '256'))
+
+# 浏览流量使用的内存列式商品快照（依赖 numpy，缺失时回退到 ORM）
+CATALOG_SNAPSHOT_ENABLED = env_bool('CATALOG_SNAPSHOT_ENABLED', True)
+CATALOG_SNAPSHOT_MIN_REFRESH_SECONDS = int(os.getenv('CATALOG_SNAPSHOT_MIN_REFRESH_SECONDS', '5'))
+
+# 共同购买推荐：每个商品保留的邻居数、参与统计的订单最大商品数、缓存时间
+RECOMMENDATION_TOP_K = int(os.getenv('RECOMMENDATION_TOP_K', '10'))
+RECOMMENDATION_MAX_ORDER_ITEMS = int(os.getenv('RECOMMENDATION_MAX_ORDER_ITEMS', '50'))
+RECOMMENDATION_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATION_CACHE_TIMEOUT', str(24 * 3600)))
+
+# 热销榜（1h/24h/7d 滚动窗口）每个窗口保留的商品数
+HOT_PRODUCTS_MAX_RESULTS = int(os.getenv('HOT_PRODUCTS_MAX_RESULTS', '50'))
+
+# 商品详情缓存时间（写入后主动失效，超时兜底销量、库存等绕过信号的更新）及批量查询的 ID 上限
+GOODS_DETAIL_CACHE_TIMEOUT = int(os.getenv('GOODS_DETAIL_CACHE_TIMEOUT', '300'))
+GOODS_MULTI_GET_MAX_IDS = int(os.getenv('GOODS_MULTI_GET_MAX_IDS', '200'))
+
+# 首页预渲染数据：热门、新品条数，每个分类的精选条数，目录变更后合并重建的等待秒数
+HOMEPAGE_HOT_LIMIT = int(os.getenv('HOMEPAGE_HOT_LIMIT', '10'))
+HOMEPAGE_NEW_LIMIT = int(os.getenv('HOMEPAGE_NEW_LIMIT', '10'))
+HOMEPAGE_CATEGORY_HIGHLIGHTS = int(os.getenv('HOMEPAGE_CATEGORY_HIGHLIGHTS', '4'))
+HOMEPAGE_REBUILD_DEBOUNCE_SECONDS = int(os.getenv('HOMEPAGE_REBUILD_DEBOUNCE_SECONDS', '5'))
+
+# 静态目录快照导出（export_catalog_snapshot）的目录和分类列表每页商品数
+CATALOG_EXPORT_DIR = os.getenv('CATALOG_EXPORT_DIR', str(BASE_DIR / 'var' / 'catalog'))
+CATALOG_EXPORT_PAGE_SIZE = int(os.getenv('CATALOG_EXPORT_PAGE_SIZE', '50'))
+
+# sitemap / 商品 feed：前台商品页的站点地址、gzip 分片的输出目录和对外地址（默认同站点地址）、每个分片的商品数（上限 50000）
+STOREFRONT_URL = os.getenv('STOREFRONT_URL', 'http://localhost:8080')
+FEED_OUTPUT_DIR = os.getenv('FEED_OUTPUT_DIR', str(BASE_DIR / 'var' / 'feeds'))
+FEED_PUBLIC_URL = os.getenv('FEED_PUBLIC_URL', '')
+SITEMAP_SHARD_SIZE = int(os.getenv('SITEMAP_SHARD_SIZE', '50000'))
+
+# 热门商品分片库存：开启分片时默认拆分的子行数，分片总库存的缓存秒数
+STOCK_SHARD_COUNT = int(os.getenv('STOCK_SHARD_COUNT', '8'))
+STOCK_TOTAL_CACHE_SECONDS = int(os.getenv('STOCK_TOTAL_CACHE_SECONDS', '2'))
+
+# 目录增量同步接口每页最多返回的变更行数
+CATALOG_SYNC_PAGE_SIZE = int(os.getenv('CATALOG_SYNC_PAGE_SIZE', '500'))
+
+# 批量改价/改库存接口每个事务处理的行数（每批一次缓存失效、一条外盒事件）
+GOODS_BULK_UPDATE_CHUNK_SIZE = int(os.getenv('GOODS_BULK_UPDATE_CHUNK_SIZE', '500'))
+
+# 销量、浏览量写回缓冲：每个进程的后台线程每隔 N 秒用一条 UPDATE 合并写回
+COUNTER_BUFFER_ENABLED = env_bool('COUNTER_BUFFER_ENABLED', True)
+COUNTER_FLUSH_INTERVAL_SECONDS = float(os.getenv('COUNTER_FLUSH_INTERVAL_SECONDS', '5'))
+
+# 多币种价格：商品价格的基础货币，及每个进程保留的换算后价目表个数（按币种 + 目录版本）
+BASE_CURRENCY = os.getenv('BASE_CURRENCY', 'CNY')
+PRICE_LIST_CACHE_SIZE = int(os.getenv('PRICE_LIST_CACHE_SIZE', '8'))
+
+# 进口税费：收货地址未填写国家时使用的目的国（ISO 3166-1 两位代码）
+DEFAULT_DESTINATION_COUNTRY = os.getenv('DEFAULT_DESTINATION_COUNTRY', 'CN')
+
+# 运费报价按用户 + 购物车版本缓存的秒数
+SHIPPING_QUOTE_CACHE_TIMEOUT = int(os.getenv('SHIPPING_QUOTE_CACHE_TIMEOUT', '600'))
+
+# 商品图片派生尺寸（WebP，按最长边像素），由 media 队列异步生成
+IMAGE_DERIVATIVE_SIZES = {
+    'thumb': int(os.getenv('IMAGE_DERIVATIVE_THUMB_SIZE', '200')),
+    'medium': int(os.getenv('IMAGE_DERIVATIVE_MEDIUM_SIZE', '600')),
+}
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '80'))
+
 # Celery / 异步任务配置
 ORDER_EXPIRATION_MINUTES = int(os.getenv('ORDER_EXPIRATION_MINUTES', '30'))
+# 秒杀活动结束后等待多少秒再对账（让结束前已拿到令牌的下单先提交），再把未售出件数归还库存
+FLASH_SALE_RECONCILE_GRACE_SECONDS = int(os.getenv('FLASH_SALE_RECONCILE_GRACE_SECONDS', '60'))
+# 异步下单：结账请求只做轻量校验并返回 202 凭据，orders 队列按批创建订单
+CHECKOUT_ASYNC_ENABLED = env_bool('CHECKOUT_ASYNC_ENABLED', False)
+CHECKOUT_INTAKE_BATCH_SIZE = int(os.getenv('CHECKOUT_INTAKE_BATCH_SIZE', '50'))
 
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://127.0.0.1:6379/1')
@@ -345,6 +435,7 @@ CELERY_BASE_QUEUE = os.getenv('CELERY_DEFAULT_QUEUE', 'default')
 CELERY_ORDERS_QUEUE = os.getenv('CELERY_ORDERS_QUEUE', 'orders')
 CELERY_PAYMENTS_QUEUE = os.getenv('CELERY_PAYMENTS_QUEUE', 'payments')
 CELERY_NOTIFICATIONS_QUEUE = os.getenv('CELERY_NOTIFICATIONS_QUEUE', 'notifications')
+CELERY_MEDIA_QUEUE = os.getenv('CELERY_MEDIA_QUEUE', 'media')
 
 CELERY_TASK_DEFAULT_QUEUE = CELERY_BASE_QUEUE
 CELERY_TASK_DEFAULT_EXCHANGE = CELERY_BASE_QUEUE
@@ -360,6 +451,7 @@ if CELERY_AVAILABLE and Queue is not None and Exchange is not None:
             Exchange(CELERY_NOTIFICATIONS_QUEUE),
             routing_key=CELERY_NOTIFICATIONS_QUEUE,
         ),
+        Queue(CELERY_MEDIA_QUEUE, Exchange(CELERY_MEDIA_QUEUE), routing_key=CELERY_MEDIA_QUEUE),
     )
 else:  # pragma: no cover - simplifies settings when Celery isn't available yet
     CELERY_TASK_QUEUES = (
@@ -367,6 +459,7 @@ else:  # pragma: no cover - simplifies settings when Celery isn't available yet
         {"name": CELERY_ORDERS_QUEUE},
         {"name": CELERY_PAYMENTS_QUEUE},
         {"name": CELERY_NOTIFICATIONS_QUEUE},
+        {"name": CELERY_MEDIA_QUEUE},
     )
 CELERY_TASK_ROUTES = {
     'orderapp.tasks.send_order_confirmation_notification': {
@@ -377,10 +470,26 @@ CELERY_TASK_ROUTES = {
         'queue': CELERY_ORDERS_QUEUE,
         'routing_key': CELERY_ORDERS_QUEUE,
     },
+    'orderapp.tasks.sync_flash_sales': {
+        'queue': CELERY_ORDERS_QUEUE,
+        'routing_key': CELERY_ORDERS_QUEUE,
+    },
+    'orderapp.tasks.process_checkout_intake': {
+        'queue': CELERY_ORDERS_QUEUE,
+        'routing_key': CELERY_ORDERS_QUEUE,
+    },
     'orderapp.tasks.publish_outbox_events': {
         'queue': CELERY_NOTIFICATIONS_QUEUE,
         'routing_key': CELERY_NOTIFICATIONS_QUEUE,
     },
+    'goodsapp.tasks.rebalance_stock_shards': {
+        'queue': CELERY_ORDERS_QUEUE,
+        'routing_key': CELERY_ORDERS_QUEUE,
+    },
+    'goodsapp.tasks.generate_image_derivatives': {
+        'queue': CELERY_MEDIA_QUEUE,
+        'routing_key': CELERY_MEDIA_QUEUE,
+    },
     'paymentapp.tasks.handle_successful_payment': {
         'queue': CELERY_PAYMENTS_QUEUE,
         'routing_key': CELERY_PAYMENTS_QUEUE,
@@ -403,11 +512,46 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(minute='*/15'),
         'options': {'queue': CELERY_ORDERS_QUEUE},
     },
+    'rebalance-stock-shards': {
+        'task': 'goodsapp.tasks.rebalance_stock_shards',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': CELERY_ORDERS_QUEUE},
+    },
+    'sync-flash-sales': {
+        'task': 'orderapp.tasks.sync_flash_sales',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': CELERY_ORDERS_QUEUE},
+    },
+    'process-checkout-intake': {
+        'task': 'orderapp.tasks.process_checkout_intake',
+        'schedule': crontab(minute='*'),
+        'options': {'queue': CELERY_ORDERS_QUEUE},
+    },
     'publish-outbox-events': {
         'task': 'orderapp.tasks.publish_outbox_events',
         'schedule': crontab(minute='*/5'),
         'options': {'queue': CELERY_NOTIFICATIONS_QUEUE},
     },
+    'rebuild-autocomplete-index': {
+        'task': 'goodsapp.tasks.refresh_autocomplete_index',
+        'schedule': crontab(minute=0),
+        'options': {'queue': CELERY_BASE_QUEUE},
+    },
+    'rebuild-homepage': {
+        'task': 'goodsapp.tasks.rebuild_homepage',
+        'schedule': crontab(minute='*/10'),
+        'options': {'queue': CELERY_BASE_QUEUE},
+    },
+    'generate-feeds': {
+        'task': 'goodsapp.tasks.generate_feeds',
+        'schedule': crontab(minute=15),
+        'options': {'queue': CELERY_BASE_QUEUE},
+    },
+    'rebuild-recommendations': {
+        'task': 'goodsapp.tasks.rebuild_recommendations',
+        'schedule': crontab(hour=3, minute=30),
+        'options': {'queue': CELERY_BASE_QUEUE},
+    },
 }
 default_celery_scheduler = (
     'django_celery_beat.schedulers:DatabaseScheduler'
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import tempfile
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from .media import IMMUTABLE_CACHE_CONTROL, parse_range, serve_media
+
+HASHED_NAME = 'derivatives/ab/' + 'ab' * 32 + '-thumb.webp'
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        self._media_dir = tempfile.TemporaryDirectory()
+        self._override = override_settings(MEDIA_ROOT=self._media_dir.name, MEDIA_SENDFILE_BACKEND='')
+        self._override.enable()
+        self.factory = RequestFactory()
+        self.payload = bytes(range(256)) * 4
+        for name in ('books/cover.jpg', HASHED_NAME):
+            full_path = os.path.join(self._media_dir.name, name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as handle:
+                handle.write(self.payload)
+        self.mtime = os.stat(os.path.join(self._media_dir.name, 'books/cover.jpg')).st_mtime
+
+    def tearDown(self):
+        self._override.disable()
+        self._media_dir.cleanup()
+
+    def _get(self, path, **headers):
+        return serve_media(self.factory.get(f'/media/{path}', **headers), path)
+
+    def test_full_response_streams_file_with_cache_headers(self):
+        response = self._get('books/cover.jpg')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        self.assertEqual(response['Content-Length'], str(len(self.payload)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+    def test_content_hashed_derivatives_are_immutable(self):
+        response = self._get(HASHED_NAME)
+
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+    def test_range_request_returns_partial_content(self):
+        response = self._get('books/cover.jpg', HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.payload[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.payload)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        suffix = self._get('books/cover.jpg', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(suffix.streaming_content), self.payload[-4:])
+
+    def test_unsatisfiable_range_and_stale_if_range(self):
+        response = self._get('books/cover.jpg', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.payload)}')
+
+        response = self._get('books/cover.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=http_date(self.mtime - 60))
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_returns_not_modified(self):
+        response = self._get('books/cover.jpg', HTTP_IF_MODIFIED_SINCE=http_date(self.mtime + 1))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'], http_date(self.mtime))
+
+    def test_sendfile_backends_offload_transfer(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response = self._get('books/cover.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/books/cover.jpg')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-sendfile'):
+            response = self._get(HASHED_NAME)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self._media_dir.name, HASHED_NAME))
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+    def test_path_traversal_and_missing_files_are_404(self):
+        from django.http import Http404
+
+        for path in ('../settings.py', 'books/missing.jpg', 'books'):
+            with self.assertRaises(Http404):
+                self._get(path)
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=0-500', 100), (0, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=100-', 100)
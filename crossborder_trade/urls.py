@@ -17,11 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include ,re_path
 
+import re
+
 # media配置路由
 from django.conf import settings
-from django.views.static import serve
 from django.conf.urls.static import static
 
+from crossborder_trade.media import serve_media
+
 from userapp.views import CustomTokenObtainPairView  # 新增导入
 
 urlpatterns = [
@@ -40,7 +43,7 @@ urlpatterns = [
 
 ]
 # + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT))
-if settings.DEBUG:
+if settings.MEDIA_SERVE_ENABLED:
     urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
     ]
@@ -2,13 +2,14 @@ from __future__ import annotations
 
 import logging
 import uuid
-from typing import Any, Mapping
+from typing import Any, Mapping, Sequence
 
 from django.conf import settings
 from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from .models import OutboxEvent, OutboxState
+from .subscribers import notify as notify_subscribers
 
 logger = logging.getLogger(__name__)
 
@@ -35,7 +36,7 @@ def _resolve_dispatch_batch_size() -> int:
     return getattr(settings, "OUTBOX_DISPATCH_BATCH_SIZE", 50)
 
 
-def enqueue_outbox_event(
+def build_outbox_event(
     *,
     topic: str,
     aggregate_type: str,
@@ -47,8 +48,8 @@ def enqueue_outbox_event(
     correlation_id: str | None = None,
     message_key: str | None = None,
     max_attempts: int | None = None,
-    schedule_dispatch: bool = True,
 ) -> OutboxEvent:
+    """Unsaved pending event; see :func:`enqueue_outbox_event` and :func:`create_outbox_events`."""
     if not topic:
         raise ValueError("topic is required")
     if not aggregate_type:
@@ -67,34 +68,64 @@ def enqueue_outbox_event(
     idempotency_key = idempotency_key or uuid.uuid4().hex
     message_key = message_key or idempotency_key
 
-    event_data = {
-        "topic": topic,
-        "aggregate_type": aggregate_type,
-        "aggregate_id": str(aggregate_id),
-        "event_type": event_type,
-        "payload": effective_payload,
-        "headers": headers_payload,
-        "state": OutboxState.PENDING,
-        "next_attempt_at": timezone.now(),
-        "attempt_count": 0,
-        "last_attempt_at": None,
-        "dispatched_at": None,
-        "correlation_id": correlation_id,
-        "idempotency_key": idempotency_key,
-        "message_key": message_key,
-        "max_attempts": _resolve_max_attempts(max_attempts),
-        "error_type": "",
-        "error_message": "",
-        "dead_lettered_at": None,
-        "dead_letter_reason": "",
-    }
+    return OutboxEvent(
+        topic=topic,
+        aggregate_type=aggregate_type,
+        aggregate_id=str(aggregate_id),
+        event_type=event_type,
+        payload=effective_payload,
+        headers=headers_payload,
+        state=OutboxState.PENDING,
+        next_attempt_at=timezone.now(),
+        attempt_count=0,
+        last_attempt_at=None,
+        dispatched_at=None,
+        correlation_id=correlation_id,
+        idempotency_key=idempotency_key,
+        message_key=message_key,
+        max_attempts=_resolve_max_attempts(max_attempts),
+        error_type="",
+        error_message="",
+        dead_lettered_at=None,
+        dead_letter_reason="",
+    )
+
+
+def enqueue_outbox_event(
+    *,
+    topic: str,
+    aggregate_type: str,
+    aggregate_id: str,
+    event_type: str,
+    payload: Mapping[str, Any] | None = None,
+    headers: Mapping[str, Any] | None = None,
+    idempotency_key: str | None = None,
+    correlation_id: str | None = None,
+    message_key: str | None = None,
+    max_attempts: int | None = None,
+    schedule_dispatch: bool = True,
+) -> OutboxEvent:
+    new_event = build_outbox_event(
+        topic=topic,
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        event_type=event_type,
+        payload=payload,
+        headers=headers,
+        idempotency_key=idempotency_key,
+        correlation_id=correlation_id,
+        message_key=message_key,
+        max_attempts=max_attempts,
+    )
+    idempotency_key = new_event.idempotency_key
 
     try:
         event = OutboxEvent.objects.get(idempotency_key=idempotency_key)
         created = False
     except OutboxEvent.DoesNotExist:
         try:
-            event = OutboxEvent.objects.create(**event_data)
+            new_event.save(force_insert=True)
+            event = new_event
         except IntegrityError:
             event = OutboxEvent.objects.get(idempotency_key=idempotency_key)
             created = False
@@ -105,6 +136,7 @@ def enqueue_outbox_event(
         logger.debug(
             "Created outbox event %s for %s:%s", event.id, aggregate_type, aggregate_id
         )
+        notify_subscribers(event)
     else:
         logger.debug(
             "Outbox event %s already exists; duplicate enqueue ignored", event.id
@@ -116,6 +148,27 @@ def enqueue_outbox_event(
     return event
 
 
+def create_outbox_events(events: Sequence[OutboxEvent], *, schedule_dispatch: bool = True) -> list[OutboxEvent]:
+    """Insert new events from :func:`build_outbox_event` with one ``bulk_create``.
+
+    Unlike :func:`enqueue_outbox_event` there is no lookup of the
+    idempotency key first. Use it only for keys that cannot exist yet, for
+    example keys derived from a row created in the same transaction. A
+    duplicate raises ``IntegrityError``.
+    """
+    if not events:
+        return []
+    created = OutboxEvent.objects.bulk_create(events)
+    for event in created:
+        logger.debug(
+            "Created outbox event %s for %s:%s", event.id, event.aggregate_type, event.aggregate_id
+        )
+        notify_subscribers(event)
+    if schedule_dispatch:
+        _schedule_dispatch()
+    return created
+
+
 def _schedule_dispatch() -> None:
     def _enqueue_task() -> None:
         try:
@@ -149,6 +202,31 @@ def build_order_payload(order, *, extra: Mapping[str, Any] | None = None) -> dic
     return base_payload
 
 
+def build_order_event(
+    order,
+    *,
+    event_type: str,
+    payload: Mapping[str, Any] | None = None,
+    headers: Mapping[str, Any] | None = None,
+    idempotency_key: str | None = None,
+    correlation_id: str | None = None,
+) -> OutboxEvent:
+    """Unsaved order event for :func:`create_outbox_events`."""
+    if idempotency_key is None:
+        idempotency_key = f"order:{order.pk}:{event_type}"
+    return build_outbox_event(
+        topic=settings.KAFKA_TOPICS.get("orders", "order-events"),
+        aggregate_type="order",
+        aggregate_id=str(order.pk),
+        event_type=event_type,
+        payload=build_order_payload(order, extra=payload),
+        headers=headers,
+        idempotency_key=idempotency_key,
+        correlation_id=correlation_id,
+        message_key=idempotency_key,
+    )
+
+
 def enqueue_order_event(
     order,
     *,
@@ -0,0 +1,62 @@
+"""In-process subscribers for outbox events.
+
+Apps register handlers for an event type in ``AppConfig.ready``. When
+:func:`eventstream.outbox.enqueue_outbox_event` creates a new event, the matching
+handlers run after the surrounding transaction commits, so they never observe
+rolled-back orders. Handlers should stay cheap (typically enqueue a Celery
+task). Exceptions are logged and never reach the writer.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from typing import Callable
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[["OutboxEvent"], None]  # noqa: F821 - avoid importing models here
+
+_handlers: dict[str, list[Handler]] = defaultdict(list)
+
+
+def subscribe(event_type: str, handler: Handler) -> None:
+    handlers = _handlers[event_type]
+    if handler not in handlers:
+        handlers.append(handler)
+
+
+def unsubscribe(event_type: str, handler: Handler) -> None:
+    handlers = _handlers.get(event_type, [])
+    if handler in handlers:
+        handlers.remove(handler)
+
+
+def handlers_for(event_type: str) -> list[Handler]:
+    return list(_handlers.get(event_type, ()))
+
+
+def _run(event, handlers: list[Handler]) -> None:
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception:
+            logger.exception(
+                "Subscriber %r failed for outbox event %s (%s)",
+                handler, event.pk, event.event_type,
+            )
+
+
+def notify(event) -> None:
+    """Run the handlers subscribed to ``event.event_type`` once the transaction commits."""
+    handlers = handlers_for(event.event_type)
+    if not handlers:
+        return
+    try:
+        transaction.on_commit(lambda: _run(event, handlers))
+    except Exception:  # TransactionManagementError when outside atomic
+        _run(event, handlers)
+
+
+__all__ = ["handlers_for", "notify", "subscribe", "unsubscribe"]
@@ -9,6 +9,7 @@ from django.utils import timezone
 from .dispatcher import OutboxDispatcher
 from .models import OutboxEvent, OutboxState
 from .outbox import enqueue_outbox_event
+from .subscribers import subscribe, unsubscribe
 
 
 class DummyFuture:
@@ -61,6 +62,27 @@ class OutboxEnqueueTests(TestCase):
         self.assertEqual(event1.id, event2.id)
         self.assertEqual(OutboxEvent.objects.count(), 1)
 
+    def test_subscribers_run_after_commit_for_new_events_only(self):
+        received = []
+        handler = received.append
+        subscribe('test.subscribed', handler)
+        self.addCleanup(unsubscribe, 'test.subscribed', handler)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for _ in range(2):
+                enqueue_outbox_event(
+                    topic='order-events',
+                    aggregate_type='order',
+                    aggregate_id='1',
+                    event_type='test.subscribed',
+                    idempotency_key='subscribed-event',
+                    schedule_dispatch=False,
+                )
+            self.assertEqual(received, [])
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual([event.idempotency_key for event in received], ['subscribed-event'])
+
 
 class OutboxDispatcherTests(TestCase):
     def setUp(self):  # type: ignore[override]
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class GoodsappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'goodsapp'
+
+    def ready(self):
+        from eventstream.subscribers import subscribe
+        from goodsapp import counters, leaderboard, recommendations
+
+        subscribe('order.created', recommendations.on_order_created)
+        subscribe('order.created', leaderboard.on_order_created)
+        subscribe('order.created', counters.on_order_created)
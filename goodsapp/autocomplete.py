@@ -0,0 +1,438 @@
+"""Prefix index backing the goods type-ahead suggestions.
+
+Every supported language gets a sorted array of ``(key, goods)`` entries. The
+arrays are written to a single snapshot file which each worker maps read-only,
+so the four uwsgi processes share one copy through the page cache instead of
+holding their own. Lookups binary-search the fixed-width entry table for the
+prefix range and rank the hits by sales.
+
+Snapshot layout (little endian)::
+
+    header      magic(4s) format(H) lang_count(H)
+    lang table  lang(8s) entry_count(I) entries_offset(Q)    * lang_count
+    entries     key_offset(I) name_offset(I) goods_id(I) sales(i)
+    blob        length(H) utf-8 bytes                        * n
+
+Entries of a language are sorted by the UTF-8 bytes of their key, which keeps
+the byte order identical to the code point order of the normalised names.
+
+Goods writes do not rewrite the whole snapshot. :func:`update_index` keeps the
+entries of changed goods in a small delta snapshot next to it (same layout,
+``<path>.delta``), whose reserved ``*`` table lists every goods id the delta
+covers, deleted goods included. Readers search the base without the covered
+goods, then merge in the delta's hits. Once the delta covers more than
+``AUTOCOMPLETE_DELTA_MAX_GOODS`` goods it is folded into the base and removed.
+
+A replaced snapshot is never unmapped explicitly, since other threads may still
+be reading it. The mapping is released when its last reference goes away.
+A missing snapshot is not built inside a request: :func:`suggest` returns no
+suggestions and enqueues a rebuild.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SUPPORTED_LANGUAGES, Goods
+
+try:  # pragma: no cover - fcntl is unavailable on Windows development boxes
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'GACX'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHH')
+_LANG = struct.Struct('<8sIQ')
+_ENTRY = struct.Struct('<IIIi')
+_LENGTH = struct.Struct('<H')
+
+_INDEX_FIELDS = ('id', 'gname', 'name_i18n', 'sales')
+_COVERED = '*'  # 增量快照中列出其覆盖的全部商品 ID 的保留“语言”
+_REBUILD_SCHEDULED_KEY = 'goodsapp:autocomplete:rebuild-scheduled'
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    key: str
+    name: str
+    goods_id: int
+    sales: int
+
+
+def normalize(text: str) -> str:
+    return ' '.join(str(text or '').casefold().split())
+
+
+def _entry_keys(name: str) -> list[str]:
+    """Index the whole name plus every word start, so "pho" finds "Smart Phone"."""
+    normalized = normalize(name)
+    if not normalized:
+        return []
+    words = normalized.split(' ')
+    keys = [' '.join(words[position:]) for position in range(len(words))]
+    return list(dict.fromkeys(keys))
+
+
+def entries_for_goods(goods: Goods) -> dict[str, list[IndexEntry]]:
+    entries: dict[str, list[IndexEntry]] = {}
+    for lang in SUPPORTED_LANGUAGES:
+        name = goods.get_gname(lang)
+        entries[lang] = [
+            IndexEntry(key=key, name=name, goods_id=goods.id, sales=goods.sales or 0)
+            for key in _entry_keys(name)
+        ]
+    return entries
+
+
+def _snapshot_path() -> str:
+    return str(getattr(settings, 'AUTOCOMPLETE_SNAPSHOT_PATH'))
+
+
+def _delta_path(path: str) -> str:
+    return f'{path}.delta'
+
+
+def _delta_max_goods() -> int:
+    return getattr(settings, 'AUTOCOMPLETE_DELTA_MAX_GOODS', 1000)
+
+
+def write_snapshot(entries_by_lang: dict[str, Iterable[IndexEntry]], path: str | None = None) -> str:
+    """Write a snapshot atomically; mapped readers keep the previous inode."""
+    path = path or _snapshot_path()
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    blob = bytearray()
+    string_offsets: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        offset = string_offsets.get(value)
+        if offset is None:
+            # 长度字段只有 16 位：超长字符串按字符边界截断，不切开多字节的中文字符
+            encoded = value.encode('utf-8')[:0xFFFF].decode('utf-8', 'ignore').encode('utf-8')
+            offset = len(blob)
+            blob.extend(_LENGTH.pack(len(encoded)))
+            blob.extend(encoded)
+            string_offsets[value] = offset
+        return offset
+
+    langs = list(entries_by_lang)
+    tables = []
+    for lang in langs:
+        entries = sorted(entries_by_lang[lang], key=lambda entry: (entry.key.encode('utf-8'), -entry.sales))
+        table = bytearray()
+        for entry in entries:
+            table.extend(_ENTRY.pack(intern(entry.key), intern(entry.name), entry.goods_id, entry.sales))
+        tables.append((lang, len(entries), table))
+
+    offset = _HEADER.size + _LANG.size * len(langs)
+    lang_table = bytearray()
+    for lang, count, table in tables:
+        lang_table.extend(_LANG.pack(lang.encode('ascii')[:8], count, offset))
+        offset += len(table)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.autocomplete-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, len(langs)))
+            handle.write(lang_table)
+            for _lang, _count, table in tables:
+                handle.write(table)
+            handle.write(blob)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    logger.debug('Wrote autocomplete snapshot %s', path)
+    return path
+
+
+class PrefixIndexSnapshot:
+    """Read-only view over a mapped snapshot file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, lang_count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f'Unsupported autocomplete snapshot: {path}')
+
+        self._langs: dict[str, tuple[int, int]] = {}
+        blob_offset = _HEADER.size + _LANG.size * lang_count
+        for position in range(lang_count):
+            raw_lang, count, entries_offset = _LANG.unpack_from(self._map, _HEADER.size + _LANG.size * position)
+            self._langs[raw_lang.rstrip(b'\x00').decode('ascii')] = (count, entries_offset)
+            blob_offset = max(blob_offset, entries_offset + count * _ENTRY.size)
+        self._blob_offset = blob_offset
+
+    def close(self) -> None:
+        self._map.close()
+
+    def covered_ids(self) -> frozenset[int]:
+        count, entries_offset = self._langs.get(_COVERED, (0, 0))
+        return frozenset(
+            _ENTRY.unpack_from(self._map, entries_offset + position * _ENTRY.size)[2] for position in range(count)
+        )
+
+    def _string(self, offset: int) -> bytes:
+        start = self._blob_offset + offset
+        (length,) = _LENGTH.unpack_from(self._map, start)
+        return self._map[start + _LENGTH.size:start + _LENGTH.size + length]
+
+    def _key_at(self, entries_offset: int, position: int) -> bytes:
+        key_offset = _ENTRY.unpack_from(self._map, entries_offset + position * _ENTRY.size)[0]
+        return self._string(key_offset)
+
+    def _bisect(self, entries_offset: int, count: int, target: bytes) -> int:
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(entries_offset, middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, prefix: str, lang: str, limit: int = 10, exclude: frozenset[int] = frozenset()) -> list[dict]:
+        if lang not in self._langs:
+            return []
+        needle = normalize(prefix).encode('utf-8')
+        if not needle or limit <= 0:
+            return []
+        count, entries_offset = self._langs[lang]
+        start = self._bisect(entries_offset, count, needle)
+        # 0xff never occurs in UTF-8, so it bounds every key sharing the prefix.
+        stop = self._bisect(entries_offset, count, needle + b'\xff')
+        if start >= stop:
+            return []
+
+        window = memoryview(self._map)[entries_offset + start * _ENTRY.size:entries_offset + stop * _ENTRY.size]
+        try:
+            best: dict[int, tuple[int, int]] = {}
+            for _key_offset, name_offset, goods_id, sales in _ENTRY.iter_unpack(window):
+                if goods_id not in best and goods_id not in exclude:
+                    best[goods_id] = (sales, name_offset)
+        finally:
+            window.release()
+
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: (-item[1][0], item[0]))
+        return [
+            {'id': goods_id, 'name': self._string(name_offset).decode('utf-8'), 'sales': sales}
+            for goods_id, (sales, name_offset) in ranked
+        ]
+
+    def iter_entries(self) -> Iterator[tuple[str, IndexEntry]]:
+        for lang, (count, entries_offset) in self._langs.items():
+            if lang == _COVERED:
+                continue
+            for position in range(count):
+                key_offset, name_offset, goods_id, sales = _ENTRY.unpack_from(
+                    self._map, entries_offset + position * _ENTRY.size
+                )
+                yield lang, IndexEntry(
+                    key=self._string(key_offset).decode('utf-8'),
+                    name=self._string(name_offset).decode('utf-8'),
+                    goods_id=goods_id,
+                    sales=sales,
+                )
+
+
+class LayeredIndex:
+    """The base snapshot with the delta snapshot of recently changed goods on top."""
+
+    def __init__(self, path: str, base: PrefixIndexSnapshot, delta: PrefixIndexSnapshot | None) -> None:
+        self.path = path
+        self.base = base
+        self.delta = delta
+        self.covered = delta.covered_ids() if delta is not None else frozenset()
+        self.identity = (base.identity, delta.identity if delta is not None else None)
+
+    def search(self, prefix: str, lang: str, limit: int = 10) -> list[dict]:
+        hits = self.base.search(prefix, lang, limit, exclude=self.covered)
+        if self.delta is None:
+            return hits
+        hits += self.delta.search(prefix, lang, limit)
+        return heapq.nsmallest(limit, hits, key=lambda hit: (-hit['sales'], hit['id']))
+
+
+def _file_identity(path: str) -> tuple[int, int, int] | None:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _open_delta(path: str) -> PrefixIndexSnapshot | None:
+    try:
+        return PrefixIndexSnapshot(_delta_path(path))
+    except FileNotFoundError:
+        return None
+
+
+_reader: LayeredIndex | None = None
+_reader_lock = threading.Lock()
+
+
+def get_snapshot() -> LayeredIndex | None:
+    """Return the mapped index, remapping when a writer replaced either file."""
+    global _reader
+    path = _snapshot_path()
+    identity = (_file_identity(path), _file_identity(_delta_path(path)))
+    if identity[0] is None:
+        return None
+    current = _reader
+    if current is not None and current.path == path and current.identity == identity:
+        return current
+    with _reader_lock:
+        if _reader is None or _reader.path != path or _reader.identity != identity:
+            try:
+                base = PrefixIndexSnapshot(path)
+            except FileNotFoundError:
+                return None
+            # 旧映射不主动关闭：其他线程可能仍在读取，最后一个引用释放时自动解除映射
+            _reader = LayeredIndex(path, base, _open_delta(path))
+        return _reader
+
+
+@contextmanager
+def _writer_lock(path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f'{path}.lock', 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _remove_delta(path: str) -> None:
+    try:
+        os.unlink(_delta_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def rebuild_index() -> int:
+    """Rebuild the whole snapshot from the goods table."""
+    path = _snapshot_path()
+    entries_by_lang: dict[str, list[IndexEntry]] = {lang: [] for lang in SUPPORTED_LANGUAGES}
+    total = 0
+    with _writer_lock(path):
+        for goods in Goods.objects.only(*_INDEX_FIELDS).iterator(chunk_size=2000):
+            for lang, entries in entries_for_goods(goods).items():
+                entries_by_lang[lang].extend(entries)
+            total += 1
+        write_snapshot(entries_by_lang, path)
+        _remove_delta(path)
+    logger.info('Rebuilt autocomplete snapshot with %s goods', total)
+    return total
+
+
+def update_index(goods_ids: Iterable[int]) -> int:
+    """Patch the index for the given goods only; deleted goods drop out.
+
+    Rewrites the delta snapshot, whose size depends on the goods changed since
+    the last compaction, not on the catalog size.
+    """
+    changed = {int(goods_id) for goods_id in goods_ids}
+    if not changed:
+        return 0
+    path = _snapshot_path()
+    if not os.path.exists(path):
+        return rebuild_index()
+
+    with _writer_lock(path):
+        delta = _open_delta(path)
+        covered = set(changed)
+        entries_by_lang: dict[str, list[IndexEntry]] = {lang: [] for lang in SUPPORTED_LANGUAGES}
+        if delta is not None:
+            try:
+                covered |= delta.covered_ids()
+                for lang, entry in delta.iter_entries():
+                    if entry.goods_id not in changed:
+                        entries_by_lang.setdefault(lang, []).append(entry)
+            finally:
+                delta.close()
+        for goods in Goods.objects.filter(id__in=changed).only(*_INDEX_FIELDS):
+            for lang, entries in entries_for_goods(goods).items():
+                entries_by_lang[lang].extend(entries)
+
+        if len(covered) > _delta_max_goods():
+            # 增量过大：并入基础快照后删除增量文件
+            base = PrefixIndexSnapshot(path)
+            try:
+                for lang, entry in base.iter_entries():
+                    if entry.goods_id not in covered:
+                        entries_by_lang.setdefault(lang, []).append(entry)
+            finally:
+                base.close()
+            write_snapshot(entries_by_lang, path)
+            _remove_delta(path)
+        else:
+            entries_by_lang[_COVERED] = [IndexEntry('', '', goods_id, 0) for goods_id in sorted(covered)]
+            write_snapshot(entries_by_lang, _delta_path(path))
+    return len(changed)
+
+
+def schedule_rebuild() -> None:
+    """Enqueue a full rebuild unless one was enqueued in the last minute."""
+    if not cache.add(_REBUILD_SCHEDULED_KEY, 1, 60):
+        return
+    try:
+        from .tasks import refresh_autocomplete_index
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning('refresh_autocomplete_index task unavailable: %s', exc)
+        return
+
+    try:
+        refresh_autocomplete_index.delay()
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        cache.delete(_REBUILD_SCHEDULED_KEY)
+        logger.warning('Failed to enqueue autocomplete rebuild: %s', exc)
+
+
+def suggest(prefix: str, lang: str = 'zh', limit: int | None = None) -> list[dict]:
+    limit = limit or getattr(settings, 'AUTOCOMPLETE_MAX_RESULTS', 10)
+    snapshot = get_snapshot()
+    if snapshot is None:
+        # 快照尚未生成：不在请求内全量构建，交给任务
+        schedule_rebuild()
+        return []
+    return snapshot.search(prefix, lang, limit)
+
+
+__all__ = [
+    'IndexEntry',
+    'LayeredIndex',
+    'PrefixIndexSnapshot',
+    'get_snapshot',
+    'rebuild_index',
+    'schedule_rebuild',
+    'suggest',
+    'update_index',
+    'write_snapshot',
+]
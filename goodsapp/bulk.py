@@ -0,0 +1,150 @@
+"""Bulk price and stock updates.
+
+Rows of ``{id, price?, stock?}`` are applied in chunks. Each chunk takes one
+transaction: one select of the touched goods, one ``bulk_update`` per set of
+provided fields, one projection upsert, one :func:`changes.goods_changed`
+call (catalog version, facets, autocomplete) and one outbox event that lists
+every change of the chunk with its previous value.
+"""
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from eventstream.outbox import enqueue_outbox_event
+
+from . import changes, projections, stock
+from .models import CatalogSequence, Goods
+
+UPDATABLE_FIELDS = ('price', 'stock')
+_MAX_REPORTED_ERRORS = 50
+
+
+def chunk_size() -> int:
+    return getattr(settings, 'GOODS_BULK_UPDATE_CHUNK_SIZE', 500)
+
+
+@dataclass
+class BulkUpdateResult:
+    batch_id: str
+    rows: int = 0
+    updated: int = 0
+    chunks: int = 0
+    invalid: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < _MAX_REPORTED_ERRORS:
+            self.errors.append(f'row {line}: {message}')
+
+
+def _clean(row: Any) -> tuple[int, dict[str, Any]]:
+    if isinstance(row, Exception):
+        raise ValidationError(str(row))
+    if not isinstance(row, dict):
+        raise ValidationError('expected an object')
+    try:
+        goods_id = int(row['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('id is required') from None
+    values = {}
+    for name in UPDATABLE_FIELDS:
+        if row.get(name) not in (None, ''):
+            values[name] = Goods._meta.get_field(name).clean(row[name], None)
+    if values.get('stock', 0) < 0:
+        raise ValidationError('stock must not be negative')
+    if not values:
+        raise ValidationError('nothing to update (price or stock)')
+    return goods_id, values
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def apply_updates(rows: Iterable[tuple[int, Any]], *, batch_id: str | None = None, source: str = 'api',
+                  size: int | None = None) -> BulkUpdateResult:
+    """Apply ``(row number, row)`` pairs; invalid rows are reported and skipped."""
+    result = BulkUpdateResult(batch_id=batch_id or uuid.uuid4().hex)
+    for chunk in _chunks(rows, size or chunk_size()):
+        result.rows += len(chunk)
+        wanted: dict[int, dict[str, Any]] = {}
+        lines: dict[int, int] = {}
+        for line, row in chunk:
+            try:
+                goods_id, values = _clean(row)
+            except ValidationError as exc:
+                result.add_error(line, '; '.join(exc.messages))
+                continue
+            wanted.setdefault(goods_id, {}).update(values)
+            lines[goods_id] = line
+        if wanted:
+            result.chunks += 1
+            with transaction.atomic():
+                result.updated += _apply_chunk(wanted, lines, result, source)
+    return result
+
+
+def _apply_chunk(wanted: dict[int, dict[str, Any]], lines: dict[int, int], result: BulkUpdateResult,
+                 source: str) -> int:
+    goods_by_id = {goods.id: goods for goods in Goods.objects.filter(id__in=list(wanted))}
+    groups: dict[tuple[str, ...], list[Goods]] = {}
+    events = []
+    for goods_id in sorted(wanted):
+        goods = goods_by_id.get(goods_id)
+        if goods is None:
+            result.add_error(lines[goods_id], f'goods {goods_id} not found')
+            continue
+        change = {'goods_id': goods_id}
+        for name, value in wanted[goods_id].items():
+            change[f'previous_{name}'] = _jsonable(getattr(goods, name))
+            change[name] = _jsonable(value)
+            setattr(goods, name, value)
+        # 只写提供的列：只改价格的行不会用读到的旧库存覆盖并发扣减
+        groups.setdefault(tuple(sorted(wanted[goods_id])), []).append(goods)
+        events.append(change)
+    if not events:
+        return 0
+
+    # 改价的商品逐个分配 catalog_version（增量同步）；只改库存不分配
+    priced = [goods for fields, goods_list in groups.items() if 'price' in fields for goods in goods_list]
+    if priced:
+        last = CatalogSequence.allocate(len(priced))
+        for version, goods in enumerate(priced, start=last - len(priced) + 1):
+            goods.catalog_version = version
+    for fields, goods_list in groups.items():
+        Goods.objects.bulk_update(goods_list, [*fields, 'catalog_version'] if 'price' in fields else list(fields))
+    updated = [goods for goods_list in groups.values() for goods in goods_list]
+    for goods in updated:
+        if goods.stock_shard_count and 'stock' in wanted[goods.id]:  # 分片库存按新总量重新拆分
+            stock.set_total(goods.id, goods.stock)
+    if priced:
+        projections.sync_goods(priced)
+    changes.goods_changed([goods.id for goods in updated], category_ids={goods.category_id for goods in updated})
+
+    enqueue_outbox_event(
+        topic=settings.KAFKA_TOPICS.get('catalog', 'catalog-events'),
+        aggregate_type='goods',
+        aggregate_id=f'bulk:{result.batch_id}',
+        event_type='goods.bulk_updated',
+        payload={'batch_id': result.batch_id, 'chunk': result.chunks, 'items': events},
+        headers={'source': source},
+        idempotency_key=f'goods:bulk:{result.batch_id}:{result.chunks}',
+    )
+    return len(updated)
+
+
+def _jsonable(value):
+    return str(value) if value is not None and not isinstance(value, (int, float, str, bool)) else value
+
+
+__all__ = ['BulkUpdateResult', 'UPDATABLE_FIELDS', 'apply_updates', 'chunk_size']
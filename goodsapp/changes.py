@@ -0,0 +1,145 @@
+"""Propagate goods writes to the read structures derived from the catalog.
+
+Model signals call :func:`goods_changed` for single-row writes; bulk write
+paths that bypass signals call it themselves once per batch.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Callable, Iterable
+
+from django.db import transaction
+
+from crossborder_trade.cache_utils import bump_version, get_version
+
+from . import detail_cache, facets, homepage, projections
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = "goodsapp:catalog:version"
+
+
+def get_catalog_version() -> int:
+    """Version stamp bumped after every committed goods write."""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> int:
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def _on_commit(callback: Callable[[], None]) -> None:
+    try:
+        transaction.on_commit(callback)
+    except Exception:  # TransactionManagementError when outside atomic
+        callback()
+
+
+def _schedule_autocomplete_refresh(goods_ids: list[int]) -> None:
+    try:
+        from .tasks import refresh_autocomplete_index
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning("refresh_autocomplete_index task unavailable: %s", exc)
+        return
+
+    try:
+        refresh_autocomplete_index.delay(goods_ids=goods_ids)
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        logger.warning("Failed to enqueue autocomplete refresh: %s", exc)
+
+
+def _schedule_image_derivatives(detail_id: int) -> None:
+    try:
+        from .tasks import generate_image_derivatives
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning("generate_image_derivatives task unavailable: %s", exc)
+        return
+
+    try:
+        generate_image_derivatives.delay(detail_id)
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        logger.warning("Failed to enqueue image derivatives for detail %s: %s", detail_id, exc)
+
+
+def goods_changed(goods_ids: Iterable[int | None], *, category_ids: Iterable[int | None] | None = None) -> None:
+    """Bulk entry point: derived structures that need row values are invalidated."""
+    ids = sorted({int(goods_id) for goods_id in goods_ids if goods_id is not None})
+    if not ids:
+        return
+    # 先递增版本号再失效分面：正在重建的分面索引据此放弃回填
+    _on_commit(bump_catalog_version)
+    if category_ids is not None:
+        _on_commit(lambda categories=set(category_ids): facets.invalidate(categories))
+    _on_commit(homepage.schedule_rebuild)
+    _on_commit(lambda: detail_cache.invalidate(ids))
+    _on_commit(lambda: _schedule_autocomplete_refresh(ids))
+
+
+def goods_saved(goods, *, update_fields: Iterable[str] | None = None) -> None:
+    if projections.touches_projection(update_fields):
+        # 读模型与商品写入在同一事务中更新
+        projections.sync_goods([goods])
+    goods_id = goods.pk
+    category_id = goods.category_id
+    previous_category_id = getattr(goods, "_loaded_category_id", None)
+    goods._loaded_category_id = category_id
+    goods_changed([goods_id])  # 版本号先于分面补丁递增，见 goods_changed
+    row = goods.__dict__
+    if all(name in row for name in ("brand", "price", "is_hot", "is_new")):
+        values = facets.facet_values(row)
+        _on_commit(
+            lambda: facets.apply_change(
+                goods_id,
+                values=values,
+                category_id=category_id,
+                previous_category_id=previous_category_id,
+            )
+        )
+    else:  # deferred fields: we cannot rebuild the facet row without a query
+        _on_commit(lambda: facets.invalidate([category_id, previous_category_id]))
+
+
+def goods_detail_saved(detail, *, update_fields: Iterable[str] | None = None) -> None:
+    projections.refresh_main_image(detail.goods_id)
+    goods_id = detail.goods_id
+    # 主图出现在目录快照（列表、首页、导出）中，随版本号一起失效
+    _on_commit(bump_catalog_version)
+    _on_commit(lambda: detail_cache.invalidate([goods_id]))
+    if detail.gdurl and (update_fields is None or "gdurl" in update_fields):
+        detail_id = detail.pk
+        # 缩略图在 media 队列中生成，不阻塞上传请求
+        _on_commit(lambda: _schedule_image_derivatives(detail_id))
+
+
+def goods_detail_deleted(detail) -> None:
+    projections.refresh_main_image(detail.goods_id)
+    goods_id = detail.goods_id
+    # 主图出现在目录快照（列表、首页、导出）中，随版本号一起失效
+    _on_commit(bump_catalog_version)
+    _on_commit(lambda: detail_cache.invalidate([goods_id]))
+
+
+def category_changed() -> None:
+    """Category writes: names appear on the homepage and in category listings."""
+    _on_commit(bump_catalog_version)
+    _on_commit(homepage.schedule_rebuild)
+
+
+def goods_deleted(goods) -> None:
+    goods_id = goods.pk
+    category_id = goods.category_id
+    goods_changed([goods_id])
+    _on_commit(lambda: facets.apply_change(goods_id, values=None, category_id=category_id))
+
+
+__all__ = [
+    "CATALOG_VERSION_KEY",
+    "bump_catalog_version",
+    "category_changed",
+    "get_catalog_version",
+    "goods_changed",
+    "goods_deleted",
+    "goods_detail_deleted",
+    "goods_detail_saved",
+    "goods_saved",
+]
@@ -0,0 +1,203 @@
+"""Write-behind counters for ``Goods.sales`` and ``Goods.views``.
+
+Increments are buffered in the current process and written back by a single
+``UPDATE goods SET sales = sales + CASE ..., views = views + CASE ... WHERE id
+IN (...)``. Popular goods therefore take one row lock per flush interval
+instead of one per order line or page view. Every process (uwsgi worker or
+Celery worker) keeps its own buffer. ``F()`` updates are additive, so the
+buffers need no coordination.
+
+The first increment in a process starts a daemon thread that flushes the
+buffer every ``COUNTER_FLUSH_INTERVAL_SECONDS``, so requests and order
+subscribers never wait for the write-back. A beat task could not do this:
+it would only see the buffer of the Celery process it runs in. uwsgi runs
+Python threads only with ``enable-threads`` (set in
+``shell/five_class_demo_uwsgi.ini``). The buffer is also flushed at interpreter exit, uwsgi worker shutdown and Celery worker
+process shutdown. Only a hard kill loses the deltas of the last interval.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Mapping
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Goods
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('sales', 'views')
+
+_buffer: dict[int, dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_flusher_pid = None
+
+
+def _flush_interval() -> float:
+    return getattr(settings, 'COUNTER_FLUSH_INTERVAL_SECONDS', 5)
+
+
+def _buffering_enabled() -> bool:
+    return getattr(settings, 'COUNTER_BUFFER_ENABLED', True)
+
+
+def increment(goods_id: int, field: str, delta: int = 1) -> None:
+    increment_many({goods_id: delta}, field)
+
+
+def increment_many(deltas: Mapping[int, int], field: str) -> None:
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f'Unsupported counter: {field}')
+    with _lock:
+        for goods_id, delta in deltas.items():
+            if delta:
+                _buffer[int(goods_id)][field] += int(delta)
+    if not _buffering_enabled():
+        flush()
+        return
+    _ensure_flusher()
+
+
+def pending() -> dict[int, dict[str, int]]:
+    with _lock:
+        return {goods_id: dict(values) for goods_id, values in _buffer.items()}
+
+
+def _drain() -> dict[int, dict[str, int]]:
+    global _buffer, _last_flush
+    with _lock:
+        drained, _buffer = _buffer, defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+        _last_flush = time.monotonic()
+        return drained
+
+
+def _restore(deltas: Mapping[int, Mapping[str, int]]) -> None:
+    with _lock:
+        for goods_id, values in deltas.items():
+            for field, delta in values.items():
+                _buffer[goods_id][field] += delta
+
+
+def flush() -> int:
+    """Write buffered deltas back; returns the number of goods updated."""
+    drained = {goods_id: values for goods_id, values in _drain().items() if any(values.values())}
+    if not drained:
+        return 0
+    # 一条 UPDATE 写回全部商品：每个字段按商品 id 取各自的增量
+    changes = {}
+    for field in COUNTER_FIELDS:
+        whens = [When(pk=goods_id, then=Value(values[field])) for goods_id, values in drained.items() if values[field]]
+        if whens:
+            changes[field] = F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+    try:
+        return Goods.objects.filter(pk__in=sorted(drained)).update(**changes)
+    except DatabaseError:
+        logger.exception('Counter flush failed; keeping %s goods buffered', len(drained))
+        _restore(drained)
+        return 0
+
+
+def _tick() -> None:
+    """One timer flush on the flusher thread's own database connection."""
+    with _lock:
+        if not _buffer:
+            return
+    close_old_connections()
+    try:
+        flush()
+    except Exception:  # 线程不能因一次异常退出，否则此后再也不会写回
+        logger.exception('Timed counter flush failed')
+    finally:
+        close_old_connections()
+
+
+def _run_flusher() -> None:
+    while True:
+        # 每秒检查一次，修改后的刷写间隔最多一秒后生效
+        time.sleep(min(_flush_interval(), 1.0))
+        if time.monotonic() - _last_flush >= _flush_interval():
+            _tick()
+
+
+def _ensure_flusher() -> None:
+    """Start this process's flusher thread; a forked worker starts its own."""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        threading.Thread(target=_run_flusher, name='goods-counter-flush', daemon=True).start()
+        _flusher_pid = pid
+
+
+def reset() -> None:
+    """Drop buffered deltas without writing them (tests)."""
+    _drain()
+
+
+def record_order_lines(lines: Iterable[Mapping]) -> None:
+    deltas: dict[int, int] = defaultdict(int)
+    for line in lines:
+        if line.get('goods_id') and line.get('quantity'):
+            deltas[int(line['goods_id'])] += int(line['quantity'])
+    if deltas:
+        increment_many(deltas, 'sales')
+
+
+def on_order_created(event) -> None:
+    """``order.created`` subscriber: count units sold."""
+    record_order_lines(event.payload.get('items', []))
+
+
+def _flush_at_exit(*args, **kwargs) -> None:
+    try:
+        flush()
+    except Exception:  # pragma: no cover - interpreter shutting down
+        logger.exception('Counter flush at shutdown failed')
+
+
+atexit.register(_flush_at_exit)
+
+try:  # pragma: no cover - only importable inside uwsgi
+    import uwsgi  # type: ignore
+
+    _previous_uwsgi_atexit = getattr(uwsgi, 'atexit', None)
+
+    def _uwsgi_atexit() -> None:
+        # uwsgi 只有一个 atexit 钩子：先写回计数，再调用之前注册的钩子
+        _flush_at_exit()
+        if _previous_uwsgi_atexit is not None:
+            _previous_uwsgi_atexit()
+
+    uwsgi.atexit = _uwsgi_atexit
+except ImportError:
+    pass
+
+try:  # pragma: no cover - optional dependency
+    from celery.signals import worker_process_shutdown
+
+    worker_process_shutdown.connect(_flush_at_exit, weak=False)
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+
+
+__all__ = [
+    'COUNTER_FIELDS',
+    'flush',
+    'increment',
+    'increment_many',
+    'on_order_created',
+    'pending',
+    'record_order_lines',
+    'reset',
+]
@@ -0,0 +1,89 @@
+"""Read-through cache of goods detail payloads.
+
+Every goods has one cache entry holding its full ``GoodsDetailPageSerializer``
+output in the base currency. :func:`get_many` reads all requested entries
+with one ``get_many`` and loads only the misses from the database, with one
+query for the goods (and categories) plus one prefetch for the images. The
+loaded payloads are written back with one ``set_many``, together with an
+absent marker for ids that do not exist (wishlists keep deleted goods).
+Entries are deleted by :mod:`goodsapp.changes` after every committed goods or
+image write, and expire after ``GOODS_DETAIL_CACHE_TIMEOUT`` seconds so that
+counter and stock updates that bypass signals are picked up eventually.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+
+_CACHE_PREFIX = 'goodsapp:detail'
+_ABSENT = False  # 缓存中表示商品不存在
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'GOODS_DETAIL_CACHE_TIMEOUT', 300)
+
+
+def _cache_key(goods_id: int) -> str:
+    return f'{_CACHE_PREFIX}:{goods_id}'
+
+
+def load(goods_ids: Sequence[int], fields=None) -> dict[int, dict]:
+    """Serialize ``goods_ids`` from the database (one query plus one prefetch)."""
+    from .models import Goods
+    from .serializers import GoodsDetailPageSerializer
+
+    selected = GoodsDetailPageSerializer.resolve_fields(fields) or GoodsDetailPageSerializer.output_fields()
+    queryset = Goods.objects.filter(id__in=list(goods_ids)).only(*GoodsDetailPageSerializer.columns_for(fields))
+    if 'category' in selected:
+        queryset = queryset.select_related('category')
+    if 'images' in selected:
+        queryset = queryset.prefetch_related('goodsdetail_set')
+    return {item['id']: dict(item) for item in GoodsDetailPageSerializer(queryset, many=True, fields=fields).data}
+
+
+def get_many(goods_ids: Iterable[int], fields=None) -> dict[int, dict]:
+    """Payloads of the goods that exist, served from the cache where possible.
+
+    Full payloads loaded for misses are cached. With a sparse ``fields``
+    selection, hits are trimmed and misses are loaded with only the needed
+    columns, without being cached.
+    """
+    from .changes import get_catalog_version
+    from .serializers import GoodsDetailPageSerializer
+
+    goods_ids = list(dict.fromkeys(goods_ids))
+    keys = {goods_id: _cache_key(goods_id) for goods_id in goods_ids}
+    cached = cache.get_many(list(keys.values()))
+    found = {goods_id: cached[key] for goods_id, key in keys.items() if key in cached}
+    absent = {goods_id for goods_id, data in found.items() if data is _ABSENT}
+    found = {goods_id: data for goods_id, data in found.items() if goods_id not in absent}
+    requested = GoodsDetailPageSerializer.resolve_fields(fields)
+    if requested is not None:
+        found = {goods_id: {key: data[key] for key in requested} for goods_id, data in found.items()}
+
+    missing = [goods_id for goods_id in goods_ids if goods_id not in found and goods_id not in absent]
+    if missing:
+        version = get_catalog_version()
+        loaded = load(missing, fields)
+        # 读取期间有商品写入提交时不回填，避免把旧数据写回刚失效的键
+        if get_catalog_version() == version:
+            entries = {keys[goods_id]: _ABSENT for goods_id in missing if goods_id not in loaded}
+            if requested is None:
+                entries.update((keys[goods_id], data) for goods_id, data in loaded.items())
+            if entries:
+                cache.set_many(entries, _cache_timeout())
+        found.update(loaded)
+    return found
+
+
+def get(goods_id: int, fields=None) -> dict | None:
+    return get_many([goods_id], fields).get(goods_id)
+
+
+def invalidate(goods_ids: Iterable[int]) -> None:
+    cache.delete_many([_cache_key(goods_id) for goods_id in goods_ids])
+
+
+__all__ = ['get', 'get_many', 'invalidate', 'load']
@@ -0,0 +1,287 @@
+"""Per-category facet bitmaps for goods listings.
+
+Each category keeps one bitmap (a Python ``int``) per facet value. Goods get a
+dense slot inside their category so the bitmaps stay small, and counts for any
+filter combination come from ANDing bitmaps and counting bits in process. The
+index lives in the Django cache and is patched on every goods write; when the
+patch cannot take the lock the category is dropped and rebuilt with a single
+query on the next read.
+
+Unpickling a large category's bitmaps costs more than the filtering they
+save, so each process also keeps the indexes it has read, up to
+``GOODS_FACET_LOCAL_CACHE_SIZE`` categories. A per-category stamp in the
+cache is bumped after every patch or invalidation. Reads fetch only that
+stamp and fetch the index again only when it has moved. The catalog version
+is not used for this because it is bumped before the patch lands, so a copy
+taken in between would be kept until the next write.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Iterable, Mapping
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from crossborder_trade.cache_utils import bump_version, cache_lock, get_version
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ('brand', 'price_band', 'is_hot', 'is_new')
+BOOLEAN_FACETS = ('is_hot', 'is_new')
+_CACHE_PREFIX = 'goodsapp:facets'
+
+# 进程内已反序列化的索引：分类 id -> (分类戳, 索引)
+_local: OrderedDict[int, tuple[int, 'FacetIndex']] = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'GOODS_FACET_INDEX_TIMEOUT', 3600)
+
+
+def _local_size() -> int:
+    return getattr(settings, 'GOODS_FACET_LOCAL_CACHE_SIZE', 256)
+
+
+def _price_bands() -> list[int]:
+    return sorted(int(edge) for edge in getattr(settings, 'GOODS_PRICE_BANDS', (0, 50, 100, 200, 500, 1000)))
+
+
+def price_band_for(price) -> str:
+    edges = _price_bands()
+    amount = Decimal(str(price or 0))
+    for lower, upper in zip(edges, edges[1:]):
+        if lower <= amount < upper:
+            return f'{lower}-{upper}'
+    if amount >= edges[-1]:
+        return f'{edges[-1]}+'
+    return f'0-{edges[0]}'
+
+
+def price_band_bounds(label: str) -> tuple[Decimal, Decimal | None]:
+    """``'50-100'`` -> ``(50, 100)``; ``'1000+'`` -> ``(1000, None)``."""
+    if label.endswith('+'):
+        return Decimal(label[:-1]), None
+    lower, _, upper = label.partition('-')
+    return Decimal(lower), Decimal(upper)
+
+
+def price_band_filter(label: str) -> Q:
+    lower, upper = price_band_bounds(label)
+    if upper is None:
+        return Q(price__gte=lower)
+    return Q(price__gte=lower, price__lt=upper)
+
+
+def facet_values(row: Mapping) -> dict[str, str]:
+    return {
+        'brand': str(row['brand']),
+        'price_band': price_band_for(row['price']),
+        'is_hot': '1' if row['is_hot'] else '0',
+        'is_new': '1' if row['is_new'] else '0',
+    }
+
+
+@dataclass
+class FacetIndex:
+    category_id: int
+    slots: dict[int, int] = field(default_factory=dict)
+    free_slots: list[int] = field(default_factory=list)
+    size: int = 0
+    members: int = 0
+    bitmaps: dict[str, dict[str, int]] = field(default_factory=lambda: {name: {} for name in FACET_FIELDS})
+
+    def add(self, goods_id: int, values: Mapping[str, str]) -> None:
+        self.remove(goods_id)
+        slot = self.free_slots.pop() if self.free_slots else self.size
+        if slot == self.size:
+            self.size += 1
+        self.slots[goods_id] = slot
+        bit = 1 << slot
+        self.members |= bit
+        for name in FACET_FIELDS:
+            bitmaps = self.bitmaps[name]
+            bitmaps[values[name]] = bitmaps.get(values[name], 0) | bit
+
+    def remove(self, goods_id: int) -> None:
+        slot = self.slots.pop(goods_id, None)
+        if slot is None:
+            return
+        mask = ~(1 << slot)
+        self.members &= mask
+        for bitmaps in self.bitmaps.values():
+            for value in list(bitmaps):
+                bitmaps[value] &= mask
+                if not bitmaps[value]:
+                    del bitmaps[value]
+        self.free_slots.append(slot)
+
+    def match(self, filters: Mapping[str, Iterable[str]], *, skip: str | None = None) -> int:
+        """Values of one facet are ORed together, facets are ANDed."""
+        result = self.members
+        for name, values in filters.items():
+            if name == skip or name not in self.bitmaps:
+                continue
+            selected = 0
+            for value in values:
+                selected |= self.bitmaps[name].get(value, 0)
+            result &= selected
+        return result
+
+    def count(self, filters: Mapping[str, Iterable[str]]) -> int:
+        return self.match(filters).bit_count()
+
+    def facet_counts(self, filters: Mapping[str, Iterable[str]]) -> dict[str, dict[str, int]]:
+        """Counts per facet value, each facet ignoring its own selection."""
+        counts: dict[str, dict[str, int]] = {}
+        for name in FACET_FIELDS:
+            base = self.match(filters, skip=name)
+            counts[name] = {
+                value: (bitmap & base).bit_count()
+                for value, bitmap in sorted(self.bitmaps[name].items())
+                if bitmap & base
+            }
+        return counts
+
+
+def _cache_key(category_id: int) -> str:
+    return f'{_CACHE_PREFIX}:{category_id}'
+
+
+def _stamp_key(category_id: int) -> str:
+    return f'{_CACHE_PREFIX}:{category_id}:stamp'
+
+
+def build_facet_index(category_id: int) -> FacetIndex:
+    from .models import Goods
+
+    index = FacetIndex(category_id=category_id)
+    rows = Goods.objects.filter(category_id=category_id).values('id', 'brand', 'price', 'is_hot', 'is_new')
+    for row in rows.iterator(chunk_size=2000):
+        index.add(row['id'], facet_values(row))
+    return index
+
+
+def _remember(category_id: int, stamp: int, index: FacetIndex) -> None:
+    with _local_lock:
+        _local[category_id] = (stamp, index)
+        _local.move_to_end(category_id)
+        while len(_local) > _local_size():
+            _local.popitem(last=False)
+
+
+def get_facet_index(category_id: int) -> FacetIndex:
+    from .changes import get_catalog_version
+
+    # 先读分类戳再读索引：写入方先写索引再递增分类戳，按旧戳保存的副本最多多读一次
+    stamp = get_version(_stamp_key(category_id))
+    with _local_lock:
+        local = _local.get(category_id)
+    if local is not None and local[0] == stamp:
+        return local[1]
+
+    key = _cache_key(category_id)
+    index = cache.get(key)
+    if index is None:
+        version = get_catalog_version()
+        index = build_facet_index(category_id)
+        # 构建期间有商品写入提交时不回填：那次写入的补丁或失效可能已经执行过
+        if get_catalog_version() != version:
+            return index
+        cache.add(key, index, _cache_timeout())
+    _remember(category_id, stamp, index)
+    return index
+
+
+def invalidate(category_ids: Iterable[int | None]) -> None:
+    categories = {category_id for category_id in category_ids if category_id is not None}
+    if categories:
+        cache.delete_many([_cache_key(category_id) for category_id in categories])
+        for category_id in categories:
+            bump_version(_stamp_key(category_id))
+
+
+def apply_change(
+    goods_id: int,
+    *,
+    values: Mapping[str, str] | None,
+    category_id: int | None,
+    previous_category_id: int | None = None,
+) -> None:
+    """Patch cached indexes for one goods write; ``values=None`` means deleted."""
+    touched = {category_id, previous_category_id} - {None}
+    for touched_category in touched:
+        key = _cache_key(touched_category)
+        with cache_lock(key, timeout=5, wait=0.5) as acquired:
+            if not acquired:
+                logger.info('Facet index %s busy; invalidating instead of patching', key)
+                cache.delete(key)
+            else:
+                index = cache.get(key)
+                if index is not None:
+                    if values is not None and touched_category == category_id:
+                        index.add(goods_id, values)
+                    else:
+                        index.remove(goods_id)
+                    cache.set(key, index, _cache_timeout())
+        # 补丁或删除之后再递增分类戳，各进程的本地副本随之失效
+        bump_version(_stamp_key(touched_category))
+
+
+def clear_local_caches() -> None:
+    with _local_lock:
+        _local.clear()
+
+
+def parse_filters(query_params) -> dict[str, list[str]]:
+    filters: dict[str, list[str]] = {}
+    for name in FACET_FIELDS:
+        raw = query_params.get(name)
+        if raw in (None, ''):
+            continue
+        values = [value.strip() for value in str(raw).split(',') if value.strip()]
+        if name in BOOLEAN_FACETS:
+            values = ['1' if value.lower() in {'1', 'true', 'yes', 'on'} else '0' for value in values]
+        if values:
+            filters[name] = values
+    return filters
+
+
+def filter_queryset(queryset, filters: Mapping[str, Iterable[str]]):
+    for name, values in filters.items():
+        values = list(values)
+        if name == 'brand':
+            queryset = queryset.filter(brand__in=values)
+        elif name == 'price_band':
+            condition = Q()
+            for label in values:
+                try:
+                    condition |= price_band_filter(label)
+                except Exception:
+                    continue
+            queryset = queryset.filter(condition) if condition else queryset.none()
+        elif name in BOOLEAN_FACETS:
+            queryset = queryset.filter(**{f'{name}__in': [value == '1' for value in values]})
+    return queryset
+
+
+__all__ = [
+    'FACET_FIELDS',
+    'FacetIndex',
+    'apply_change',
+    'build_facet_index',
+    'clear_local_caches',
+    'facet_values',
+    'filter_queryset',
+    'get_facet_index',
+    'invalidate',
+    'parse_filters',
+    'price_band_bounds',
+    'price_band_for',
+]
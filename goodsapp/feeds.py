@@ -0,0 +1,269 @@
+"""Sitemap and merchant product feed over the whole goods table.
+
+Rows are read with keyset iteration (``id > last ORDER BY id LIMIT n``), so
+neither the streaming views nor the file writer hold more than one chunk in
+memory. Goods are sharded by id range: shard ``k`` holds ids
+``k * size + 1 .. (k + 1) * size``, with ``size`` at most 50,000, the
+sitemap protocol limit. Shard boundaries therefore never move when goods
+are added or deleted.
+
+:func:`write_feeds` writes gzip shards plus a sitemap index to disk. One
+``GROUP BY`` query gives every shard's signature: the row count and highest
+``catalog_version``, plus the in-stock count for the product feed. Only
+shards whose signature changed since the last run are regenerated.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max, Q, Sum
+
+from .models import Goods
+from .projections import main_images
+
+try:  # pragma: no cover - fcntl is unavailable on Windows
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+SITEMAP_MAX_URLS = 50_000
+_CHUNK = 2000
+_STATE_NAME = 'state.json'
+_SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def shard_size() -> int:
+    return min(getattr(settings, 'SITEMAP_SHARD_SIZE', SITEMAP_MAX_URLS), SITEMAP_MAX_URLS)
+
+
+def output_dir() -> str:
+    return getattr(settings, 'FEED_OUTPUT_DIR', os.path.join(settings.BASE_DIR, 'var', 'feeds'))
+
+
+def storefront_url(path: str) -> str:
+    if path.startswith(('http://', 'https://')):
+        return path
+    return getattr(settings, 'STOREFRONT_URL', 'http://localhost:8080').rstrip('/') + path
+
+
+def goods_url(goods_id: int) -> str:
+    return storefront_url(f'/goods/{goods_id}')
+
+
+def shard_of(goods_id: int, size: int | None = None) -> int:
+    return (goods_id - 1) // (size or shard_size())
+
+
+def shard_count() -> int:
+    """Number of shards up to the highest goods id (some may be empty)."""
+    last = Goods.objects.order_by('-id').values_list('id', flat=True).first()
+    return 0 if last is None else shard_of(last) + 1
+
+
+def iter_rows(fields: Iterable[str], *, after: int = 0, upto: int | None = None,
+              chunk: int = _CHUNK) -> Iterator[list[dict]]:
+    """Yield chunks of goods rows with ``after < id <= upto`` in id order (keyset pagination)."""
+    fields = ['id', *(name for name in fields if name != 'id')]
+    last = after
+    while True:
+        queryset = Goods.objects.filter(id__gt=last)
+        if upto is not None:
+            queryset = queryset.filter(id__lte=upto)
+        rows = list(queryset.order_by('id').values(*fields)[:chunk])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]['id']
+        if len(rows) < chunk:
+            return
+
+
+def _shard_range(shard: int | None) -> dict:
+    if shard is None:
+        return {}
+    size = shard_size()
+    return {'after': shard * size, 'upto': (shard + 1) * size}
+
+
+def sitemap_index(locations: Iterable[str]) -> Iterator[str]:
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{_SITEMAP_NS}">\n'
+    for location in locations:
+        yield f'<sitemap><loc>{escape(location)}</loc></sitemap>\n'
+    yield '</sitemapindex>\n'
+
+
+def sitemap(shard: int | None = None) -> Iterator[str]:
+    """``<urlset>`` of one shard, or of every goods when ``shard`` is None."""
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{_SITEMAP_NS}">\n'
+    for rows in iter_rows(('id',), **_shard_range(shard)):
+        yield ''.join(f'<url><loc>{escape(goods_url(row["id"]))}</loc></url>\n' for row in rows)
+    yield '</urlset>\n'
+
+
+def _feed_item(row: dict, image: str, currency: str) -> str:
+    parts = [
+        f'<g:id>{row["id"]}</g:id>',
+        f'<title>{escape(row["gname"])}</title>',
+        f'<description>{escape(row["gdesc"])}</description>',
+        f'<link>{escape(goods_url(row["id"]))}</link>',
+        f'<g:price>{row["price"]} {currency}</g:price>',
+        f'<g:availability>{"in stock" if row["stock"] > 0 else "out of stock"}</g:availability>',
+        f'<g:brand>{escape(row["brand"])}</g:brand>',
+    ]
+    if image:
+        parts.append(f'<g:image_link>{escape(storefront_url(image))}</g:image_link>')
+    return f'<item>{"".join(parts)}</item>\n'
+
+
+def product_feed(shard: int | None = None) -> Iterator[str]:
+    """Merchant feed (RSS 2.0 with the ``g:`` namespace) in the base currency."""
+    from pricingapp.currency import base_currency
+
+    currency = base_currency()
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n'
+           f'<title>{escape(getattr(settings, "PRODUCT_FEED_TITLE", "Catalog"))}</title>\n'
+           f'<link>{escape(storefront_url("/"))}</link>\n')
+    for rows in iter_rows(('gname', 'gdesc', 'price', 'stock', 'brand'), **_shard_range(shard)):
+        images = main_images(row['id'] for row in rows)  # 每批一次主图查询
+        yield ''.join(_feed_item(row, images.get(row['id'], ('', None))[0], currency) for row in rows)
+    yield '</channel></rss>\n'
+
+
+def shard_signatures() -> dict[int, dict[str, list[int]]]:
+    """``{shard: {'sitemap': [...], 'feed': [...]}}`` from one aggregate query.
+
+    Stock changes do not bump ``catalog_version``, so the feed signature also
+    counts (and sums the ids of) in-stock goods to catch availability flips.
+    """
+    in_stock = Q(stock__gt=0)
+    # 整数除法得到分片号，数据库端按分片聚合
+    rows = (Goods.objects.order_by()
+            .annotate(shard=ExpressionWrapper((F('id') - 1) / shard_size(), output_field=IntegerField()))
+            .values('shard')
+            .annotate(count=Count('id'), version=Max('catalog_version'),
+                      in_stock=Count('id', filter=in_stock), in_stock_ids=Sum('id', filter=in_stock)))
+    return {
+        row['shard']: {
+            'sitemap': [row['count'], row['version']],
+            'feed': [row['count'], row['version'], row['in_stock'], row['in_stock_ids'] or 0],
+        }
+        for row in rows
+    }
+
+
+@dataclass
+class FeedStats:
+    shards: int = 0
+    written: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+
+_GENERATORS = {'sitemap': sitemap, 'feed': product_feed}
+
+
+def _file_name(kind: str, shard: int) -> str:
+    return f'{kind}-{shard}.xml.gz'
+
+
+def _write_file(path: str, chunks: Iterable[str], *, compress: bool = False) -> None:
+    """Write ``chunks`` to a temporary file next to ``path`` and swap it in atomically."""
+    fd, tmp_path = tempfile.mkstemp(prefix='.feed-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            # mtime=0：内容不变时压缩结果也不变
+            handle = gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) if compress else raw
+            with handle:
+                for chunk in chunks:
+                    handle.write(chunk.encode('utf-8'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@contextmanager
+def _writer_lock(root: str):
+    with open(os.path.join(root, '.lock'), 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def write_feeds(root: str | None = None, *, full: bool = False) -> FeedStats:
+    """Regenerate changed sitemap/feed shards under ``root`` and rewrite ``sitemap.xml``."""
+    root = root or output_dir()
+    os.makedirs(root, exist_ok=True)
+    with _writer_lock(root):
+        return _write_feeds(root, full)
+
+
+def _write_feeds(root: str, full: bool) -> FeedStats:
+    stats = FeedStats()
+    state_path = os.path.join(root, _STATE_NAME)
+    try:
+        with open(state_path, encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        state = {}
+    if state.get('shard_size') != shard_size():
+        state = {}
+    previous = state.get('shards', {})
+
+    signatures = shard_signatures()
+    for shard, signature in sorted(signatures.items()):
+        for kind, generate in _GENERATORS.items():
+            name = _file_name(kind, shard)
+            stored = previous.get(str(shard), {}).get(kind)
+            if full or stored != signature[kind] or not os.path.exists(os.path.join(root, name)):
+                _write_file(os.path.join(root, name), generate(shard), compress=True)
+                stats.written.append(name)
+    for shard in sorted(set(map(int, previous)) - set(signatures)):
+        for kind in _GENERATORS:
+            path = os.path.join(root, _file_name(kind, shard))
+            if os.path.exists(path):
+                os.unlink(path)
+                stats.removed.append(os.path.basename(path))
+
+    base = (getattr(settings, 'FEED_PUBLIC_URL', '') or storefront_url('')).rstrip('/')
+    _write_file(os.path.join(root, 'sitemap.xml'),
+                sitemap_index(f'{base}/{_file_name("sitemap", shard)}' for shard in sorted(signatures)))
+
+    state = {'shard_size': shard_size(), 'shards': {str(shard): value for shard, value in signatures.items()}}
+    with open(state_path, 'w', encoding='utf-8') as handle:
+        json.dump(state, handle)
+    stats.shards = len(signatures)
+    stats.elapsed = time.perf_counter() - stats.started
+    return stats
+
+
+__all__ = [
+    'FeedStats',
+    'SITEMAP_MAX_URLS',
+    'goods_url',
+    'shard_size',
+    'iter_rows',
+    'product_feed',
+    'output_dir',
+    'shard_count',
+    'shard_signatures',
+    'sitemap',
+    'sitemap_index',
+    'write_feeds',
+]
@@ -0,0 +1,124 @@
+"""Pre-rendered homepage payload.
+
+The home screen needs categories, the top hot goods, the newest goods and a
+few highlights per category. :func:`rebuild` renders all of it to JSON bytes
+once per language and stores ``(catalog version, bytes)`` in the cache, so
+serving the homepage is one cache read and a socket write.
+
+Rebuilds run in the ``rebuild_homepage`` Celery task. Catalog writes
+schedule it after commit (see :mod:`goodsapp.changes`), and a short debounce
+folds a burst of writes into one rebuild. A request that finds a payload
+older than the current catalog version serves it anyway and schedules a
+rebuild. Only a cold cache renders inline. Sales counters change the ranking
+without a version bump, so the beat schedule also rebuilds periodically.
+"""
+from __future__ import annotations
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework.renderers import JSONRenderer
+
+from .models import SUPPORTED_LANGUAGES, Category, Goods
+
+logger = logging.getLogger(__name__)
+
+_CACHE_PREFIX = 'goodsapp:homepage'
+_PENDING_KEY = f'{_CACHE_PREFIX}:pending'
+
+
+def _setting(name: str, default: int) -> int:
+    return getattr(settings, name, default)
+
+
+def _cache_key(lang: str) -> str:
+    return f'{_CACHE_PREFIX}:{lang}'
+
+
+def build_payload(lang: str) -> dict:
+    """Homepage data for ``lang`` (prices in the base currency)."""
+    from pricingapp.currency import base_currency
+
+    from .projections import localized_rows
+    from .serializers import CategorySerializer, GoodsLocalizedListSerializer
+
+    hot_ids = list(Goods.objects.filter(is_hot=True).order_by('-sales', 'id')
+                   .values_list('id', flat=True)[:_setting('HOMEPAGE_HOT_LIMIT', 10)])
+    new_ids = list(Goods.objects.filter(is_new=True).order_by('-id')
+                   .values_list('id', flat=True)[:_setting('HOMEPAGE_NEW_LIMIT', 10)])
+    # 每个分类按销量取前 N 个商品，一次窗口函数查询
+    ranked = Goods.objects.annotate(
+        rank=Window(RowNumber(), partition_by=[F('category_id')], order_by=[F('sales').desc(), F('id').asc()]),
+    ).filter(rank__lte=_setting('HOMEPAGE_CATEGORY_HIGHLIGHTS', 4)).values_list('category_id', 'id')
+    highlights: dict[int, list[int]] = {}
+    for category_id, goods_id in ranked.order_by('category_id', 'rank'):
+        highlights.setdefault(category_id, []).append(goods_id)
+
+    wanted = list(dict.fromkeys([*hot_ids, *new_ids, *(i for ids in highlights.values() for i in ids)]))
+    columns = GoodsLocalizedListSerializer.columns_for(None)
+    goods = {item['id']: item for item in GoodsLocalizedListSerializer(
+        localized_rows(wanted, lang, columns), many=True).data}
+    categories = CategorySerializer(Category.objects.order_by('id'), many=True).data
+    return {
+        'status': 'success',
+        'lang': lang,
+        'currency': base_currency(),
+        'categories': categories,
+        'hot': [goods[goods_id] for goods_id in hot_ids if goods_id in goods],
+        'new': [goods[goods_id] for goods_id in new_ids if goods_id in goods],
+        'highlights': [
+            {'category': category['id'],
+             'goods': [goods[goods_id] for goods_id in highlights.get(category['id'], ()) if goods_id in goods]}
+            for category in categories
+        ],
+    }
+
+
+def rebuild(languages=SUPPORTED_LANGUAGES) -> int:
+    """Render and store the payload of every language; returns the catalog version used."""
+    from .changes import get_catalog_version
+
+    # 先取版本再渲染：渲染期间的写入会让版本前进，下次请求会再次触发重建
+    version = get_catalog_version()
+    for lang in languages:
+        cache.set(_cache_key(lang), (version, JSONRenderer().render(build_payload(lang))), None)
+    return version
+
+
+def schedule_rebuild() -> None:
+    """Enqueue one debounced rebuild; further calls within the window are dropped."""
+    debounce = _setting('HOMEPAGE_REBUILD_DEBOUNCE_SECONDS', 5)
+    if not cache.add(_PENDING_KEY, 1, debounce or 1):
+        return
+    try:
+        from .tasks import rebuild_homepage
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning('rebuild_homepage task unavailable: %s', exc)
+        return
+
+    try:
+        rebuild_homepage.apply_async(countdown=debounce)
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        cache.delete(_PENDING_KEY)
+        logger.warning('Failed to enqueue homepage rebuild: %s', exc)
+
+
+def get_payload(lang: str) -> bytes:
+    from .changes import get_catalog_version
+
+    cached = cache.get(_cache_key(lang))
+    if cached is None:  # 冷启动：当前请求同步渲染一次
+        rebuild([lang])
+        cached = cache.get(_cache_key(lang))
+        if cached is None:  # 缓存不可用
+            return JSONRenderer().render(build_payload(lang))
+    version, body = cached
+    if version != get_catalog_version():
+        schedule_rebuild()
+    return body
+
+
+__all__ = ['build_payload', 'get_payload', 'rebuild', 'schedule_rebuild']
@@ -0,0 +1,141 @@
+"""Resized WebP derivatives for ``GoodsDetail`` images.
+
+Derivatives are content-addressed: their storage path is derived from the
+SHA-256 of the source file, so regenerating an unchanged image is a no-op and
+the files can be served with immutable cache headers. Two workers rendering
+the same source race on the same path; the loser's copy (saved by the storage
+under a suffixed name) is deleted, so each derivative exists once.
+
+A source that Pillow cannot decode raises :class:`InvalidImage`, which is not
+an ``OSError``: retrying it cannot help.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+from typing import Iterable
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import CatalogSequence, GoodsDetail
+
+try:  # pragma: no cover - Pillow is required by ImageField, but keep imports lazy-safe
+    from PIL import Image, ImageOps
+except ModuleNotFoundError:  # pragma: no cover
+    Image = ImageOps = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+
+class InvalidImage(ValueError):
+    """The source file is not an image Pillow can decode."""
+
+
+def derivative_sizes() -> dict[str, int]:
+    return dict(getattr(settings, 'IMAGE_DERIVATIVE_SIZES', {'thumb': 200, 'medium': 600}))
+
+
+def derivative_path(content_hash: str, variant: str) -> str:
+    return f'{DERIVATIVES_DIR}/{content_hash[:2]}/{content_hash}-{variant}.webp'
+
+
+def _render_webp(source: bytes, max_size: int) -> bytes:
+    try:
+        with Image.open(io.BytesIO(source)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format='WEBP', quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80), method=4)
+            return output.getvalue()
+    except (OSError, Image.DecompressionBombError) as exc:
+        # 源数据已在内存中，这里的 OSError（含 UnidentifiedImageError、截断文件）都是解码失败
+        raise InvalidImage(str(exc)) from exc
+
+
+def _store(path: str, data: bytes) -> None:
+    saved = default_storage.save(path, ContentFile(data))
+    if saved != path:
+        # 并发任务已写入同一内容地址，存储给本次写入加了后缀：删除多余的副本
+        default_storage.delete(saved)
+
+
+def generate_derivatives(detail: GoodsDetail, *, force: bool = False) -> dict[str, str]:
+    """Create missing derivatives for ``detail`` and record them on the row."""
+    if Image is None:
+        raise RuntimeError('Image derivatives require Pillow')
+    if not detail.gdurl:
+        return {}
+
+    storage = detail.gdurl.storage
+    with storage.open(detail.gdurl.name, 'rb') as handle:
+        source = handle.read()
+    content_hash = hashlib.sha256(source).hexdigest()
+
+    derivatives: dict[str, str] = {}
+    for variant, max_size in derivative_sizes().items():
+        path = derivative_path(content_hash, variant)
+        if force or not default_storage.exists(path):
+            data = _render_webp(source, max_size)
+            if force and default_storage.exists(path):
+                default_storage.delete(path)
+            _store(path, data)
+        derivatives[variant] = path
+
+    if detail.content_hash != content_hash or detail.derivatives != derivatives:
+        # queryset.update 不触发 post_save，避免再次入队生成任务
+        # 衍生图地址变化，分配新的 catalog_version 供增量同步
+        with transaction.atomic():
+            GoodsDetail.objects.filter(pk=detail.pk).update(content_hash=content_hash, derivatives=derivatives,
+                                                            catalog_version=CatalogSequence.allocate())
+        detail.content_hash, detail.derivatives = content_hash, derivatives
+        from .detail_cache import invalidate
+
+        invalidate([detail.goods_id])
+        if detail.is_main:
+            from .projections import refresh_main_image
+
+            refresh_main_image(detail.goods_id)
+    return derivatives
+
+
+def image_variants(detail: GoodsDetail | None = None, *, path: str | None = None,
+                   derivatives: dict | None = None) -> dict[str, str] | None:
+    """``{'thumb': url, 'medium': url, 'full': url}``; missing sizes fall back to full."""
+    if detail is not None:
+        path, derivatives = detail.gdurl.name, detail.derivatives
+    if not path:
+        return None
+    full = default_storage.url(path)
+    variants = {variant: full for variant in derivative_sizes()}
+    for variant, derivative in (derivatives or {}).items():
+        if variant in variants:
+            variants[variant] = default_storage.url(derivative)
+    variants['full'] = full
+    return variants
+
+
+def pending_details(*, force: bool = False, prefix: str | None = None) -> Iterable[GoodsDetail]:
+    queryset = GoodsDetail.objects.order_by('id')
+    if prefix:
+        queryset = queryset.filter(gdurl__startswith=prefix)
+    if not force:
+        queryset = queryset.filter(content_hash='')
+    return queryset.iterator(chunk_size=500)
+
+
+__all__ = [
+    'InvalidImage',
+    'derivative_path',
+    'derivative_sizes',
+    'generate_derivatives',
+    'image_variants',
+    'pending_details',
+]
@@ -0,0 +1,188 @@
+"""Rolling hot-products leaderboards (units sold) kept in the cache.
+
+Sales are added to time buckets per scope (``global`` and every category):
+5-minute buckets for the 1h window, hourly buckets for 24h and 6-hour buckets
+for 7d. A bucket is a ``{goods_id: units}`` dict under one cache key. Readers
+sum the buckets of a window once, keep the top-N as a memo until the next
+write or bucket roll-over, and serve later requests from the memo in O(N).
+The window end is the current, partially filled bucket, so the covered span
+is accurate to one bucket width.
+
+Writers patch a bucket under :func:`~crossborder_trade.cache_utils.cache_lock`.
+A bucket whose lock stays busy is not dropped: :func:`record_sales` raises
+:class:`BucketsBusy` with the deltas it could not apply, and the task retries
+just those buckets (:func:`apply_pending`), so no unit is counted twice. Every
+write bumps a generation stamp per scope and window. A memo records the
+generation it was computed from and is ignored once the stamp moves, so a
+reader that finishes after a write cannot publish stale totals.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import time
+from collections import Counter
+from typing import Iterable, Mapping
+
+from django.conf import settings
+from django.core.cache import cache
+
+from crossborder_trade.cache_utils import bump_version, cache_lock, get_version
+
+logger = logging.getLogger(__name__)
+
+# 窗口名 -> (桶宽度秒数, 桶个数)
+WINDOWS: dict[str, tuple[int, int]] = {
+    '1h': (300, 12),
+    '24h': (3600, 24),
+    '7d': (6 * 3600, 28),
+}
+GLOBAL_SCOPE = 'global'
+_CACHE_PREFIX = 'goodsapp:hot'
+_LOCK_WAIT = 2
+
+
+class BucketsBusy(Exception):
+    """Some buckets stayed locked; ``pending`` holds their deltas for :func:`apply_pending`."""
+
+    def __init__(self, pending: list):
+        super().__init__(f'{len(pending)} leaderboard buckets busy')
+        self.pending = pending
+
+
+def _max_entries() -> int:
+    return getattr(settings, 'HOT_PRODUCTS_MAX_RESULTS', 50)
+
+
+def scope_for(category_id: int | None) -> str:
+    return GLOBAL_SCOPE if category_id is None else f'category:{category_id}'
+
+
+def _bucket_key(scope: str, window: str, bucket: int) -> str:
+    return f'{_CACHE_PREFIX}:{scope}:{window}:{bucket}'
+
+
+def _memo_key(scope: str, window: str) -> str:
+    return f'{_CACHE_PREFIX}:{scope}:{window}:top'
+
+
+def _generation_key(scope: str, window: str) -> str:
+    return f'{_CACHE_PREFIX}:{scope}:{window}:generation'
+
+
+def _current_bucket(window: str, now: float) -> int:
+    width, _ = WINDOWS[window]
+    return int(now // width)
+
+
+def apply_pending(pending: Iterable, *, now: float) -> list:
+    """Add ``[scope, window, [[goods_id, units], ...]]`` entries to their buckets at ``now``.
+
+    Returns the entries whose bucket lock stayed busy, in the same JSON-safe form.
+    """
+    busy = []
+    for scope, window, deltas in pending:
+        width, size = WINDOWS[window]
+        key = _bucket_key(scope, window, _current_bucket(window, now))
+        with cache_lock(key, timeout=5, wait=_LOCK_WAIT) as acquired:
+            if not acquired:
+                logger.info('Leaderboard bucket %s busy; keeping %s units for a retry', key,
+                            sum(quantity for _, quantity in deltas))
+                busy.append([scope, window, deltas])
+                continue
+            bucket = cache.get(key) or {}
+            for goods_id, quantity in deltas:
+                bucket[goods_id] = bucket.get(goods_id, 0) + quantity
+            # 桶在整个窗口滑过之后自然过期
+            cache.set(key, bucket, width * (size + 1))
+        # 递增代数：基于旧桶计算的备忘录随之作废，包括写入之后才保存的
+        bump_version(_generation_key(scope, window))
+    return busy
+
+
+def record_sales(lines: Iterable[Mapping], *, now: float | None = None) -> int:
+    """Add ``{'goods_id', 'quantity', 'category_id'}`` lines to every window.
+
+    Returns the number of units recorded. Raises :class:`BucketsBusy` after
+    applying the other buckets when some bucket locks stayed busy.
+    """
+    now = time.time() if now is None else now
+    per_scope: dict[str, Counter] = {}
+    units = 0
+    for line in lines:
+        quantity = int(line.get('quantity') or 0)
+        if quantity <= 0 or not line.get('goods_id'):
+            continue
+        goods_id = int(line['goods_id'])
+        units += quantity
+        per_scope.setdefault(GLOBAL_SCOPE, Counter())[goods_id] += quantity
+        if line.get('category_id') is not None:
+            per_scope.setdefault(scope_for(int(line['category_id'])), Counter())[goods_id] += quantity
+
+    busy = apply_pending(
+        ([scope, window, sorted(deltas.items())] for scope, deltas in per_scope.items() for window in WINDOWS),
+        now=now,
+    )
+    if busy:
+        raise BucketsBusy(busy)
+    return units
+
+
+def top_products(window: str = '24h', *, category_id: int | None = None, limit: int | None = None,
+                 now: float | None = None) -> list[tuple[int, int]]:
+    """``[(goods_id, units), ...]`` for the window, best sellers first."""
+    if window not in WINDOWS:
+        raise ValueError(f'Unsupported window: {window}')
+    now = time.time() if now is None else now
+    limit = min(limit or _max_entries(), _max_entries())
+    scope = scope_for(category_id)
+    current = _current_bucket(window, now)
+
+    memo_key, generation_key = _memo_key(scope, window), _generation_key(scope, window)
+    state = cache.get_many([memo_key, generation_key])
+    generation = state.get(generation_key)
+    if generation is None:
+        generation = get_version(generation_key)
+    memo = state.get(memo_key)
+    if memo is not None and memo['bucket'] == current and memo['generation'] == generation:
+        return memo['top'][:limit]
+
+    width, size = WINDOWS[window]
+    buckets = cache.get_many([_bucket_key(scope, window, bucket) for bucket in range(current - size + 1, current + 1)])
+    totals: Counter = Counter()
+    for bucket in buckets.values():
+        totals.update(bucket)
+    top = heapq.nsmallest(_max_entries(), totals.items(), key=lambda item: (-item[1], item[0]))
+    # 备忘录在下一个桶开始时过期；记录读取前的代数，期间有写入时下次读取会重新计算
+    expires_in = max(1, int((current + 1) * width - now))
+    cache.set(memo_key, {'bucket': current, 'generation': generation, 'top': top}, expires_in)
+    return top[:limit]
+
+
+def on_order_created(event) -> None:
+    """``order.created`` subscriber: count the order's units in the leaderboards."""
+    lines = [item for item in event.payload.get('items', []) if item.get('goods_id')]
+    if not lines:
+        return
+    try:
+        from .tasks import update_leaderboards
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning('update_leaderboards task unavailable: %s', exc)
+        return
+
+    try:
+        update_leaderboards.delay(lines, time.time())
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        logger.warning('Failed to enqueue leaderboard update: %s', exc)
+
+
+__all__ = [
+    'BucketsBusy',
+    'GLOBAL_SCOPE',
+    'WINDOWS',
+    'apply_pending',
+    'on_order_created',
+    'record_sales',
+    'scope_for',
+    'top_products',
+]
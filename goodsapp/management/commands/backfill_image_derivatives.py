@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from goodsapp import images
+
+
+class Command(BaseCommand):
+    help = "为尚未生成缩略图的 GoodsDetail 图片补齐 WebP 派生图（默认投递到 media 队列）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='在当前进程内直接生成，而不是投递 Celery 任务')
+        parser.add_argument('--force', action='store_true', help='重新生成所有图片（包括已有派生图的）')
+        parser.add_argument('--prefix', help='只处理 gdurl 以该前缀开头的图片，例如 books/')
+
+    def handle(self, *args, **options):
+        processed = missing = invalid = 0
+        for detail in images.pending_details(force=options['force'], prefix=options['prefix']):
+            if options['sync']:
+                try:
+                    images.generate_derivatives(detail, force=options['force'])
+                except FileNotFoundError:
+                    missing += 1
+                    self.stderr.write(f'源文件不存在: detail={detail.pk} path={detail.gdurl.name}')
+                    continue
+                except images.InvalidImage as exc:
+                    invalid += 1
+                    self.stderr.write(f'无法解析图片: detail={detail.pk} path={detail.gdurl.name} ({exc})')
+                    continue
+            else:
+                from goodsapp.tasks import generate_image_derivatives
+
+                generate_image_derivatives.delay(detail.pk, force=options['force'])
+            processed += 1
+
+        action = '已生成' if options['sync'] else '已入队'
+        self.stdout.write(self.style.SUCCESS(f'{action} {processed} 张图片，缺失源文件 {missing} 张，无法解析 {invalid} 张'))
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from goodsapp import columnar
+from goodsapp.changes import bump_catalog_version
+from goodsapp.models import Category, Goods
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "对比列式快照与 ORM（category_goods 使用的 Goods.objects.filter 路径）的查询耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', type=int, help='分类 ID，默认取商品最多的分类')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--ordering', default='-price')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='先在事务内生成 N 条模拟商品，结束后回滚（不会写入真实数据）',
+        )
+
+    def handle(self, *args, **options):
+        if not columnar.is_available():
+            raise CommandError('numpy 未安装或 CATALOG_SNAPSHOT_ENABLED=False，无法运行列式快照基准')
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self._seed(options['seed'])
+                self._run(options)
+                if options['seed']:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write('已回滚模拟数据')
+
+    def _seed(self, count):
+        categories = [Category.objects.create(cname=f'bench-{index}') for index in range(10)]
+        Goods.objects.bulk_create(
+            [
+                Goods(
+                    gname=f'bench-goods-{index}',
+                    gdesc='benchmark',
+                    price=Decimal(index % 997) + Decimal('0.99'),
+                    category=categories[index % len(categories)],
+                    brand=f'brand-{index % 25}',
+                    stock=index % 50,
+                    sales=(index * 7919) % 10000,
+                    is_hot=index % 11 == 0,
+                    is_new=index % 13 == 0,
+                )
+                for index in range(count)
+            ],
+            batch_size=1000,
+        )
+        bump_catalog_version()
+
+    def _run(self, options):
+        category_id = options['category']
+        if category_id is None:
+            from django.db.models import Count
+
+            top = Category.objects.annotate(total=Count('goods_set')).order_by('-total').first()
+            if top is None:
+                raise CommandError('没有可用的分类数据，请使用 --seed 生成模拟商品')
+            category_id = top.id
+
+        ordering, limit, iterations = options['ordering'], options['limit'], options['iterations']
+        columnar.reset_snapshot()
+        started = time.perf_counter()
+        snapshot = columnar.get_snapshot()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        def orm_query():
+            return list(
+                Goods.objects.filter(category_id=category_id)
+                .order_by(ordering, 'id')
+                .values_list('id', flat=True)[:limit]
+            )
+
+        def snapshot_query():
+            return snapshot.query(category_id=category_id, ordering=ordering, limit=limit)
+
+        if orm_query() != snapshot_query():
+            raise CommandError('列式快照与 ORM 的结果不一致')
+
+        self.stdout.write(
+            f'goods={len(snapshot)} category={category_id} ordering={ordering} limit={limit} '
+            f'snapshot_build={build_ms:.1f}ms'
+        )
+        for label, func in (('orm', orm_query), ('snapshot', snapshot_query)):
+            timings = []
+            for _ in range(iterations):
+                tick = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - tick) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+            self.stdout.write(
+                f'{label:>9}: mean={statistics.mean(timings):.3f}ms '
+                f'p50={statistics.median(timings):.3f}ms p95={p95:.3f}ms'
+            )
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+
+from goodsapp import stock
+from goodsapp.models import Category, Goods
+
+
+class Command(BaseCommand):
+    help = "并发扣减同一商品的库存，对比单行库存与分片库存的吞吐量（会创建并在结束后删除一个测试商品）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='并发线程数（每个线程一个数据库连接）')
+        parser.add_argument('--orders', type=int, default=2000, help='每种模式的下单次数')
+        parser.add_argument('--quantity', type=int, default=1, help='每单扣减件数')
+        parser.add_argument('--stock', type=int, help='初始库存，默认刚好够一半订单')
+        parser.add_argument('--shards', type=int, help='分片数，默认 STOCK_SHARD_COUNT')
+        parser.add_argument('--mode', choices=('single', 'sharded', 'both'), default='both')
+
+    def handle(self, *args, **options):
+        if min(options['threads'], options['orders'], options['quantity']) < 1:
+            raise CommandError('--threads、--orders、--quantity 必须大于 0')
+        initial = options['stock'] if options['stock'] is not None else options['orders'] * options['quantity'] // 2
+        category = Category.objects.create(cname=f'bench-stock-{time.time_ns()}')
+        goods = Goods.objects.create(gname=f'bench-stock-{time.time_ns()}', gdesc='benchmark', brand='bench',
+                                     price=Decimal('1.00'), category=category, stock=initial)
+        try:
+            modes = ('single', 'sharded') if options['mode'] == 'both' else (options['mode'],)
+            for mode in modes:
+                self._run(goods.id, mode, initial, options)
+        finally:
+            goods.delete()
+            category.delete()
+
+    def _run(self, goods_id, mode, initial, options):
+        stock.disable_sharding(goods_id)
+        Goods.objects.filter(id=goods_id).update(stock=initial)
+        if mode == 'sharded':
+            stock.enable_sharding(goods_id, options['shards'])
+        shards, quantity = stock.shard_count(goods_id), options['quantity']
+        threads, orders = options['threads'], options['orders']
+        latencies, outcomes, lock = [], {'ok': 0, 'short': 0, 'error': 0}, threading.Lock()
+
+        def worker(count):
+            local_latencies, local_outcomes = [], []
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        # 与下单相同：扣减在事务中完成，提交后才释放行锁
+                        with transaction.atomic():
+                            outcome = 'ok' if stock.decrement(goods_id, quantity, shards=shards) else 'short'
+                    except DatabaseError:
+                        outcome = 'error'
+                    local_latencies.append((time.perf_counter() - started) * 1000)
+                    local_outcomes.append(outcome)
+            finally:
+                connections.close_all()  # 每个线程使用独立连接，结束时关闭
+            with lock:
+                latencies.extend(local_latencies)
+                for outcome in local_outcomes:
+                    outcomes[outcome] += 1
+
+        workers = [
+            threading.Thread(target=worker, args=(orders // threads + (1 if index < orders % threads else 0),))
+            for index in range(threads)
+        ]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = stock.rebalance(goods_id) if shards else Goods.objects.get(id=goods_id).stock
+        expected = initial - outcomes['ok'] * quantity
+        latencies.sort()
+        self.stdout.write(
+            f"{mode:>8}: {orders / elapsed:8.1f} 单/秒，"
+            f"p50 {statistics.median(latencies):.2f}ms，p99 {latencies[max(int(len(latencies) * 0.99) - 1, 0)]:.2f}ms，"
+            f"成功 {outcomes['ok']}，库存不足 {outcomes['short']}，数据库错误 {outcomes['error']}"
+        )
+        if remaining != expected or remaining < 0:
+            raise CommandError(f'{mode}: 剩余库存 {remaining}，预期 {expected}（出现超卖或丢失扣减）')
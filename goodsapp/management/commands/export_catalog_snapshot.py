@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from goodsapp.models import SUPPORTED_LANGUAGES
+from goodsapp.static_export import CatalogExporter, export_dir
+
+
+class Command(BaseCommand):
+    help = "把公开商品目录（分类、分类列表分页、商品详情，按语言）导出为静态 JSON 和清单，默认只重写有变更的商品"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='导出目录，默认 CATALOG_EXPORT_DIR')
+        parser.add_argument('--full', action='store_true', help='忽略清单中的版本，重新渲染全部商品（内容未变的文件仍不重写）')
+        parser.add_argument('--page-size', type=int, help='分类列表每页商品数，默认 CATALOG_EXPORT_PAGE_SIZE')
+        parser.add_argument('--lang', action='append', choices=SUPPORTED_LANGUAGES, help='只导出指定语言，可重复')
+
+    def handle(self, *args, **options):
+        if options['page_size'] is not None and options['page_size'] < 1:
+            raise CommandError('--page-size 必须大于 0')
+        exporter = CatalogExporter(
+            options['output'] or export_dir(),
+            languages=options['lang'] or SUPPORTED_LANGUAGES,
+            page_size=options['page_size'],
+            full=options['full'],
+        )
+        try:
+            stats = exporter.run()
+        except OSError as exc:
+            raise CommandError(f'导出失败: {exc}') from exc
+        mode = '全量' if stats.full else '增量'
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode}导出完成（目录版本 {stats.version}）: 商品 {stats.goods} 个、分类 {stats.categories} 个，'
+            f'写入 {stats.written} 个文件，未变 {stats.unchanged} 个，删除 {stats.removed} 个，耗时 {stats.elapsed:.2f}s'
+        ))
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from goodsapp.feeds import output_dir, write_feeds
+
+
+class Command(BaseCommand):
+    help = "生成 sitemap 索引及 gzip 分片（每片最多 50000 个商品）和商品 feed，默认只重写商品有变化的分片"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='输出目录，默认 FEED_OUTPUT_DIR')
+        parser.add_argument('--full', action='store_true', help='忽略上次记录的分片签名，重写全部分片')
+
+    def handle(self, *args, **options):
+        try:
+            stats = write_feeds(options['output'] or output_dir(), full=options['full'])
+        except OSError as exc:
+            raise CommandError(f'生成失败: {exc}') from exc
+        self.stdout.write(self.style.SUCCESS(
+            f'生成完成: 分片 {stats.shards} 个，写入 {len(stats.written)} 个文件，删除 {len(stats.removed)} 个，'
+            f'耗时 {stats.elapsed:.2f}s'
+        ))
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from goodsapp import stock
+from goodsapp.models import Goods
+
+
+class Command(BaseCommand):
+    help = "为热门商品开启或关闭分片库存，或立即重新均衡分片"
+
+    def add_arguments(self, parser):
+        parser.add_argument('goods_ids', nargs='+', type=int)
+        action = parser.add_mutually_exclusive_group(required=True)
+        action.add_argument('--enable', action='store_true', help='把 Goods.stock 拆分到分片子行')
+        action.add_argument('--disable', action='store_true', help='把分片合并回 Goods.stock')
+        action.add_argument('--rebalance', action='store_true', help='把总库存平均分配到各分片')
+        parser.add_argument('--shards', type=int, help='分片数，默认 STOCK_SHARD_COUNT')
+
+    def handle(self, *args, **options):
+        if options['shards'] is not None and options['shards'] < 1:
+            raise CommandError('--shards 必须大于 0')
+        existing = set(Goods.objects.filter(id__in=options['goods_ids']).values_list('id', flat=True))
+        missing = sorted(set(options['goods_ids']) - existing)
+        if missing:
+            raise CommandError(f'商品不存在: {missing}')
+        for goods_id in options['goods_ids']:
+            if options['enable']:
+                stock.enable_sharding(goods_id, options['shards'])
+            elif options['disable']:
+                stock.disable_sharding(goods_id)
+            else:
+                stock.rebalance(goods_id)
+            self.stdout.write(f'商品 {goods_id}: 库存 {stock.available(goods_id)}，分片 {stock.shard_count(goods_id)} 个')
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+LANGUAGES = ('zh', 'en')
+
+
+def _translate(translations, lang, fallback):
+    translations = translations or {}
+    if lang in translations:
+        return translations[lang]
+    if 'zh' in translations:
+        return translations['zh']
+    return fallback
+
+
+def _fit(model, column, value):
+    # 绕过校验写入的超长翻译按列长截断（同 projections._fit），MySQL 严格模式下迁移不会中断
+    limit = model._meta.get_field(column).max_length
+    return value[:limit] if limit and value else value
+
+
+def backfill_goods_localized(apps, schema_editor):
+    Goods = apps.get_model('goodsapp', 'Goods')
+    GoodsDetail = apps.get_model('goodsapp', 'GoodsDetail')
+    GoodsLocalized = apps.get_model('goodsapp', 'GoodsLocalized')
+
+    main_images = {}
+    for goods_id, path in GoodsDetail.objects.filter(is_main=True).order_by('id').values_list('goods_id', 'gdurl'):
+        if path:
+            main_images.setdefault(goods_id, f'{settings.MEDIA_URL}{path}')
+
+    rows = []
+    for goods in Goods.objects.all().iterator(chunk_size=1000):
+        for lang in LANGUAGES:
+            rows.append(GoodsLocalized(
+                goods_id=goods.id,
+                lang=lang,
+                category_id=goods.category_id,
+                name=_fit(GoodsLocalized, 'name', _translate(goods.name_i18n, lang, goods.gname)),
+                description=_translate(goods.description_i18n, lang, goods.gdesc),
+                brand=_fit(GoodsLocalized, 'brand', _translate(goods.brand_i18n, lang, goods.brand)),
+                price=goods.price,
+                is_hot=goods.is_hot,
+                is_new=goods.is_new,
+                main_image_url=main_images.get(goods.id, ''),
+            ))
+        if len(rows) >= 1000:
+            GoodsLocalized.objects.bulk_create(rows)
+            rows = []
+    if rows:
+        GoodsLocalized.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0004_goods_brand_i18n_goods_description_i18n_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsLocalized',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=8)),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True)),
+                ('brand', models.CharField(blank=True, max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('is_hot', models.BooleanField(default=False)),
+                ('is_new', models.BooleanField(default=False)),
+                ('main_image_url', models.CharField(blank=True, max_length=255)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='goodsapp.category')),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='localized_set', to='goodsapp.goods')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lang', 'category'], name='goods_localized_lang_cat_idx')],
+                'constraints': [models.UniqueConstraint(fields=('goods', 'lang'), name='goods_localized_goods_lang_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_goods_localized, migrations.RunPython.noop),
+    ]
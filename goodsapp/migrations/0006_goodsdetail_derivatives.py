@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0005_goodslocalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goodsdetail',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='goodsdetail',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='goodslocalized',
+            name='main_image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
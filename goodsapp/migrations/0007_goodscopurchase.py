@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0006_goodsdetail_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='goodsapp.goods')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='goodsapp.goods')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['goods', '-count'], name='goods_copurchase_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('goods', 'related'), name='goods_copurchase_pair_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0008_goods_views'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goods',
+            name='hs_code',
+            field=models.CharField(blank=True, default='', max_length=12, verbose_name='HS 编码'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0009_goods_hs_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goods',
+            name='weight_grams',
+            field=models.PositiveIntegerField(default=0, verbose_name='重量（克）'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:52
+
+from django.db import migrations, models
+
+
+def drop_duplicate_images(apps, schema_editor):
+    """同一商品重复的图片路径只保留最早的一条，主图标记合并到保留的行上"""
+    GoodsDetail = apps.get_model('goodsapp', 'GoodsDetail')
+    kept = {}
+    for detail_id, goods_id, path, is_main in GoodsDetail.objects.order_by('id').values_list(
+        'id', 'goods_id', 'gdurl', 'is_main'
+    ):
+        key = (goods_id, path)
+        if key not in kept:
+            kept[key] = (detail_id, is_main)
+            continue
+        if is_main and not kept[key][1]:
+            GoodsDetail.objects.filter(id=kept[key][0]).update(is_main=True)
+            kept[key] = (kept[key][0], True)
+        GoodsDetail.objects.filter(id=detail_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0010_goods_weight_grams'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='goodsdetail',
+            constraint=models.UniqueConstraint(fields=('goods', 'gdurl'), name='goods_detail_goods_url_uniq'),
+        ),
+    ]
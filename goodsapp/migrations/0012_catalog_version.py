@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+def assign_catalog_versions(apps, schema_editor):
+    """已有的分类、商品和图片按主键顺序分配初始版本，首次同步（since=0）可取到全部数据"""
+    version = 0
+    for model_name in ('Category', 'Goods', 'GoodsDetail'):
+        model = apps.get_model('goodsapp', model_name)
+        for pk in model.objects.order_by('pk').values_list('pk', flat=True).iterator():
+            version += 1
+            model.objects.filter(pk=pk).update(catalog_version=version)
+    apps.get_model('goodsapp', 'CatalogSequence').objects.create(pk=1, value=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0011_goodsdetail_goods_url_uniq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('goods', '商品'), ('detail', '商品图片'), ('category', '分类')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('catalog_version', models.BigIntegerField(unique=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='catalog_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='goods',
+            name='catalog_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='goodsdetail',
+            name='catalog_version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(assign_catalog_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0012_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogtombstone',
+            name='parent_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
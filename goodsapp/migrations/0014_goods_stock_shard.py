@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0013_catalogtombstone_parent_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goods',
+            name='stock_shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='GoodsStockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='goodsapp.goods')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('goods', 'shard'), name='goods_stock_shard_uniq')],
+            },
+        ),
+    ]
@@ -1,26 +1,77 @@
-from django.db import models
-from django.db.models import JSONField
+from django.db import models, transaction
+from django.db.models import F, JSONField
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# 商品多语言字段支持的语言
+SUPPORTED_LANGUAGES = ('zh', 'en')
 
 
 # import collections
 
 
+class CatalogSequence(models.Model):
+    """目录变更序号（单行），为 Goods/GoodsDetail/Category 的写入分配单调递增的 catalog_version"""
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count=1):
+        """在当前事务中分配 count 个连续序号，返回最后一个
+
+        序号行的行锁持有到事务提交，后分配的序号一定后提交，客户端按序号增量同步不会漏数据。
+        """
+        if not cls.objects.filter(pk=1).update(value=F('value') + count):
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(value=F('value') + count)
+        return cls.objects.values_list('value', flat=True).get(pk=1)
+
+
+class CatalogVersioned(models.Model):
+    """保存时分配新的 catalog_version；update_fields 不含同步字段时（如只改库存）不分配"""
+    SYNC_FIELDS = None  # None 表示任意字段
+    catalog_version = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.SYNC_FIELDS is not None \
+                and not self.SYNC_FIELDS.intersection(update_fields):
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            self.catalog_version = CatalogSequence.allocate()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'catalog_version'}
+            super().save(*args, **kwargs)
+
+
 # Create your models here.
-class Category(models.Model):
+class Category(CatalogVersioned):
     cname = models.CharField(max_length=50, verbose_name="商品类别名")
 
     def __str__(self):
         return u'<Category %s>' % self.cname
 
 
-class Goods(models.Model):
+class Goods(CatalogVersioned):
+    # 增量同步下发的字段；库存、销量、浏览量是高频计数，不分配新版本
+    SYNC_FIELDS = frozenset({
+        'gname', 'gdesc', 'price', 'category', 'category_id', 'brand', 'weight_grams', 'hs_code', 'is_hot', 'is_new',
+        'name_i18n', 'description_i18n', 'brand_i18n',
+    })
+
     gname = models.CharField(max_length=100, unique=True, verbose_name="商品名")
     gdesc = models.TextField(max_length=100, verbose_name="商品描述")
     price = models.DecimalField(max_digits=7, decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='goods_set')
     brand = models.CharField(max_length=100)  # 品牌名称
-    stock = models.IntegerField(default=0)  # 库存
+    weight_grams = models.PositiveIntegerField(default=0, verbose_name="重量（克）")  # 用于计算运费
+    hs_code = models.CharField(max_length=12, blank=True, default='', verbose_name="HS 编码")  # 海关商品编码，用于计算进口关税
+    stock = models.IntegerField(default=0)  # 库存（分片库存的商品为各分片之和，由 goodsapp.stock 定期回写）
+    stock_shard_count = models.PositiveSmallIntegerField(default=0)  # >0 时库存拆分到 GoodsStockShard，降低行锁争用
     sales = models.IntegerField(default=0)  # 销量
+    views = models.IntegerField(default=0)  # 浏览量（由 goodsapp.counters 批量写回）
     is_hot = models.BooleanField(default=False)  # 是否热门
     is_new = models.BooleanField(default=False)  # 是否新品
     # 多语言字段
@@ -31,6 +82,13 @@ class Goods(models.Model):
     def __str__(self):
         return f'<Goods %s>' % self.gname
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的分类，商品换分类时用于更新旧分类的派生数据
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
     _I18N_FIELD_MAPPING = {
         'name': ('name_i18n', 'gname'),
         'description': ('description_i18n', 'gdesc'),
@@ -58,6 +116,15 @@ class Goods(models.Model):
         """获取指定语言的品牌名称"""
         return self._get_i18n_value('brand', lang)
 
+    @classmethod
+    def i18n_errors(cls, field, values) -> list[str]:
+        """翻译超出源字段长度时的错误信息（GoodsLocalized 的列按源字段长度建立）"""
+        limit = cls._meta.get_field(cls._I18N_FIELD_MAPPING[field][1]).max_length
+        if not limit or not isinstance(values, dict):
+            return []
+        return [f'{lang}: 长度不能超过 {limit} 个字符'
+                for lang, value in values.items() if value is not None and len(str(value)) > limit]
+
     def set_i18n(self, field, values):
         """设置多语言字段的值
         :param field: 字段名称（name/description/brand）
@@ -92,11 +159,148 @@ class GoodsDetailName(models.Model):
         return self.gdname
 
 
-class GoodsDetail(models.Model):
+class GoodsDetail(CatalogVersioned):
     gdurl = models.ImageField(upload_to='', verbose_name='图片地址')  # 默认media路径，已配置
     goodsdname = models.ForeignKey(GoodsDetailName, on_delete=models.CASCADE)
     goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='goodsdetail_set')
     is_main = models.BooleanField(default=False)  # 是否主图
+    # 缩略图等衍生图片：{'thumb': 'derivatives/ab/<sha256>-thumb.webp', ...}，按源文件内容哈希寻址
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    derivatives = JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            # 批量导入按 (商品, 图片路径) upsert
+            models.UniqueConstraint(fields=('goods', 'gdurl'), name='goods_detail_goods_url_uniq'),
+        ]
 
     def __str__(self):
         return f'{self.goods.gname} - {self.goodsdname.gdname}'
+
+
+class GoodsLocalized(models.Model):
+    """商品按语言展开的读模型，列表接口按语言直接查询，无需解析多语言 JSON"""
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='localized_set')
+    lang = models.CharField(max_length=8)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    brand = models.CharField(max_length=100, blank=True)
+    price = models.DecimalField(max_digits=7, decimal_places=2)
+    is_hot = models.BooleanField(default=False)
+    is_new = models.BooleanField(default=False)
+    main_image_url = models.CharField(max_length=255, blank=True)
+    main_image_variants = JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('goods', 'lang'), name='goods_localized_goods_lang_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=('lang', 'category'), name='goods_localized_lang_cat_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.lang})'
+
+
+class CatalogTombstone(models.Model):
+    """已删除的商品、图片和分类，增量同步时下发删除"""
+    KIND_CHOICES = (
+        ('goods', '商品'),
+        ('detail', '商品图片'),
+        ('category', '分类'),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    parent_id = models.BigIntegerField(null=True, blank=True)  # 图片所属的商品
+    catalog_version = models.BigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} @ {self.catalog_version}'
+
+    @classmethod
+    def record(cls, kind, object_id, parent_id=None):
+        with transaction.atomic():
+            return cls.objects.create(kind=kind, object_id=object_id, parent_id=parent_id,
+                                      catalog_version=CatalogSequence.allocate())
+
+
+class GoodsStockShard(models.Model):
+    """分片库存的一个子行；扣减随机选一个分片做条件更新，总库存为各分片之和"""
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('goods', 'shard'), name='goods_stock_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.goods_id}#{self.shard}: {self.quantity}'
+
+
+class GoodsCoPurchase(models.Model):
+    """共同购买稀疏矩阵的一个非零元素：同时出现 goods 和 related 的订单数"""
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='co_purchases')
+    related = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('goods', 'related'), name='goods_copurchase_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=('goods', '-count'), name='goods_copurchase_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.goods_id} -> {self.related_id} ({self.count})'
+
+
+# 商品写入后同步更新派生的读模型（联想索引、分面计数等）
+@receiver(post_save, sender=Goods)
+def goods_saved_handler(sender, instance=None, update_fields=None, **kwargs):
+    from goodsapp.changes import goods_saved
+
+    goods_saved(instance, update_fields=update_fields)
+
+
+@receiver(post_delete, sender=Goods)
+def goods_deleted_handler(sender, instance=None, **kwargs):
+    from goodsapp.changes import goods_deleted
+
+    CatalogTombstone.record('goods', instance.pk)
+    goods_deleted(instance)
+
+
+@receiver(post_save, sender=GoodsDetail)
+def goods_detail_saved_handler(sender, instance=None, update_fields=None, **kwargs):
+    from goodsapp.changes import goods_detail_saved
+
+    goods_detail_saved(instance, update_fields=update_fields)
+
+
+@receiver(post_delete, sender=GoodsDetail)
+def goods_detail_deleted_handler(sender, instance=None, **kwargs):
+    from goodsapp.changes import goods_detail_deleted
+
+    CatalogTombstone.record('detail', instance.pk, parent_id=instance.goods_id)
+    goods_detail_deleted(instance)
+
+
+@receiver(post_save, sender=Category)
+def category_saved_handler(sender, instance=None, **kwargs):
+    from goodsapp.changes import category_changed
+
+    category_changed()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted_handler(sender, instance=None, **kwargs):
+    from goodsapp.changes import category_changed
+
+    CatalogTombstone.record('category', instance.pk)
+    category_changed()
@@ -0,0 +1,139 @@
+"""Maintain the per-language ``GoodsLocalized`` read model.
+
+Rows are rebuilt whenever a goods write touches a projected field, so list
+endpoints read names, descriptions and brands per language from one indexed
+table instead of walking the i18n JSON of every goods per request. Reads never
+write: goods without rows (e.g. inserted by a raw ``bulk_create``) are built
+in memory and stored by the ``sync_localized_goods`` task.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+from .models import SUPPORTED_LANGUAGES, Goods, GoodsDetail, GoodsLocalized
+
+logger = logging.getLogger(__name__)
+
+# 影响读模型内容的 Goods 字段；只更新库存、销量等字段时无需重建
+PROJECTED_FIELDS = frozenset({
+    'gname', 'gdesc', 'brand', 'price', 'is_hot', 'is_new', 'category', 'category_id',
+    'name_i18n', 'description_i18n', 'brand_i18n',
+})
+_UPDATE_FIELDS = [
+    'category', 'name', 'description', 'brand', 'price', 'is_hot', 'is_new', 'main_image_url', 'main_image_variants',
+]
+
+
+def touches_projection(update_fields: Iterable[str] | None) -> bool:
+    return update_fields is None or bool(PROJECTED_FIELDS.intersection(update_fields))
+
+
+def main_images(goods_ids: Iterable[int]) -> dict[int, tuple[str, dict]]:
+    """Map goods ids to ``(main image url, variant urls)``."""
+    from .images import image_variants
+
+    images: dict[int, tuple[str, dict]] = {}
+    details = GoodsDetail.objects.filter(goods_id__in=list(goods_ids), is_main=True).order_by('id')
+    for goods_id, path, derivatives in details.values_list('goods_id', 'gdurl', 'derivatives'):
+        if goods_id not in images and path:
+            variants = image_variants(path=path, derivatives=derivatives)
+            images[goods_id] = (variants['full'], variants)
+    return images
+
+
+def _fit(column: str, value: str) -> str:
+    # 输入已按源字段长度校验；绕过校验写入的超长翻译在这里截断，不让整批同步失败
+    limit = GoodsLocalized._meta.get_field(column).max_length
+    return value[:limit] if limit and value else value
+
+
+def build_rows(goods: Goods, main_image: tuple[str, dict] = ('', {}),
+               languages: Iterable[str] = SUPPORTED_LANGUAGES) -> list[GoodsLocalized]:
+    main_image_url, main_image_variants = main_image
+    return [
+        GoodsLocalized(
+            goods_id=goods.id,
+            lang=lang,
+            category_id=goods.category_id,
+            name=_fit('name', goods.get_gname(lang)),
+            description=goods.get_gdesc(lang),
+            brand=_fit('brand', goods.get_brand(lang)),
+            price=goods.price,
+            is_hot=goods.is_hot,
+            is_new=goods.is_new,
+            main_image_url=main_image_url,
+            main_image_variants=main_image_variants,
+        )
+        for lang in languages
+    ]
+
+
+def sync_goods(goods_list: Iterable[Goods]) -> int:
+    """Upsert the localized rows of the given goods (one select plus one upsert)."""
+    goods_list = [goods for goods in goods_list if goods.pk is not None]
+    if not goods_list:
+        return 0
+    images = main_images(goods.id for goods in goods_list)
+    rows = [row for goods in goods_list for row in build_rows(goods, images.get(goods.id, ('', {})))]
+    GoodsLocalized.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['goods', 'lang'],
+        update_fields=_UPDATE_FIELDS,
+    )
+    return len(rows)
+
+
+def sync_goods_ids(goods_ids: Iterable[int]) -> int:
+    return sync_goods(Goods.objects.filter(id__in=list(goods_ids)))
+
+
+def refresh_main_image(goods_id: int | None) -> None:
+    if goods_id is None:
+        return
+    url, variants = main_images([goods_id]).get(goods_id, ('', {}))
+    GoodsLocalized.objects.filter(goods_id=goods_id).update(main_image_url=url, main_image_variants=variants)
+
+
+def localized_rows(goods_ids: list[int], lang: str, columns: Iterable[str] | None = None) -> list[GoodsLocalized]:
+    """Return projection rows for ``goods_ids`` in the given order, filling gaps.
+
+    ``columns`` restricts the loaded columns (``.only()``), e.g. to what a
+    sparse fieldset needs; ``goods`` is always loaded.
+    """
+    queryset = GoodsLocalized.objects.filter(lang=lang)
+    if columns is not None:
+        queryset = queryset.only('goods', *columns)
+    rows = {row.goods_id: row for row in queryset.filter(goods_id__in=goods_ids)}
+    missing = [goods_id for goods_id in goods_ids if goods_id not in rows]
+    if missing:  # 例如通过 bulk_create 写入、尚未同步的商品：本次在内存中构建，落库交给任务
+        images = main_images(missing)
+        for goods in Goods.objects.filter(id__in=missing):
+            rows[goods.id] = build_rows(goods, images.get(goods.id, ('', {})), languages=[lang])[0]
+        _schedule_sync(missing)
+    return [rows[goods_id] for goods_id in goods_ids if goods_id in rows]
+
+
+def _schedule_sync(goods_ids: list[int]) -> None:
+    try:
+        from .tasks import sync_localized_goods
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning("sync_localized_goods task unavailable: %s", exc)
+        return
+
+    try:
+        sync_localized_goods.delay(goods_ids)
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        logger.warning("Failed to enqueue GoodsLocalized sync: %s", exc)
+
+
+__all__ = [
+    'PROJECTED_FIELDS',
+    'localized_rows',
+    'refresh_main_image',
+    'sync_goods',
+    'sync_goods_ids',
+    'touches_projection',
+]
@@ -0,0 +1,277 @@
+"""Co-purchase ("bought together") recommendations.
+
+``GoodsCoPurchase`` stores the non-zero cells of the sparse goods x goods
+matrix: for every ordered pair, the number of orders containing both goods.
+:func:`rebuild` recomputes the matrix offline from ``Orderitem`` with NumPy.
+:func:`record_order` increments the cells of one new order (two queries), and
+the top-K neighbours of every touched goods are written back to the cache, so
+the endpoint answers with a single cache lookup.
+
+A rebuild scans the history up to the highest order id it sees, without a
+lock. It then takes the matrix lock, reads the orders placed since the scan,
+swaps the table and records the last order it counted as a watermark.
+:func:`record_order` runs under the same lock and skips orders at or below
+the watermark, so an order is counted exactly once whether its update ran
+before, during or after the rebuild. While the lock is held, updates raise
+:class:`RebuildInProgress` and the task retries them. An order whose id is
+below the watermark but which commits only after the rebuild is skipped
+until the next rebuild.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+
+from crossborder_trade.cache_utils import cache_lock
+
+from .models import GoodsCoPurchase
+
+try:  # pragma: no cover - optional dependency
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - executed when numpy isn't installed
+    np = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+_CACHE_PREFIX = 'goodsapp:recs'
+_GENERATION_KEY = f'{_CACHE_PREFIX}:generation'
+_WATERMARK_KEY = f'{_CACHE_PREFIX}:watermark'
+_LOCK_KEY = f'{_CACHE_PREFIX}:matrix'
+_LOCK_WAIT = 2
+# 重建持锁的上限：替换整张矩阵可能需要几分钟
+_REBUILD_LOCK_TIMEOUT = 1800
+
+
+class RebuildInProgress(Exception):
+    """The matrix lock is held by a rebuild; nothing was written, so the update can be retried."""
+
+
+def top_k() -> int:
+    return getattr(settings, 'RECOMMENDATION_TOP_K', 10)
+
+
+def _max_order_items() -> int:
+    # 超大订单（批发、测试单）产生 n² 个商品对且几乎没有推荐价值
+    return getattr(settings, 'RECOMMENDATION_MAX_ORDER_ITEMS', 50)
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 24 * 3600)
+
+
+def _generation() -> int:
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        cache.add(_GENERATION_KEY, 1, None)
+        generation = cache.get(_GENERATION_KEY, 1)
+    return int(generation)
+
+
+def _cache_key(goods_id: int, generation: int | None = None) -> str:
+    return f'{_CACHE_PREFIX}:{generation or _generation()}:{goods_id}'
+
+
+def _ranges(starts, sizes):
+    """Concatenation of ``arange(start, start + size)`` per entry, without a Python loop."""
+    offsets = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.repeat(starts, sizes) + offsets
+
+
+def co_purchase_pairs(order_ids, goods_ids, *, max_items: int | None = None):
+    """Count co-purchases from ``(order_id, goods_id)`` rows.
+
+    Rows must be distinct and sorted by order id. Returns ``(left, right,
+    counts)`` arrays with one entry per ordered pair, ``left != right``.
+    """
+    max_items = max_items or _max_order_items()
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    goods_ids = np.asarray(goods_ids, dtype=np.int64)
+    empty = np.empty(0, dtype=np.int64)
+    if order_ids.size == 0:
+        return empty, empty, empty
+
+    _, starts, sizes = np.unique(order_ids, return_index=True, return_counts=True)
+    keep = (sizes >= 2) & (sizes <= max_items)
+    starts, sizes = starts[keep], sizes[keep]
+    if starts.size == 0:
+        return empty, empty, empty
+
+    # 每个订单内部自连接：订单中每一行与同订单的每一行组成一对
+    row_index = _ranges(starts, sizes)
+    row_size = np.repeat(sizes, sizes)
+    left_rows = np.repeat(row_index, row_size)
+    right_rows = _ranges(np.repeat(starts, sizes), row_size)
+
+    distinct = left_rows != right_rows
+    goods, codes = np.unique(goods_ids, return_inverse=True)
+    keys = codes[left_rows[distinct]] * goods.size + codes[right_rows[distinct]]
+    pair_keys, counts = np.unique(keys, return_counts=True)
+    return goods[pair_keys // goods.size], goods[pair_keys % goods.size], counts.astype(np.int64)
+
+
+def top_neighbours(left, right, counts, k: int) -> dict[int, list[int]]:
+    """Top-``k`` neighbours per goods, by count then by id."""
+    if left.size == 0:
+        return {}
+    order = np.lexsort((right, -counts, left))
+    left, right = left[order], right[order]
+    group_start = np.flatnonzero(np.r_[True, left[1:] != left[:-1]])
+    rank = np.arange(left.size) - np.repeat(group_start, np.diff(np.r_[group_start, left.size]))
+    selected = rank < k
+    neighbours: dict[int, list[int]] = {}
+    for goods_id, related_id in zip(left[selected].tolist(), right[selected].tolist()):
+        neighbours.setdefault(goods_id, []).append(related_id)
+    return neighbours
+
+
+def _order_rows(**filters):
+    from orderapp.models import Orderitem
+
+    return list(
+        Orderitem.objects.filter(**filters).values_list('order_id', 'goods_id').distinct()
+        .order_by('order_id', 'goods_id')
+    )
+
+
+def rebuild() -> dict[str, int]:
+    """Recompute the whole matrix from ``Orderitem`` and repopulate the cache."""
+    if np is None:
+        raise RuntimeError('Rebuilding recommendations requires numpy')
+    from orderapp.models import Orderitem
+
+    high = Orderitem.objects.aggregate(high=Max('order_id'))['high'] or 0
+    rows = _order_rows(order_id__lte=high)
+    with cache_lock(_LOCK_KEY, timeout=_REBUILD_LOCK_TIMEOUT, wait=_LOCK_WAIT * 5) as acquired:
+        if not acquired:
+            raise RebuildInProgress('co-purchase matrix is locked by another rebuild')
+        # 扫描期间提交的订单在持锁后补读：它们的增量更新要么已被本次替换清掉，要么会因水位线被跳过
+        rows += _order_rows(order_id__gt=high)
+        watermark = rows[-1][0] if rows else 0
+        order_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        goods_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        left, right, counts = co_purchase_pairs(order_ids, goods_ids)
+
+        with transaction.atomic():
+            GoodsCoPurchase.objects.all().delete()
+            GoodsCoPurchase.objects.bulk_create(
+                (
+                    GoodsCoPurchase(goods_id=goods_id, related_id=related_id, count=count)
+                    for goods_id, related_id, count in zip(left.tolist(), right.tolist(), counts.tolist())
+                ),
+                batch_size=2000,
+            )
+        cache.set(_WATERMARK_KEY, watermark, None)
+
+    # 新一代缓存键一次写满后再切换，旧键自然过期
+    neighbours = top_neighbours(left, right, counts, top_k())
+    generation = _generation() + 1
+    cache.set_many(
+        {_cache_key(goods_id, generation): ids for goods_id, ids in neighbours.items()},
+        _cache_timeout(),
+    )
+    cache.set(_GENERATION_KEY, generation, None)
+    logger.info('Rebuilt co-purchase matrix: %s pairs for %s goods', left.size, len(neighbours))
+    return {'pairs': int(left.size), 'goods': len(neighbours)}
+
+
+def load_neighbours(goods_ids: Iterable[int]) -> dict[int, list[int]]:
+    """Read the top-K neighbours of ``goods_ids`` from the matrix (one query)."""
+    goods_ids = list(goods_ids)
+    neighbours: dict[int, list[int]] = {goods_id: [] for goods_id in goods_ids}
+    ranked = (
+        GoodsCoPurchase.objects.filter(goods_id__in=goods_ids)
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=[F('goods_id')],
+            order_by=[F('count').desc(), F('related_id')],
+        ))
+        .filter(rank__lte=top_k())
+        .order_by('goods_id', 'rank')
+        .values_list('goods_id', 'related_id')
+    )
+    for goods_id, related_id in ranked:
+        neighbours[goods_id].append(related_id)
+    return neighbours
+
+
+def refresh_cache(goods_ids: Iterable[int]) -> dict[int, list[int]]:
+    neighbours = load_neighbours(goods_ids)
+    generation = _generation()
+    cache.set_many({_cache_key(goods_id, generation): ids for goods_id, ids in neighbours.items()}, _cache_timeout())
+    return neighbours
+
+
+def record_order(goods_ids: Iterable[int], order_id: int | None = None) -> int:
+    """Add one order to the matrix; returns the number of pairs touched.
+
+    Orders at or below the last rebuild's watermark are already counted and
+    are skipped. Raises :class:`RebuildInProgress` while a rebuild holds the
+    matrix lock.
+    """
+    ids = sorted({int(goods_id) for goods_id in goods_ids})
+    if len(ids) < 2 or len(ids) > _max_order_items():
+        return 0
+    with cache_lock(_LOCK_KEY, wait=_LOCK_WAIT) as acquired:
+        if not acquired:
+            raise RebuildInProgress(f'co-purchase matrix is locked; order {order_id} not recorded yet')
+        if order_id is not None and order_id <= (cache.get(_WATERMARK_KEY) or 0):
+            return 0
+        with transaction.atomic():
+            # 先插入缺失的格子（计数为 0），再统一自增，并发订单也不会丢计数
+            GoodsCoPurchase.objects.bulk_create(
+                [
+                    GoodsCoPurchase(goods_id=goods_id, related_id=related_id, count=0)
+                    for goods_id in ids for related_id in ids if goods_id != related_id
+                ],
+                ignore_conflicts=True,
+            )
+            touched = GoodsCoPurchase.objects.filter(goods_id__in=ids, related_id__in=ids) \
+                .update(count=F('count') + 1)
+    refresh_cache(ids)
+    return touched
+
+
+def get_recommendations(goods_id: int) -> list[int]:
+    cached = cache.get(_cache_key(goods_id))
+    if cached is not None:
+        return cached
+    return refresh_cache([goods_id])[goods_id]
+
+
+def _schedule_update(goods_ids: list[int], order_id: int | None) -> None:
+    try:
+        from .tasks import update_recommendations
+    except Exception as exc:  # pragma: no cover - Celery optional
+        logger.warning('update_recommendations task unavailable: %s', exc)
+        return
+
+    try:
+        update_recommendations.delay(goods_ids, order_id)
+    except Exception as exc:  # pragma: no cover - Celery misconfigured
+        logger.warning('Failed to enqueue recommendation update: %s', exc)
+
+
+def on_order_created(event) -> None:
+    """``order.created`` subscriber: feed the order's goods to the matrix."""
+    goods_ids = [item['goods_id'] for item in event.payload.get('items', []) if item.get('goods_id')]
+    if len(set(goods_ids)) >= 2:
+        _schedule_update(goods_ids, event.payload.get('order_id'))
+
+
+__all__ = [
+    'RebuildInProgress',
+    'co_purchase_pairs',
+    'get_recommendations',
+    'load_neighbours',
+    'on_order_created',
+    'rebuild',
+    'record_order',
+    'refresh_cache',
+    'top_neighbours',
+]
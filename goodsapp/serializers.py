@@ -1,5 +1,60 @@
+from django.db import transaction
 from rest_framework import serializers
-from goodsapp.models import Category, Goods, GoodsDetail
+
+from goodsapp import stock
+from goodsapp.images import image_variants
+from goodsapp.models import Category, Goods, GoodsDetail, GoodsLocalized
+
+
+def parse_fields(request):
+    """?fields=id,gname,price -> ['id', 'gname', 'price']；未传时返回 None（输出全部字段）"""
+    value = request.query_params.get('fields') if hasattr(request, 'query_params') else request.GET.get('fields')
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    """稀疏字段集：只输出请求的字段，并给出查询需要读取的列，用于 .only()/.values() 下推"""
+    always_include = ('id',)
+    # 可输出的字段，默认为 Meta.fields
+    sparse_fields: tuple[str, ...] | None = None
+    # 输出字段 -> 依赖的模型列；未列出的按同名列处理，空元组表示不读本表的列
+    field_columns: dict[str, tuple[str, ...]] = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requested_fields = self.resolve_fields(fields)
+        if self.requested_fields is not None:
+            for name in list(self.fields):
+                if name not in self.requested_fields:
+                    self.fields.pop(name)
+
+    @classmethod
+    def output_fields(cls) -> tuple[str, ...]:
+        return tuple(cls.sparse_fields or cls.Meta.fields)
+
+    @classmethod
+    def resolve_fields(cls, fields) -> tuple[str, ...] | None:
+        """Known requested fields in declaration order (``None`` means all)."""
+        if fields is None:
+            return None
+        wanted = set(fields) | set(cls.always_include)
+        return tuple(name for name in cls.output_fields() if name in wanted)
+
+    @classmethod
+    def columns_for(cls, fields=None) -> list[str]:
+        columns: dict[str, None] = {}
+        for name in cls.resolve_fields(fields) or cls.output_fields():
+            columns.update(dict.fromkeys(cls.field_columns.get(name, (name,))))
+        return list(columns)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.requested_fields is not None:
+            for key in [key for key in data if key not in self.requested_fields]:
+                data.pop(key)
+        return data
 
 
 # 类名获取序列化器
@@ -10,37 +65,96 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class GoodsDetailSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = GoodsDetail
-        fields = ['id', 'gdurl', 'is_main']
+        fields = ['id', 'gdurl', 'is_main', 'variants']
+
+    @staticmethod
+    def get_variants(obj):
+        return image_variants(obj)
+
+
+class GoodsImageSyncSerializer(GoodsDetailSerializer):
+    """增量同步下发的商品图片，带所属商品 ID"""
+    class Meta(GoodsDetailSerializer.Meta):
+        fields = ['id', 'goods', 'gdurl', 'is_main', 'variants']
 
 
 class GoodsListSerializer(serializers.ModelSerializer):
     main_image = serializers.SerializerMethodField()
+    main_image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Goods
-        fields = ['id', 'gname', 'price', 'brand', 'is_hot', 'is_new', 'main_image']
+        fields = ['id', 'gname', 'price', 'brand', 'is_hot', 'is_new', 'main_image', 'main_image_variants']
 
     @staticmethod
-    def get_main_image(obj):
-        main_detail = obj.goodsdetail_set.filter(is_main=True).first()
+    def _main_detail(obj):
+        # 同一对象的两个字段共用一次查询
+        if not hasattr(obj, '_main_detail'):
+            obj._main_detail = obj.goodsdetail_set.filter(is_main=True).first()
+        return obj._main_detail
+
+    def get_main_image(self, obj):
+        main_detail = self._main_detail(obj)
         if main_detail:
             return main_detail.gdurl.url
         return None
 
+    def get_main_image_variants(self, obj):
+        main_detail = self._main_detail(obj)
+        return image_variants(main_detail) if main_detail else None
+
+
+class GoodsLocalizedListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """基于 GoodsLocalized 读模型的列表序列化器，输出与 GoodsListSerializer 保持一致"""
+    field_columns = {
+        'id': ('goods',),
+        'gname': ('name',),
+        'main_image': ('main_image_url',),
+        'main_image_variants': ('main_image_variants',),
+    }
+    id = serializers.IntegerField(source='goods_id')
+    gname = serializers.CharField(source='name')
+    main_image = serializers.SerializerMethodField()
+    main_image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GoodsLocalized
+        fields = ['id', 'gname', 'price', 'brand', 'is_hot', 'is_new', 'main_image', 'main_image_variants']
+
+    @staticmethod
+    def get_main_image(obj):
+        return obj.main_image_url or None
+
+    @staticmethod
+    def get_main_image_variants(obj):
+        return obj.main_image_variants or None
+
+
+class GoodsDetailPageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    field_columns = {'images': ()}  # 图片来自 prefetch
 
-class GoodsDetailPageSerializer(serializers.ModelSerializer):
     category = CategorySerializer()
     images = GoodsDetailSerializer(source='goodsdetail_set', many=True)
 
     class Meta:
         model = Goods
-        fields = ['id', 'gname', 'gdesc', 'price', 'brand', 'stock', 'sales',
+        fields = ['id', 'gname', 'gdesc', 'price', 'brand', 'stock', 'sales', 'views',
                   'is_hot', 'is_new', 'category', 'images', ]
 
 
-class GoodsSerializer(serializers.ModelSerializer):
+class GoodsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    sparse_fields = ('id', 'name', 'description', 'brand', 'price', 'hs_code', 'weight_grams', 'stock', 'sales',
+                     'is_hot', 'is_new', 'category')
+    field_columns = {
+        'name': ('gname', 'name_i18n'),
+        'description': ('gdesc', 'description_i18n'),
+        'brand': ('brand', 'brand_i18n'),
+    }
+
     name_i18n = serializers.JSONField(write_only=True, required=False)
     description_i18n = serializers.JSONField(write_only=True, required=False)
     brand_i18n = serializers.JSONField(write_only=True, required=False)
@@ -53,6 +167,8 @@ class GoodsSerializer(serializers.ModelSerializer):
             'gdesc',
             'brand',
             'price',
+            'hs_code',
+            'weight_grams',
             'stock',
             'sales',
             'is_hot',
@@ -88,13 +204,34 @@ class GoodsSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         lang = self.context.get('language', 'zh')
-        data['name'] = instance.get_gname(lang)
-        data['description'] = instance.get_gdesc(lang)
-        data['brand'] = instance.get_brand(lang)
+        requested = self.requested_fields
+        # 只解析请求的多语言字段，未请求的列不会被 .only() 读取
+        for key, getter in (('name', instance.get_gname), ('description', instance.get_gdesc),
+                            ('brand', instance.get_brand)):
+            if requested is None or key in requested:
+                data[key] = getter(lang)
         data.pop('gname', None)
         data.pop('gdesc', None)
         return data
 
+    @staticmethod
+    def _validate_i18n(field, values):
+        if values is not None and not isinstance(values, dict):
+            raise serializers.ValidationError('必须是 {语言: 文本} 对象')
+        errors = Goods.i18n_errors(field, values)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return values
+
+    def validate_name_i18n(self, values):
+        return self._validate_i18n('name', values)
+
+    def validate_description_i18n(self, values):
+        return self._validate_i18n('description', values)
+
+    def validate_brand_i18n(self, values):
+        return self._validate_i18n('brand', values)
+
     @staticmethod
     def _extract_i18n_fields(validated_data):
         payload = {}
@@ -115,21 +252,30 @@ class GoodsSerializer(serializers.ModelSerializer):
                         validated_data.setdefault(base_field, default_value)
         return payload
 
-    def _update_i18n_fields(self, instance, payload):
-        updated_fields = set()
+    @staticmethod
+    def _apply_i18n_fields(instance, payload):
         for field, values in payload.items():
             if values is not None:
-                updated_fields.update(instance.set_i18n(field, values))
-        if updated_fields:
-            instance.save(update_fields=list(updated_fields))
+                instance.set_i18n(field, values)
         return instance
 
     def create(self, validated_data):
+        # 多语言字段在第一次保存前写入，只保存一次；post_save 会同步 GoodsLocalized 读模型
         i18n_payload = self._extract_i18n_fields(validated_data)
-        instance = super().create(validated_data)
-        return self._update_i18n_fields(instance, i18n_payload)
+        instance = self._apply_i18n_fields(Goods(**validated_data), i18n_payload)
+        instance.save()
+        return instance
 
     def update(self, instance, validated_data):
         i18n_payload = self._extract_i18n_fields(validated_data)
-        instance = super().update(instance, validated_data)
-        return self._update_i18n_fields(instance, i18n_payload)
+        # 分片库存的商品：Goods.stock 只是副本，新库存写入各分片，否则下次 rebalance 会把它改回去
+        total = validated_data.pop('stock', None) if instance.stock_shard_count else None
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        self._apply_i18n_fields(instance, i18n_payload)
+        with transaction.atomic():
+            instance.save()
+            if total is not None:
+                stock.set_total(instance.id, total)
+                instance.stock = total
+        return instance
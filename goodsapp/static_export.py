@@ -0,0 +1,276 @@
+"""Static snapshot of the public catalog.
+
+:class:`CatalogExporter` writes everything the browse pages need as JSON
+files under one directory, per language::
+
+    <root>/manifest.json
+    <root>/<lang>/categories.json
+    <root>/<lang>/categories/<category id>/page-<n>.json
+    <root>/<lang>/goods/<goods id>.json
+
+A reverse proxy can serve these files during traffic spikes without
+touching Django. ``manifest.json`` lists the SHA-256 of every file, the
+catalog sequence value the export started from, and the category of every
+exported goods.
+
+Runs are incremental. The next run reads only the goods, images and
+categories with a ``catalog_version`` above the manifest version, plus the
+tombstones of deleted rows. It re-renders those goods and the listing pages
+of the categories they left or joined. A file whose content hash is
+unchanged is not rewritten. Every file is replaced atomically, and the
+manifest is written last.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from . import detail_cache, projections
+from .models import SUPPORTED_LANGUAGES, CatalogTombstone, Category, Goods, GoodsDetail
+from .sync import current_version
+
+try:  # pragma: no cover - fcntl is unavailable on Windows
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+MANIFEST_NAME = 'manifest.json'
+_FORMAT = 1
+_CHUNK = 500
+
+
+def export_dir() -> str:
+    return getattr(settings, 'CATALOG_EXPORT_DIR', os.path.join(settings.BASE_DIR, 'var', 'catalog'))
+
+
+def default_page_size() -> int:
+    return getattr(settings, 'CATALOG_EXPORT_PAGE_SIZE', 50)
+
+
+@dataclass
+class ExportStats:
+    version: int = 0
+    full: bool = True
+    goods: int = 0
+    categories: int = 0
+    written: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+@contextmanager
+def _export_lock(root: str):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+class CatalogExporter:
+    def __init__(self, root: str | None = None, *, languages: Iterable[str] = SUPPORTED_LANGUAGES,
+                 page_size: int | None = None, full: bool = False):
+        self.root = root or export_dir()
+        self.languages = tuple(languages)
+        self.page_size = page_size or default_page_size()
+        self.full = full
+        self._renderer = JSONRenderer()
+
+    # -- files -------------------------------------------------------------
+
+    def _path(self, relpath: str) -> str:
+        return os.path.join(self.root, *relpath.split('/'))
+
+    def _write_bytes(self, relpath: str, body: bytes) -> None:
+        path = self._path(relpath)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.export-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(body)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _write(self, relpath: str, payload) -> None:
+        body = self._renderer.render(payload)
+        digest = hashlib.sha256(body).hexdigest()
+        if self._files.get(relpath) == digest and os.path.exists(self._path(relpath)):
+            self.stats.unchanged += 1
+            return
+        self._write_bytes(relpath, body)
+        self._files[relpath] = digest
+        self.stats.written += 1
+
+    def _remove(self, relpath: str) -> None:
+        if self._files.pop(relpath, None) is not None or os.path.exists(self._path(relpath)):
+            try:
+                os.unlink(self._path(relpath))
+            except FileNotFoundError:
+                pass
+            self.stats.removed += 1
+
+    def _load_manifest(self) -> dict | None:
+        try:
+            with open(self._path(MANIFEST_NAME), encoding='utf-8') as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        # 语言或分页大小变化后旧文件无法复用，按全量导出
+        if manifest.get('format') != _FORMAT or manifest.get('page_size') != self.page_size \
+                or manifest.get('languages') != list(self.languages):
+            return None
+        return manifest
+
+    # -- export ------------------------------------------------------------
+
+    def run(self) -> ExportStats:
+        with _export_lock(self.root):
+            return self._run()
+
+    def _run(self) -> ExportStats:
+        self.stats = ExportStats()
+        manifest = self._load_manifest()
+        full = self.full or manifest is None
+        self.stats.full = full
+        # 先取序号再读数据：导出期间提交的写入下次还会再导出一次，不会遗漏
+        version = current_version()
+        # 全量导出也沿用旧清单中的哈希，内容未变的文件不重写
+        self._files: dict[str, str] = dict(manifest['files']) if manifest else {}
+        goods_categories: dict[int, int] = {int(k): v for k, v in manifest['goods'].items()} if manifest else {}
+        page_counts: dict[int, int] = {int(k): v for k, v in manifest['pages'].items()} if manifest else {}
+
+        if full:
+            current_categories = dict(Goods.objects.values_list('id', 'category_id'))
+            changed = set(current_categories)
+            deleted: set[int] = set(goods_categories) - changed
+            categories_changed = True
+            touched_categories = set(Category.objects.values_list('id', flat=True)) | set(page_counts)
+        else:
+            since = manifest['version']
+            changed = set(Goods.objects.filter(catalog_version__gt=since).values_list('id', flat=True))
+            changed |= set(GoodsDetail.objects.filter(catalog_version__gt=since).values_list('goods_id', flat=True))
+            tombstones = list(CatalogTombstone.objects.filter(catalog_version__gt=since)
+                              .values_list('kind', 'object_id', 'parent_id'))
+            deleted = {object_id for kind, object_id, _ in tombstones if kind == 'goods'}
+            changed |= {parent_id for kind, _, parent_id in tombstones if kind == 'detail' and parent_id}
+            changed_categories = set(Category.objects.filter(catalog_version__gt=since).values_list('id', flat=True))
+            deleted_categories = {object_id for kind, object_id, _ in tombstones if kind == 'category'}
+            categories_changed = bool(changed_categories or deleted_categories)
+            touched_categories = changed_categories | deleted_categories
+            changed -= deleted
+            current_categories = {}
+            for chunk in _chunks(sorted(changed), _CHUNK):
+                current_categories.update(Goods.objects.filter(id__in=chunk).values_list('id', 'category_id'))
+            deleted |= changed - set(current_categories)  # 导出期间被删除
+
+        # 商品详情：分批加载，同一批内所有语言共用一次详情查询
+        for chunk in _chunks(sorted(current_categories), _CHUNK):
+            self._export_goods(chunk)
+        for goods_id in deleted:
+            for lang in self.languages:
+                self._remove(f'{lang}/goods/{goods_id}.json')
+
+        for goods_id in deleted | set(current_categories):
+            previous = goods_categories.pop(goods_id, None)
+            if previous is not None:
+                touched_categories.add(previous)
+        for goods_id, category_id in current_categories.items():
+            goods_categories[goods_id] = category_id
+            touched_categories.add(category_id)
+
+        categories = {category['id']: category for category in self._category_payloads()}
+        if categories_changed:
+            for lang in self.languages:
+                self._write(f'{lang}/categories.json', {'categories': list(categories.values())})
+        for category_id in sorted(touched_categories):
+            page_counts[category_id] = self._export_listing(category_id, categories.get(category_id),
+                                                            page_counts.get(category_id, 0))
+            if not page_counts[category_id]:
+                del page_counts[category_id]
+
+        self.stats.version = version
+        self.stats.goods = len(current_categories)
+        self.stats.categories = len(touched_categories)
+        manifest = {
+            'format': _FORMAT,
+            'version': version,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'languages': list(self.languages),
+            'page_size': self.page_size,
+            'pages': {str(category_id): count for category_id, count in sorted(page_counts.items())},
+            'goods': {str(goods_id): category_id for goods_id, category_id in sorted(goods_categories.items())},
+            'files': dict(sorted(self._files.items())),
+        }
+        self._write_bytes(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1).encode())
+        self.stats.elapsed = time.perf_counter() - self.stats.started
+        return self.stats
+
+    def _category_payloads(self) -> list[dict]:
+        from .serializers import CategorySerializer
+
+        return list(CategorySerializer(Category.objects.order_by('id'), many=True).data)
+
+    def _export_goods(self, goods_ids: list[int]) -> None:
+        details = detail_cache.load(goods_ids)
+        for lang in self.languages:
+            names = {row.goods_id: row for row in projections.localized_rows(
+                goods_ids, lang, ('name', 'description', 'brand'))}
+            for goods_id, data in details.items():
+                row = names.get(goods_id)
+                if row is not None:
+                    data = {**data, 'gname': row.name, 'gdesc': row.description, 'brand': row.brand}
+                self._write(f'{lang}/goods/{goods_id}.json', data)
+
+    def _export_listing(self, category_id: int, category: dict | None, previous_pages: int) -> int:
+        """Rewrite the listing pages of one category; returns the new page count."""
+        from .serializers import GoodsLocalizedListSerializer
+
+        goods_ids = [] if category is None else list(
+            Goods.objects.filter(category_id=category_id).order_by('id').values_list('id', flat=True)
+        )
+        pages = (len(goods_ids) + self.page_size - 1) // self.page_size
+        columns = GoodsLocalizedListSerializer.columns_for(None)
+        for lang in self.languages:
+            for number in range(1, pages + 1):
+                page_ids = goods_ids[(number - 1) * self.page_size:number * self.page_size]
+                rows = projections.localized_rows(page_ids, lang, columns)
+                self._write(f'{lang}/categories/{category_id}/page-{number}.json', {
+                    'category': category,
+                    'page': number,
+                    'pages': pages,
+                    'total': len(goods_ids),
+                    'goods': GoodsLocalizedListSerializer(rows, many=True).data,
+                })
+            for number in range(pages + 1, previous_pages + 1):
+                self._remove(f'{lang}/categories/{category_id}/page-{number}.json')
+        return pages
+
+
+__all__ = ['CatalogExporter', 'ExportStats', 'MANIFEST_NAME', 'default_page_size', 'export_dir']
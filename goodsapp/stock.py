@@ -0,0 +1,252 @@
+"""Goods stock decrements, with opt-in sharding for hot SKUs.
+
+Every checkout of a goods normally updates the same ``Goods.stock`` row, and
+during a promotion those updates queue behind one row lock. A goods with a
+non-zero ``stock_shard_count`` keeps its stock in that many
+``GoodsStockShard`` rows instead (``STOCK_SHARD_COUNT`` by default).
+:func:`decrement` runs a conditional
+``UPDATE ... SET quantity = quantity - n WHERE quantity >= n`` on a random
+shard, without reading the shards first, and walks the remaining shards when
+it is short. Only when no single
+shard holds ``n`` does it lock all shards in shard order and take the
+quantity from several of them. Concurrent checkouts of one SKU therefore
+mostly lock different rows.
+
+Uneven decrements leave some shards empty while others still hold stock.
+:func:`rebalance` (the ``rebalance-stock-shards`` beat task) spreads the total
+evenly again. It also writes the total back to ``Goods.stock``, which for
+sharded goods is a periodically refreshed copy. Reads that need the live
+total use :func:`available`, a sum of the shards cached for
+``STOCK_TOTAL_CACHE_SECONDS``. Every writer that sets the stock of a sharded
+goods (bulk updates, ``import_goods``, the goods serializer) goes through
+:func:`set_total`. A direct write to ``Goods.stock`` would be reverted by the
+next rebalance.
+
+:func:`decrement_many` takes the stock of several non-sharded goods in one
+``UPDATE`` with a ``CASE`` per goods, so checkout costs the same number of
+statements for one cart line or a hundred.
+"""
+from __future__ import annotations
+
+import random
+from typing import Iterable, Mapping
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import Goods, GoodsStockShard
+
+_CACHE_PREFIX = 'goodsapp:stock'
+
+
+def default_shard_count() -> int:
+    return getattr(settings, 'STOCK_SHARD_COUNT', 8)
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'STOCK_TOTAL_CACHE_SECONDS', 2)
+
+
+def _cache_key(goods_id: int) -> str:
+    return f'{_CACHE_PREFIX}:{goods_id}'
+
+
+def _split(total: int, count: int) -> list[int]:
+    if count < 1:
+        return []
+    base, extra = divmod(max(total, 0), count)
+    return [base + (1 if index < extra else 0) for index in range(count)]
+
+
+def shard_count(goods_id: int) -> int:
+    """``Goods.stock_shard_count`` of ``goods_id`` (0 when not sharded)."""
+    return Goods.objects.filter(id=goods_id).values_list('stock_shard_count', flat=True).first() or 0
+
+
+def enable_sharding(goods_id: int, shards: int | None = None) -> None:
+    """Move the stock of ``goods_id`` into ``shards`` sub-rows."""
+    shards = shards or default_shard_count()
+    if shards < 1:
+        raise ValueError('shards must be positive')
+    with transaction.atomic():
+        goods = Goods.objects.select_for_update().only('stock', 'stock_shard_count').get(id=goods_id)
+        if goods.stock_shard_count:
+            return
+        GoodsStockShard.objects.filter(goods_id=goods_id).delete()
+        GoodsStockShard.objects.bulk_create([
+            GoodsStockShard(goods_id=goods_id, shard=index, quantity=quantity)
+            for index, quantity in enumerate(_split(goods.stock, shards))
+        ])
+        # update() 不触发信号：库存不属于同步字段
+        Goods.objects.filter(id=goods_id).update(stock_shard_count=shards)
+    cache.delete(_cache_key(goods_id))
+
+
+def disable_sharding(goods_id: int) -> None:
+    """Fold the shards of ``goods_id`` back into ``Goods.stock``."""
+    with transaction.atomic():
+        if not Goods.objects.select_for_update().filter(id=goods_id, stock_shard_count__gt=0).exists():
+            return
+        shards = GoodsStockShard.objects.select_for_update().filter(goods_id=goods_id).order_by('shard')
+        total = sum(shard.quantity for shard in shards)
+        GoodsStockShard.objects.filter(goods_id=goods_id).delete()
+        Goods.objects.filter(id=goods_id).update(stock=total, stock_shard_count=0)
+    cache.delete(_cache_key(goods_id))
+
+
+def _take_from_shards(goods_id: int, quantity: int, shards: int) -> bool:
+    start = random.randrange(shards)
+    for shard in (*range(start, shards), *range(start)):
+        taken = GoodsStockShard.objects.filter(goods_id=goods_id, shard=shard, quantity__gte=quantity) \
+            .update(quantity=F('quantity') - quantity)
+        if taken:
+            return True
+
+    # 没有单个分片够扣：按分片号顺序加锁后跨分片扣减（固定加锁顺序避免死锁）
+    with transaction.atomic():
+        rows = list(GoodsStockShard.objects.select_for_update().filter(goods_id=goods_id, quantity__gt=0)
+                    .order_by('shard'))
+        if sum(row.quantity for row in rows) < quantity:
+            return False
+        remaining = quantity
+        for row in rows:
+            part = min(row.quantity, remaining)
+            row.quantity -= part
+            remaining -= part
+            if not remaining:
+                break
+        GoodsStockShard.objects.bulk_update(rows, ['quantity'])
+    return True
+
+
+def decrement(goods_id: int, quantity: int, *, shards: int | None = None) -> bool:
+    """Take ``quantity`` units of ``goods_id``; returns False (and takes nothing) when short.
+
+    Pass ``shards`` when the caller already has ``Goods.stock_shard_count``
+    to save the lookup.
+    """
+    if quantity <= 0:
+        return True
+    if shards is None:
+        shards = shard_count(goods_id)
+    if shards:
+        return _take_from_shards(goods_id, quantity, shards)
+    return bool(Goods.objects.filter(id=goods_id, stock__gte=quantity).update(stock=F('stock') - quantity))
+
+
+class _Short(Exception):
+    pass
+
+
+def decrement_many(quantities: Mapping[int, int]) -> int | None:
+    """Take ``{goods id: quantity}`` of non-sharded goods with one conditional ``UPDATE``.
+
+    Returns None on success. When any goods is short, nothing is taken and
+    the first short goods id is returned.
+    """
+    quantities = {goods_id: quantity for goods_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return None
+    wanted = Case(*(When(id=goods_id, then=Value(quantity)) for goods_id, quantity in quantities.items()),
+                  output_field=IntegerField())
+    try:
+        with transaction.atomic():  # 部分商品不足时回滚已扣减的行
+            taken = Goods.objects.filter(id__in=list(quantities), stock__gte=wanted).update(stock=F('stock') - wanted)
+            if taken != len(quantities):
+                raise _Short
+    except _Short:
+        stocks = dict(Goods.objects.filter(id__in=list(quantities)).values_list('id', 'stock'))
+        return next((goods_id for goods_id in sorted(quantities) if stocks.get(goods_id, 0) < quantities[goods_id]),
+                    min(quantities))
+    return None
+
+
+def increment(goods_id: int, quantity: int, *, shards: int | None = None) -> None:
+    """Return ``quantity`` units of ``goods_id`` (expired or cancelled orders)."""
+    if quantity <= 0:
+        return
+    if shards is None:
+        shards = shard_count(goods_id)
+    if shards and GoodsStockShard.objects.filter(goods_id=goods_id, shard=random.randrange(shards)) \
+            .update(quantity=F('quantity') + quantity):
+        return
+    if Goods.objects.filter(id=goods_id, stock_shard_count=0).update(stock=F('stock') + quantity):
+        return
+    # 分片商品的 Goods.stock 会被 rebalance() 用分片之和覆盖：随机分片不存在时加到现有的第一个分片
+    shard = GoodsStockShard.objects.filter(goods_id=goods_id).order_by('shard').values_list('shard', flat=True).first()
+    if shard is not None:
+        GoodsStockShard.objects.filter(goods_id=goods_id, shard=shard).update(quantity=F('quantity') + quantity)
+
+
+def set_total(goods_id: int, total: int) -> None:
+    """Overwrite the stock of a sharded goods and its ``Goods.stock`` copy."""
+    with transaction.atomic():
+        rows = list(GoodsStockShard.objects.select_for_update().filter(goods_id=goods_id).order_by('shard'))
+        for row, quantity in zip(rows, _split(total, len(rows))):
+            row.quantity = quantity
+        GoodsStockShard.objects.bulk_update(rows, ['quantity'])
+        Goods.objects.filter(id=goods_id).update(stock=total)
+    cache.delete(_cache_key(goods_id))
+
+
+def available_many(goods_ids: Iterable[int]) -> dict[int, int]:
+    """Current stock of ``goods_ids``; totals of sharded goods are cached briefly."""
+    goods_ids = list(dict.fromkeys(goods_ids))
+    totals = dict(Goods.objects.filter(id__in=goods_ids, stock_shard_count=0).values_list('id', 'stock'))
+    sharded = [goods_id for goods_id in goods_ids if goods_id not in totals]
+    if not sharded:
+        return totals
+    cached = cache.get_many([_cache_key(goods_id) for goods_id in sharded])
+    missing = [goods_id for goods_id in sharded if _cache_key(goods_id) not in cached]
+    totals.update((goods_id, cached[_cache_key(goods_id)]) for goods_id in sharded if goods_id not in missing)
+    if missing:
+        summed = dict(GoodsStockShard.objects.filter(goods_id__in=missing).values('goods_id')
+                      .annotate(total=Sum('quantity')).values_list('goods_id', 'total'))
+        cache.set_many({_cache_key(goods_id): total for goods_id, total in summed.items()}, _cache_timeout())
+        totals.update(summed)
+    return totals
+
+
+def available(goods_id: int) -> int:
+    return available_many([goods_id]).get(goods_id, 0)
+
+
+def rebalance(goods_id: int) -> int:
+    """Spread the stock of ``goods_id`` evenly over its shards; returns the total."""
+    with transaction.atomic():
+        rows = list(GoodsStockShard.objects.select_for_update().filter(goods_id=goods_id).order_by('shard'))
+        total = sum(row.quantity for row in rows)
+        changed = []
+        for row, quantity in zip(rows, _split(total, len(rows))):
+            if row.quantity != quantity:
+                row.quantity = quantity
+                changed.append(row)
+        if changed:
+            GoodsStockShard.objects.bulk_update(changed, ['quantity'])
+        Goods.objects.filter(id=goods_id).exclude(stock=total).update(stock=total)
+    cache.set(_cache_key(goods_id), total, _cache_timeout())
+    return total
+
+
+def rebalance_all() -> dict[int, int]:
+    """Rebalance every sharded goods, one short transaction each."""
+    goods_ids = Goods.objects.filter(stock_shard_count__gt=0).values_list('id', flat=True)
+    return {goods_id: rebalance(goods_id) for goods_id in list(goods_ids)}
+
+
+__all__ = [
+    'available',
+    'available_many',
+    'decrement',
+    'decrement_many',
+    'default_shard_count',
+    'disable_sharding',
+    'enable_sharding',
+    'increment',
+    'rebalance',
+    'rebalance_all',
+    'set_total',
+    'shard_count',
+]
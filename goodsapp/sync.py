@@ -0,0 +1,88 @@
+"""Catalog delta sync for mobile clients.
+
+``Goods``, ``GoodsDetail`` and ``Category`` carry an indexed
+``catalog_version`` drawn from one database sequence row
+(:class:`~goodsapp.models.CatalogSequence`) on every write that changes
+synced data; deletes leave a :class:`~goodsapp.models.CatalogTombstone`
+with its own version. The sequence row stays locked until the writing
+transaction commits, so versions become visible in order and a client that
+has seen version ``v`` can never miss a later commit below ``v``.
+
+:func:`changes_since` returns the rows above a client's token in version
+order. Versions are unique across the three tables and the tombstones, so
+a page is cut at an exact version and ``next_since`` is a plain integer.
+Stock, sales and views change on every order and page view; they do not get
+new versions and are not part of the feed.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from .models import CatalogSequence, CatalogTombstone, Category, Goods, GoodsDetail
+
+SYNC_GOODS_FIELDS = ('id', 'name', 'description', 'brand', 'price', 'hs_code', 'weight_grams', 'is_hot', 'is_new',
+                     'category')
+_DELETED_KINDS = {'goods': 'goods', 'detail': 'images', 'category': 'categories'}
+
+
+def page_size() -> int:
+    return getattr(settings, 'CATALOG_SYNC_PAGE_SIZE', 500)
+
+
+def current_version() -> int:
+    return CatalogSequence.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+
+@dataclass
+class ChangePage:
+    since: int
+    next_since: int
+    has_more: bool = False
+    reset: bool = False
+    goods: list = field(default_factory=list)
+    images: list = field(default_factory=list)
+    categories: list = field(default_factory=list)
+    deleted: dict[str, list[int]] = field(default_factory=lambda: {key: [] for key in _DELETED_KINDS.values()})
+
+
+def changes_since(since: int, limit: int | None = None, lang: str = 'zh') -> ChangePage:
+    """Changes with ``catalog_version > since``, at most ``limit`` rows in total.
+
+    A token ahead of the sequence (for example after a database restore)
+    restarts the client from zero with ``reset`` set.
+    """
+    from .serializers import CategorySerializer, GoodsImageSyncSerializer, GoodsSerializer
+
+    limit = min(limit or page_size(), page_size())
+    reset = since > current_version()
+    if reset:
+        since = 0
+    sources = {
+        'goods': Goods.objects.only('catalog_version', *GoodsSerializer.columns_for(SYNC_GOODS_FIELDS)),
+        'images': GoodsDetail.objects.all(),
+        'categories': Category.objects.all(),
+        'deleted': CatalogTombstone.objects.all(),
+    }
+    # 每个来源最多取 limit + 1 行，合并后按版本截断
+    rows = {
+        name: list(queryset.filter(catalog_version__gt=since).order_by('catalog_version')[:limit + 1])
+        for name, queryset in sources.items()
+    }
+    versions = sorted(row.catalog_version for source in rows.values() for row in source)
+    has_more = len(versions) > limit
+    upto = versions[limit - 1] if has_more else (versions[-1] if versions else since)
+    rows = {name: [row for row in source if row.catalog_version <= upto] for name, source in rows.items()}
+
+    page = ChangePage(since=since, next_since=upto, has_more=has_more, reset=reset)
+    page.goods = list(GoodsSerializer(rows['goods'], many=True, fields=SYNC_GOODS_FIELDS,
+                                      context={'language': lang}).data)
+    page.images = list(GoodsImageSyncSerializer(rows['images'], many=True).data)
+    page.categories = list(CategorySerializer(rows['categories'], many=True).data)
+    for tombstone in rows['deleted']:
+        page.deleted[_DELETED_KINDS[tombstone.kind]].append(tombstone.object_id)
+    return page
+
+
+__all__ = ['ChangePage', 'SYNC_GOODS_FIELDS', 'changes_since', 'current_version', 'page_size']
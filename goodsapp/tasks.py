@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import time
+
+from crossborder_trade.celery_compat import get_task_logger, shared_task
+
+from . import autocomplete, feeds, homepage, images, leaderboard, projections, recommendations, stock
+from .models import Goods, GoodsDetail
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def refresh_autocomplete_index(self, goods_ids: list[int] | None = None) -> dict:
+    """Patch the autocomplete snapshot for changed goods, or rebuild it entirely."""
+    if goods_ids:
+        updated = autocomplete.update_index(goods_ids)
+        logger.debug("Patched autocomplete snapshot for %s goods", updated)
+        return {"mode": "incremental", "goods": updated}
+
+    total = autocomplete.rebuild_index()
+    return {"mode": "full", "goods": total}
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(OSError,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def generate_image_derivatives(self, detail_id: int, force: bool = False) -> dict:
+    """Render the WebP thumb/medium derivatives of one ``GoodsDetail`` image."""
+    detail = GoodsDetail.objects.filter(pk=detail_id).first()
+    if detail is None:
+        logger.info("GoodsDetail %s no longer exists; skipping derivatives", detail_id)
+        return {"detail": detail_id, "derivatives": {}}
+
+    try:
+        derivatives = images.generate_derivatives(detail, force=force)
+    except FileNotFoundError:
+        # 源文件缺失重试也无济于事
+        logger.warning("Source image of GoodsDetail %s is missing: %s", detail_id, detail.gdurl.name)
+        return {"detail": detail_id, "missing": True}
+    except images.InvalidImage as exc:
+        # 损坏或非图片文件：不是 OSError，不会触发自动重试
+        logger.warning("Source image of GoodsDetail %s cannot be decoded (%s): %s", detail_id, detail.gdurl.name, exc)
+        return {"detail": detail_id, "invalid": True}
+    return {"detail": detail_id, "hash": detail.content_hash, "derivatives": derivatives}
+
+
+@shared_task(bind=True, max_retries=20)
+def update_recommendations(self, goods_ids: list[int], order_id: int | None = None) -> dict:
+    """Add one new order to the co-purchase matrix.
+
+    Only retried while a rebuild holds the matrix lock, when nothing has been
+    written yet; any other retry after a committed increment would count the
+    order twice. Missed orders are picked up by the nightly rebuild.
+    """
+    try:
+        touched = recommendations.record_order(goods_ids, order_id)
+    except recommendations.RebuildInProgress as exc:
+        raise self.retry(exc=exc, countdown=30)
+    return {"mode": "incremental", "pairs": touched}
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def rebuild_recommendations(self) -> dict:
+    """Recompute the co-purchase matrix from the full order history."""
+    return {"mode": "full", **recommendations.rebuild()}
+
+
+@shared_task(bind=True, max_retries=5)
+def update_leaderboards(self, lines: list[dict], occurred_at: float | None = None, pending: list | None = None) -> dict:
+    """Count the units of one order in the hot-products leaderboards.
+
+    Only buckets whose lock was busy are retried (``pending``); a plain retry
+    would count the other buckets twice.
+    """
+    occurred_at = time.time() if occurred_at is None else occurred_at
+    try:
+        if pending is not None:
+            busy = leaderboard.apply_pending(pending, now=occurred_at)
+            if busy:
+                raise leaderboard.BucketsBusy(busy)
+            return {"buckets": len(pending)}
+        missing = {line["goods_id"] for line in lines if line.get("category_id") is None}
+        if missing:  # 旧格式的事件没有 category_id
+            categories = dict(Goods.objects.filter(id__in=missing).values_list("id", "category_id"))
+            lines = [
+                {**line, "category_id": categories.get(line["goods_id"])} if line.get("category_id") is None else line
+                for line in lines
+            ]
+        return {"units": leaderboard.record_sales(lines, now=occurred_at)}
+    except leaderboard.BucketsBusy as exc:
+        # 按原发生时间重试，单位仍记入原来的桶
+        raise self.retry(exc=exc, args=([], occurred_at), kwargs={"pending": exc.pending},
+                         countdown=1 + self.request.retries)
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def sync_localized_goods(self, goods_ids: list[int]) -> dict:
+    """Store the ``GoodsLocalized`` rows of goods that a read found missing."""
+    return {"rows": projections.sync_goods_ids(goods_ids)}
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def rebuild_homepage(self) -> dict:
+    """Re-render the pre-rendered homepage payload of every language."""
+    return {"version": homepage.rebuild()}
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def generate_feeds(self) -> dict:
+    """Rewrite the sitemap and product feed shards whose goods changed."""
+    stats = feeds.write_feeds()
+    return {"shards": stats.shards, "written": stats.written, "removed": stats.removed}
+
+
+@shared_task(bind=True)
+def rebalance_stock_shards(self) -> dict:
+    """Even out the stock shards of every sharded goods and refresh ``Goods.stock`` (runs every minute)."""
+    return {"totals": stock.rebalance_all()}
@@ -1,3 +1,1390 @@
-from django.test import TestCase
+from __future__ import annotations
 
-# Create your tests here.
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from itertools import permutations
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from eventstream.models import OutboxEvent
+from userapp.models import UserInfo
+
+from . import autocomplete, bulk, columnar, counters, facets, feeds, homepage, images, leaderboard, projections, \
+    recommendations, stock
+from .changes import bump_catalog_version, get_catalog_version
+from .models import Category, Goods, GoodsCoPurchase, GoodsDetail, GoodsDetailName, GoodsLocalized, GoodsStockShard
+from .serializers import GoodsDetailPageSerializer, GoodsLocalizedListSerializer, GoodsSerializer
+from .static_export import CatalogExporter
+
+
+class TempSnapshotMixin:
+    """Point the autocomplete snapshot at a throwaway directory."""
+
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        self._snapshot_dir = tempfile.TemporaryDirectory()
+        self._settings_override = override_settings(
+            AUTOCOMPLETE_SNAPSHOT_PATH=os.path.join(self._snapshot_dir.name, 'autocomplete.idx')
+        )
+        self._settings_override.enable()
+
+    def tearDown(self):  # type: ignore[override]
+        self._settings_override.disable()
+        self._snapshot_dir.cleanup()
+        super().tearDown()
+
+
+class AutocompleteIndexTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        self.category = Category.objects.create(cname='Phones')
+        self.phone = self._create_goods('智能手机', 'Smart Phone', sales=50)
+        self.charger = self._create_goods('手机充电器', 'Phone Charger', sales=80)
+        self.case = self._create_goods('平板保护壳', 'Tablet Case', sales=5)
+
+    def _create_goods(self, zh_name, en_name, *, sales):
+        return Goods.objects.create(
+            gname=zh_name,
+            gdesc=zh_name,
+            price=Decimal('9.99'),
+            category=self.category,
+            brand='BrandX',
+            sales=sales,
+            name_i18n={'zh': zh_name, 'en': en_name},
+        )
+
+    def test_prefix_matches_are_ranked_by_sales(self):
+        autocomplete.rebuild_index()
+
+        results = autocomplete.suggest('pho', 'en')
+        self.assertEqual([item['id'] for item in results], [self.charger.id, self.phone.id])
+        self.assertEqual(results[0]['name'], 'Phone Charger')
+
+        zh_results = autocomplete.suggest('手机', 'zh')
+        self.assertEqual([item['id'] for item in zh_results], [self.charger.id])
+        self.assertEqual(autocomplete.suggest('Tab', 'en')[0]['id'], self.case.id)
+        self.assertEqual(autocomplete.suggest('xyz', 'en'), [])
+
+    def test_incremental_update_patches_changed_goods(self):
+        autocomplete.rebuild_index()
+
+        self.case.set_i18n('name', {'zh': '手机壳', 'en': 'Phone Case'})
+        self.case.sales = 100
+        self.case.save()
+        deleted_id = self.phone.id
+        self.phone.delete()
+        autocomplete.update_index([self.case.id, deleted_id])
+
+        results = autocomplete.suggest('phone', 'en')
+        self.assertEqual([item['id'] for item in results], [self.case.id, self.charger.id])
+        self.assertEqual(autocomplete.suggest('tab', 'en'), [])
+
+    def test_updates_go_to_the_delta_until_it_is_folded_in(self):
+        autocomplete.rebuild_index()
+        path = autocomplete._snapshot_path()
+        base_identity = autocomplete._file_identity(path)
+
+        self.phone.set_i18n('name', {'zh': '智能手机', 'en': 'Smart Phone Pro'})
+        self.phone.save()
+        autocomplete.update_index([self.phone.id])
+        self.assertEqual(autocomplete._file_identity(path), base_identity)
+        self.assertEqual(autocomplete.suggest('smart phone p', 'en')[0]['name'], 'Smart Phone Pro')
+
+        with override_settings(AUTOCOMPLETE_DELTA_MAX_GOODS=1):
+            autocomplete.update_index([self.charger.id])
+        self.assertFalse(os.path.exists(autocomplete._delta_path(path)))
+        self.assertEqual([item['id'] for item in autocomplete.suggest('pho', 'en')], [self.charger.id, self.phone.id])
+        self.assertEqual(autocomplete.suggest('smart phone p', 'en')[0]['id'], self.phone.id)
+
+    def test_replaced_snapshot_stays_readable(self):
+        autocomplete.rebuild_index()
+        previous = autocomplete.get_snapshot()
+        case_id = self.case.id
+        self.case.delete()
+        autocomplete.rebuild_index()
+
+        self.assertIsNot(autocomplete.get_snapshot(), previous)
+        self.assertEqual(previous.search('tab', 'en')[0]['id'], case_id)  # 其他线程仍持有旧映射
+        self.assertEqual(autocomplete.suggest('tab', 'en'), [])
+
+    def test_missing_snapshot_schedules_rebuild_instead_of_blocking(self):
+        cache.clear()
+        with patch('goodsapp.tasks.refresh_autocomplete_index.delay') as delay:
+            self.assertEqual(autocomplete.suggest('pho', 'en'), [])
+            self.assertEqual(autocomplete.suggest('pho', 'en'), [])
+        delay.assert_called_once_with()
+        self.assertFalse(os.path.exists(autocomplete._snapshot_path()))
+
+    def test_over_long_strings_are_cut_on_a_character_boundary(self):
+        name = 'a' + '手' * 30000  # 90001 字节，超过 16 位长度字段，截断点落在中文字符中间
+        path = autocomplete.write_snapshot({'zh': [autocomplete.IndexEntry(key='手机', name=name, goods_id=1, sales=0)]})
+        snapshot = autocomplete.PrefixIndexSnapshot(path)
+        self.addCleanup(snapshot.close)
+
+        [(_, entry)] = list(snapshot.iter_entries())
+        self.assertEqual(entry.name, 'a' + '手' * ((0xFFFF - 1) // 3))
+
+    def test_suggest_endpoint_respects_language_and_limit(self):
+        autocomplete.rebuild_index()
+        client = APIClient()
+
+        response = client.get(reverse('goods_suggest'), {'q': 'pho', 'lang': 'en', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['lang'], 'en')
+        self.assertEqual([item['id'] for item in response.data['suggestions']], [self.charger.id])
+
+
+@override_settings(GOODS_PRICE_BANDS=(0, 50, 100))
+class FacetIndexTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        facets.clear_local_caches()
+        self.addCleanup(facets.clear_local_caches)
+        self.category = Category.objects.create(cname='Audio')
+        self.other_category = Category.objects.create(cname='Video')
+        self.speaker = self._create_goods('Speaker', 'Sony', '30.00', is_hot=True)
+        self.headset = self._create_goods('Headset', 'Sony', '80.00', is_new=True)
+        self.earbuds = self._create_goods('Earbuds', 'Anker', '45.00', is_hot=True, is_new=True)
+        self.amp = self._create_goods('Amplifier', 'Anker', '150.00')
+
+    def _create_goods(self, name, brand, price, *, is_hot=False, is_new=False):
+        return Goods.objects.create(
+            gname=name,
+            gdesc=name,
+            price=Decimal(price),
+            category=self.category,
+            brand=brand,
+            is_hot=is_hot,
+            is_new=is_new,
+        )
+
+    def test_counts_for_filter_combinations(self):
+        index = facets.build_facet_index(self.category.id)
+
+        self.assertEqual(index.count({}), 4)
+        self.assertEqual(index.count({'brand': ['Sony'], 'is_hot': ['1']}), 1)
+        self.assertEqual(index.count({'price_band': ['0-50', '100+']}), 3)
+
+        counts = index.facet_counts({'brand': ['Anker']})
+        # 品牌分面忽略自身的选择，其余分面只统计 Anker 的商品
+        self.assertEqual(counts['brand'], {'Anker': 2, 'Sony': 2})
+        self.assertEqual(counts['price_band'], {'0-50': 1, '100+': 1})
+        self.assertEqual(counts['is_new'], {'0': 1, '1': 1})
+
+    def test_goods_writes_patch_cached_index(self):
+        facets.get_facet_index(self.category.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.speaker.brand = 'Anker'
+            self.speaker.save()
+            self.headset.category = self.other_category
+            self.headset.save()
+            self.amp.delete()
+
+        index = facets.get_facet_index(self.category.id)
+        self.assertEqual(index.count({}), 2)
+        self.assertEqual(index.facet_counts({})['brand'], {'Anker': 2})
+        self.assertEqual(index.size, 4)
+        self.assertEqual(facets.get_facet_index(self.other_category.id).count({'is_new': ['1']}), 1)
+        self.assertEqual(
+            index.facet_counts({}),
+            facets.build_facet_index(self.category.id).facet_counts({}),
+        )
+
+    def test_reads_reuse_the_process_copy_until_the_category_stamp_moves(self):
+        first = facets.get_facet_index(self.category.id)
+        with patch('goodsapp.facets.cache.get', wraps=cache.get) as cache_get:
+            self.assertIs(facets.get_facet_index(self.category.id), first)
+        # 只读分类戳，不再取出并反序列化整个索引
+        self.assertEqual([call.args[0] for call in cache_get.call_args_list], [facets._stamp_key(self.category.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.speaker.is_new = True
+            self.speaker.save()
+        patched = facets.get_facet_index(self.category.id)
+        self.assertIsNot(patched, first)
+        self.assertEqual(patched.count({'is_new': ['1']}), 3)
+
+    def test_build_racing_a_write_is_not_cached(self):
+        build = facets.build_facet_index
+
+        def build_then_write(category_id):
+            index = build(category_id)  # 读到的是写入前的行
+            bump_catalog_version()
+            return index
+
+        with patch('goodsapp.facets.build_facet_index', side_effect=build_then_write):
+            self.assertEqual(facets.get_facet_index(self.category.id).count({}), 4)
+        self.assertIsNone(cache.get(facets._cache_key(self.category.id)))
+
+        facets.get_facet_index(self.category.id)
+        self.assertIsNotNone(cache.get(facets._cache_key(self.category.id)))
+
+    def test_category_goods_filters_and_returns_facets(self):
+        client = APIClient()
+        response = client.get(
+            reverse('category_goods', args=[self.category.id]),
+            {'brand': 'Sony,Anker', 'is_hot': 'true'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(item['id'] for item in response.data['goods']),
+            sorted([self.speaker.id, self.earbuds.id]),
+        )
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(response.data['facets']['is_hot'], {'0': 2, '1': 2})
+
+
+@override_settings(CATALOG_SNAPSHOT_MIN_REFRESH_SECONDS=0)
+class ColumnarSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        columnar.reset_snapshot()
+        self.category = Category.objects.create(cname='Kitchen')
+        other = Category.objects.create(cname='Garden')
+        specs = [
+            ('Pan', '25.00', 3, 40, True),
+            ('Pot', '60.00', 0, 40, False),
+            ('Knife', '15.50', 9, 90, True),
+            ('Kettle', '120.00', 1, 10, False),
+        ]
+        self.goods = [
+            Goods.objects.create(
+                gname=name, gdesc=name, price=Decimal(price), category=self.category,
+                brand='Chef', stock=stock, sales=sales, is_hot=is_hot,
+            )
+            for name, price, stock, sales, is_hot in specs
+        ]
+        Goods.objects.create(gname='Hose', gdesc='Hose', price=Decimal('30.00'), category=other,
+                             brand='Chef', stock=5, sales=500)
+
+    def tearDown(self):
+        columnar.reset_snapshot()
+
+    def test_snapshot_queries_match_orm(self):
+        snapshot = columnar.get_snapshot()
+        self.assertIsNotNone(snapshot)
+
+        for ordering in ('price', '-price', '-sales', 'stock', None):
+            expected = list(
+                Goods.objects.filter(category=self.category)
+                .order_by(ordering or 'id', 'id')
+                .values_list('id', flat=True)
+            )
+            self.assertEqual(snapshot.query(category_id=self.category.id, ordering=ordering), expected)
+            self.assertEqual(
+                snapshot.query(category_id=self.category.id, ordering=ordering, limit=2, offset=1),
+                expected[1:3],
+            )
+
+        filters = {'is_hot': ['1'], 'price_band': ['0-50']}
+        expected = facets.filter_queryset(Goods.objects.filter(category=self.category), filters)
+        self.assertEqual(
+            snapshot.query(category_id=self.category.id, filters=filters),
+            list(expected.order_by('id').values_list('id', flat=True)),
+        )
+        self.assertEqual(snapshot.count(category_id=self.category.id, filters={'is_hot': ['1']}), 2)
+
+    def test_stale_snapshot_falls_back_until_refresh_allowed(self):
+        first = columnar.get_snapshot()
+        bump_catalog_version()
+
+        with override_settings(CATALOG_SNAPSHOT_MIN_REFRESH_SECONDS=3600):
+            self.assertIsNone(columnar.get_snapshot())
+
+        refreshed = columnar.get_snapshot()
+        self.assertIsNotNone(refreshed)
+        self.assertGreater(refreshed.version, first.version)
+
+    def test_category_goods_orders_and_limits(self):
+        client = APIClient()
+        response = client.get(
+            reverse('category_goods', args=[self.category.id]), {'ordering': '-sales', 'limit': 2}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.data['goods']],
+            [self.goods[2].id, self.goods[0].id],
+        )
+
+
+    def test_sales_and_stock_orderings_bypass_the_snapshot(self):
+        snapshot = columnar.get_snapshot()
+        # 计数器写回不递增目录版本：快照仍是最新版本，但销量已过时
+        Goods.objects.filter(id=self.goods[3].id).update(sales=1000)
+        self.assertIs(columnar.get_snapshot(), snapshot)
+
+        client = APIClient()
+        response = client.get(reverse('category_goods', args=[self.category.id]), {'ordering': '-sales', 'limit': 1})
+        self.assertEqual([item['id'] for item in response.data['goods']], [self.goods[3].id])
+
+        with patch('goodsapp.columnar.get_snapshot', side_effect=AssertionError('snapshot used')):
+            response = client.get(reverse('category_goods', args=[self.category.id]), {'ordering': 'stock'})
+        self.assertEqual(response.status_code, 200)
+
+
+class GoodsLocalizedProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(cname='Tea')
+
+    def _create_via_serializer(self):
+        serializer = GoodsSerializer(data={
+            'name': '绿茶',
+            'description': '清香',
+            'brand': '西湖',
+            'price': '12.50',
+            'stock': 3,
+            'category': self.category.id,
+            'name_i18n': {'zh': '绿茶', 'en': 'Green Tea'},
+            'description_i18n': {'zh': '清香', 'en': 'Fresh'},
+            'brand_i18n': {'zh': '西湖', 'en': 'West Lake'},
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_serializer_create_and_update_maintain_projection(self):
+        goods = self._create_via_serializer()
+
+        english = GoodsLocalized.objects.get(goods=goods, lang='en')
+        self.assertEqual((english.name, english.description, english.brand), ('Green Tea', 'Fresh', 'West Lake'))
+        self.assertEqual(GoodsLocalized.objects.get(goods=goods, lang='zh').name, '绿茶')
+
+        serializer = GoodsSerializer(goods, data={'price': '15.00', 'name_i18n': {'zh': '龙井', 'en': 'Longjing'}},
+                                     partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        english.refresh_from_db()
+        self.assertEqual((english.name, english.price), ('Longjing', Decimal('15.00')))
+        self.assertEqual(GoodsLocalized.objects.filter(goods=goods).count(), 2)
+
+    def test_translations_are_held_to_source_column_lengths(self):
+        serializer = GoodsSerializer(data={
+            'name': '绿茶', 'description': '清香', 'brand': '西湖', 'price': '12.50', 'stock': 3,
+            'category': self.category.id, 'name_i18n': {'zh': '绿茶', 'en': 'G' * 101},
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('name_i18n', serializer.errors)
+
+        # 绕过校验写入的超长翻译在读模型中截断，同步不会失败
+        goods = Goods.objects.create(gname='红茶', gdesc='-', price=Decimal('9.00'), category=self.category,
+                                     brand='b', name_i18n={'zh': '红茶', 'en': 'B' * 150})
+        self.assertEqual(GoodsLocalized.objects.get(goods=goods, lang='en').name, 'B' * 100)
+
+    def test_backfill_migration_truncates_long_translations(self):
+        import importlib
+
+        from django.apps import apps
+
+        migration = importlib.import_module('goodsapp.migrations.0005_goodslocalized')
+        goods = Goods.objects.create(gname='乌龙', gdesc='-', price=Decimal('9.00'), category=self.category,
+                                     brand='b', brand_i18n={'zh': 'b', 'en': 'W' * 150})
+        Goods.objects.filter(id=goods.id).update(name_i18n={'zh': '乌龙', 'en': 'O' * 150})
+        GoodsLocalized.objects.all().delete()
+
+        migration.backfill_goods_localized(apps, None)
+        english = GoodsLocalized.objects.get(goods=goods, lang='en')
+        self.assertEqual((english.name, english.brand), ('O' * 100, 'W' * 100))
+
+    def test_reads_build_missing_rows_without_writing(self):
+        goods = Goods.objects.bulk_create([
+            Goods(gname='白茶', gdesc='-', price=Decimal('8.00'), category=self.category, brand='b',
+                  name_i18n={'zh': '白茶', 'en': 'White Tea'}),
+        ])[0]
+        with patch('goodsapp.tasks.sync_localized_goods.delay') as delay:
+            rows = projections.localized_rows([goods.id], 'en')
+        self.assertEqual([(row.goods_id, row.name) for row in rows], [(goods.id, 'White Tea')])
+        self.assertFalse(GoodsLocalized.objects.filter(goods=goods).exists())
+        delay.assert_called_once_with([goods.id])
+
+        from .tasks import sync_localized_goods
+
+        sync_localized_goods.run([goods.id])
+        self.assertEqual(GoodsLocalized.objects.filter(goods=goods).count(), 2)
+
+    def test_stock_only_update_skips_projection(self):
+        goods = self._create_via_serializer()
+        GoodsLocalized.objects.filter(goods=goods).update(name='stale')
+
+        goods.stock = 1
+        goods.save(update_fields=['stock'])
+
+        self.assertEqual(GoodsLocalized.objects.get(goods=goods, lang='en').name, 'stale')
+
+    def test_main_image_and_list_endpoint_use_projection(self):
+        goods = self._create_via_serializer()
+        GoodsDetail.objects.create(
+            gdurl='books/main_1.jpg',
+            goodsdname=GoodsDetailName.objects.create(gdname='main'),
+            goods=goods,
+            is_main=True,
+        )
+        self.assertEqual(GoodsLocalized.objects.get(goods=goods, lang='en').main_image_url, '/media/books/main_1.jpg')
+
+        client = APIClient()
+        response = client.get(reverse('category_goods', args=[self.category.id]), {'lang': 'en'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['goods'][0]['id'], goods.id)
+        self.assertEqual(response.data['goods'][0]['gname'], 'Green Tea')
+        self.assertEqual(response.data['goods'][0]['main_image'], '/media/books/main_1.jpg')
+
+    def test_main_image_writes_bump_catalog_version(self):
+        goods = self._create_via_serializer()
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            detail = GoodsDetail.objects.create(gdurl='books/version.jpg', goods=goods, is_main=True,
+                                                goodsdname=GoodsDetailName.objects.create(gdname='main'))
+        saved = get_catalog_version()
+        self.assertGreater(saved, before)
+        with self.captureOnCommitCallbacks(execute=True):
+            detail.delete()
+        self.assertGreater(get_catalog_version(), saved)
+
+
+class ImageDerivativeTests(TempSnapshotMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self._media_dir = tempfile.TemporaryDirectory()
+        self._media_override = override_settings(MEDIA_ROOT=self._media_dir.name)
+        self._media_override.enable()
+        self.category = Category.objects.create(cname='图书')
+        self.goods = Goods.objects.create(
+            gname='Atlas', gdesc='Maps', price=Decimal('30.00'), category=self.category, brand='Acme',
+        )
+        self.detail_name = GoodsDetailName.objects.create(gdname='main')
+        # 派生图任务在提交回调里同步执行，不依赖环境是否开启 CELERY_TASK_ALWAYS_EAGER
+        from .tasks import generate_image_derivatives
+
+        enqueue = patch.object(generate_image_derivatives, 'delay',
+                               side_effect=lambda detail_id: generate_image_derivatives.apply(args=[detail_id]))
+        enqueue.start()
+        self.addCleanup(enqueue.stop)
+
+    def tearDown(self):
+        self._media_override.disable()
+        self._media_dir.cleanup()
+        super().tearDown()
+
+    @staticmethod
+    def _upload(name='atlas.png', color='red'):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), color).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def _create_detail(self, **kwargs):
+        return GoodsDetail.objects.create(
+            gdurl=kwargs.pop('gdurl', None) or self._upload(),
+            goodsdname=self.detail_name,
+            goods=self.goods,
+            is_main=kwargs.pop('is_main', True),
+        )
+
+    def test_save_generates_content_addressed_webp_derivatives(self):
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks(execute=True):
+            detail = self._create_detail()
+
+        detail.refresh_from_db()
+        self.assertEqual(len(detail.content_hash), 64)
+        self.assertEqual(detail.derivatives['thumb'], images.derivative_path(detail.content_hash, 'thumb'))
+        for variant, max_size in (('thumb', 200), ('medium', 600)):
+            with default_storage.open(detail.derivatives[variant], 'rb') as handle:
+                with Image.open(handle) as rendered:
+                    self.assertEqual(rendered.format, 'WEBP')
+                    self.assertEqual(max(rendered.size), max_size)
+
+        variants = GoodsLocalized.objects.get(goods=self.goods, lang='zh').main_image_variants
+        self.assertEqual(variants['full'], detail.gdurl.url)
+        self.assertTrue(variants['thumb'].endswith(f'{detail.content_hash}-thumb.webp'))
+
+        response = APIClient().get(reverse('category_goods', args=[self.category.id]))
+        self.assertEqual(response.data['goods'][0]['main_image_variants'], variants)
+
+    def test_identical_sources_share_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._create_detail()
+            second = self._create_detail(gdurl=self._upload('copy.png'), is_main=False)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first.derivatives, second.derivatives)
+        self.assertEqual(len(os.listdir(os.path.dirname(default_storage.path(first.derivatives['thumb'])))), 2)
+
+    def test_corrupt_source_is_reported_without_retry(self):
+        from .tasks import generate_image_derivatives
+
+        detail = self._create_detail(gdurl=SimpleUploadedFile('broken.png', b'\x89PNG truncated'))
+
+        result = generate_image_derivatives.apply(args=[detail.pk])
+
+        self.assertEqual(result.get(), {'detail': detail.pk, 'invalid': True})
+        detail.refresh_from_db()
+        self.assertEqual(detail.content_hash, '')
+
+    def test_concurrent_render_keeps_a_single_copy(self):
+        path = images.derivative_path('ab' * 32, 'thumb')
+        # 两个任务都在对方写入前检查过文件不存在，随后先后写入同一路径
+        images._store(path, b'first')
+        images._store(path, b'second')
+
+        self.assertEqual(os.listdir(os.path.dirname(default_storage.path(path))), [os.path.basename(path)])
+        with default_storage.open(path, 'rb') as handle:
+            self.assertEqual(handle.read(), b'first')
+
+    def test_variants_fall_back_to_full_image_until_generated(self):
+        detail = self._create_detail()
+
+        variants = images.image_variants(detail)
+
+        self.assertEqual(variants, {'thumb': detail.gdurl.url, 'medium': detail.gdurl.url, 'full': detail.gdurl.url})
+
+    def test_backfill_command_processes_pending_and_reports_missing(self):
+        present = self._create_detail()
+        GoodsDetail.objects.create(gdurl='books/missing.jpg', goodsdname=self.detail_name, goods=self.goods)
+        corrupt = self._create_detail(gdurl=SimpleUploadedFile('corrupt.png', b'not an image'), is_main=False)
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('backfill_image_derivatives', '--sync', stdout=out, stderr=err)
+
+        present.refresh_from_db()
+        self.assertTrue(present.content_hash)
+        self.assertIn('books/missing.jpg', err.getvalue())
+        self.assertIn(corrupt.gdurl.name, err.getvalue())
+        self.assertIn('已生成 1 张图片，缺失源文件 1 张，无法解析 1 张', out.getvalue())
+        self.assertFalse(list(images.pending_details(prefix=present.gdurl.name)))
+
+
+class CoPurchaseRecommendationTests(TestCase):
+    def setUp(self):
+        from userapp.models import Address, UserInfo
+
+        cache.clear()
+        self.user = UserInfo.objects.create_user(account='buyer@example.com', password='pass1234', username='buyer')
+        self.address = Address.objects.create(aname='buyer', aphone='12345678901', addr='Road 1', aUserInfo=self.user)
+        category = Category.objects.create(cname='文具')
+        self.goods = [
+            Goods.objects.create(gname=f'item-{index}', gdesc='-', price=Decimal('1.00'), category=category, brand='b')
+            for index in range(5)
+        ]
+
+    def _order(self, *indexes):
+        from orderapp.models import Order, Orderitem
+
+        order = Order.objects.create(userinfo=self.user, address=self.address, order_num='n', trade_no='t')
+        Orderitem.objects.bulk_create([Orderitem(order=order, goods=self.goods[index]) for index in indexes])
+        return order
+
+    def test_vectorized_counts_match_brute_force(self):
+        baskets = {1: [3, 1, 2], 2: [1, 2], 3: [2, 3, 4, 5], 4: [7], 5: [1, 4]}
+        rows = sorted((order, goods) for order, items in baskets.items() for goods in items)
+        left, right, counts = recommendations.co_purchase_pairs([r[0] for r in rows], [r[1] for r in rows])
+
+        expected = Counter(pair for items in baskets.values() for pair in permutations(items, 2))
+        self.assertEqual(dict(zip(zip(left.tolist(), right.tolist()), counts.tolist())), dict(expected))
+        self.assertEqual(recommendations.top_neighbours(left, right, counts, 2)[2], [1, 3])
+
+    def test_rebuild_and_incremental_update_agree(self):
+        ids = [goods.id for goods in self.goods]
+        self._order(0, 1, 2)
+        self._order(0, 1)
+        self._order(3)
+        self.assertEqual(recommendations.rebuild(), {'pairs': 6, 'goods': 3})
+        self.assertEqual(recommendations.get_recommendations(ids[0]), [ids[1], ids[2]])
+
+        self._order(0, 2, 4)
+        recommendations.record_order([ids[0], ids[2], ids[4]])
+        recommendations.record_order([ids[2], ids[4]])
+        incremental = {
+            (row.goods_id, row.related_id): row.count for row in GoodsCoPurchase.objects.all()
+        }
+        self._order(2, 4)
+        recommendations.rebuild()
+        rebuilt = {(row.goods_id, row.related_id): row.count for row in GoodsCoPurchase.objects.all()}
+
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(recommendations.get_recommendations(ids[2]), [ids[0], ids[4], ids[1]])
+
+    def test_orders_placed_during_a_rebuild_are_counted_once(self):
+        ids = [goods.id for goods in self.goods]
+        first = self._order(0, 1)
+        recommendations.record_order([ids[0], ids[1]], first.id)
+        scan = recommendations._order_rows
+        racing = []
+
+        def racing_scan(**filters):
+            rows = scan(**filters)
+            if not racing:
+                # 扫描之后提交的订单：它的增量更新在替换前已写入，会被替换清掉
+                racing.append(self._order(1, 2))
+                recommendations.record_order([ids[1], ids[2]], racing[0].id)
+            else:
+                with self.assertRaises(recommendations.RebuildInProgress):  # 持锁期间的更新留给任务重试
+                    recommendations.record_order([ids[1], ids[2]], racing[0].id)
+            return rows
+
+        with patch.object(recommendations, '_order_rows', side_effect=racing_scan), \
+                patch.object(recommendations, '_LOCK_WAIT', 0):
+            recommendations.rebuild()
+        # 重试时订单已在水位线以下，不会重复计数
+        self.assertEqual(recommendations.record_order([ids[1], ids[2]], racing[0].id), 0)
+        self.assertEqual(
+            {(row.goods_id, row.related_id): row.count for row in GoodsCoPurchase.objects.all()},
+            {(ids[0], ids[1]): 1, (ids[1], ids[0]): 1, (ids[1], ids[2]): 1, (ids[2], ids[1]): 1},
+        )
+
+    def test_order_created_event_feeds_matrix_and_endpoint_reads_cache(self):
+        from eventstream.outbox import enqueue_order_event
+
+        ids = [goods.id for goods in self.goods]
+        order = self._order(1, 3)
+        with patch('goodsapp.tasks.update_recommendations.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue_order_event(
+                    order, event_type='order.created',
+                    payload={'items': [{'goods_id': ids[1]}, {'goods_id': ids[3]}]},
+                )
+        delay.assert_called_once_with([ids[1], ids[3]], order.id)
+        recommendations.record_order(*delay.call_args.args)
+
+        client = APIClient()
+        with self.assertNumQueries(1):  # 推荐列表来自缓存，只查询读模型
+            response = client.get(reverse('goods_recommendations', args=[ids[1]]), {'lang': 'zh'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['recommendations']], [ids[3]])
+
+        missing = client.get(reverse('goods_recommendations', args=[999999]))
+        self.assertEqual(missing.status_code, 404)
+
+
+class HotProductsLeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.books = Category.objects.create(cname='图书')
+        self.toys = Category.objects.create(cname='玩具')
+        self.atlas, self.novel, self.robot = [
+            Goods.objects.create(gname=name, gdesc='-', price=Decimal('9.90'), category=category, brand='b')
+            for name, category in (('atlas', self.books), ('novel', self.books), ('robot', self.toys))
+        ]
+
+    def _line(self, goods, quantity):
+        return {'goods_id': goods.id, 'category_id': goods.category_id, 'quantity': quantity}
+
+    def test_windows_roll_buckets_out(self):
+        start = 1_700_000_000.0
+        leaderboard.record_sales([self._line(self.atlas, 3), self._line(self.robot, 1)], now=start)
+        leaderboard.record_sales([self._line(self.novel, 2), self._line(self.robot, 4)], now=start + 2 * 3600)
+
+        now = start + 2 * 3600 + 60
+        self.assertEqual(leaderboard.top_products('1h', now=now), [(self.robot.id, 4), (self.novel.id, 2)])
+        self.assertEqual(
+            leaderboard.top_products('24h', now=now),
+            [(self.robot.id, 5), (self.atlas.id, 3), (self.novel.id, 2)],
+        )
+        self.assertEqual(
+            leaderboard.top_products('24h', category_id=self.books.id, now=now),
+            [(self.atlas.id, 3), (self.novel.id, 2)],
+        )
+        self.assertEqual(leaderboard.top_products('24h', now=start + 30 * 3600), [])
+        self.assertEqual(leaderboard.top_products('7d', limit=1, now=start + 30 * 3600), [(self.robot.id, 5)])
+
+    def test_reads_use_memo_until_next_write(self):
+        now = time.time()
+        leaderboard.record_sales([self._line(self.atlas, 1)], now=now)
+        self.assertEqual(leaderboard.top_products('1h', now=now), [(self.atlas.id, 1)])
+
+        get_many = cache.get_many
+
+        def memo_only(keys, *args, **kwargs):
+            # 命中备忘录时只读备忘录和代数两个键，不扫描各桶
+            self.assertEqual(len(keys), 2, 'memo expected')
+            return get_many(keys, *args, **kwargs)
+
+        with patch.object(cache, 'get_many', side_effect=memo_only):
+            self.assertEqual(leaderboard.top_products('1h', now=now), [(self.atlas.id, 1)])
+
+        leaderboard.record_sales([self._line(self.novel, 5)], now=now)
+        self.assertEqual(leaderboard.top_products('1h', now=now), [(self.novel.id, 5), (self.atlas.id, 1)])
+
+    def test_busy_bucket_is_kept_for_retry(self):
+        now = time.time()
+        busy_key = leaderboard._bucket_key(leaderboard.GLOBAL_SCOPE, '24h', leaderboard._current_bucket('24h', now))
+        cache.add(f'lock:{busy_key}', 'other-writer', 30)
+        with patch.object(leaderboard, '_LOCK_WAIT', 0), self.assertRaises(leaderboard.BucketsBusy) as raised:
+            leaderboard.record_sales([self._line(self.atlas, 3)], now=now)
+        self.assertEqual(raised.exception.pending, [[leaderboard.GLOBAL_SCOPE, '24h', [(self.atlas.id, 3)]]])
+        self.assertEqual(leaderboard.top_products('1h', now=now), [(self.atlas.id, 3)])
+        self.assertEqual(leaderboard.top_products('24h', now=now), [])
+
+        cache.delete(f'lock:{busy_key}')
+        self.assertEqual(leaderboard.apply_pending(raised.exception.pending, now=now), [])
+        self.assertEqual(leaderboard.top_products('24h', now=now), [(self.atlas.id, 3)])
+        self.assertEqual(leaderboard.top_products('24h', category_id=self.books.id, now=now), [(self.atlas.id, 3)])
+
+    def test_memo_computed_across_a_write_is_not_served(self):
+        now = time.time()
+        leaderboard.record_sales([self._line(self.atlas, 1)], now=now)
+        get_many = cache.get_many
+
+        def read_then_write(keys, *args, **kwargs):
+            values = get_many(keys, *args, **kwargs)
+            if len(keys) > 2:  # 读完各桶之后、保存备忘录之前有一笔销售写入
+                leaderboard.record_sales([self._line(self.novel, 5)], now=now)
+            return values
+
+        with patch.object(cache, 'get_many', side_effect=read_then_write):
+            self.assertEqual(leaderboard.top_products('1h', now=now), [(self.atlas.id, 1)])
+        self.assertEqual(leaderboard.top_products('1h', now=now), [(self.novel.id, 5), (self.atlas.id, 1)])
+
+    def test_order_created_event_updates_endpoint(self):
+        from eventstream.subscribers import handlers_for
+        from .tasks import update_leaderboards
+
+        self.assertIn(leaderboard.on_order_created, handlers_for('order.created'))
+        # 旧事件没有 category_id，由任务补齐
+        update_leaderboards.run([{'goods_id': self.novel.id, 'quantity': 2}, self._line(self.robot, 1)])
+
+        response = APIClient().get(reverse('hot_products'), {'window': '1h', 'category': self.books.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(item['id'], item['units_sold']) for item in response.data['goods']], [(self.novel.id, 2)])
+
+        response = APIClient().get(reverse('hot_products'), {'window': '30d'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL_SECONDS=3600)
+class WriteBehindCounterTests(TestCase):
+    def setUp(self):
+        counters.reset()
+        self.addCleanup(counters.reset)
+        category = Category.objects.create(cname='数码')
+        self.phone, self.tablet = [
+            Goods.objects.create(gname=name, gdesc='-', price=Decimal('99.00'), category=category, brand='b')
+            for name in ('phone', 'tablet')
+        ]
+
+    def test_increments_are_buffered_and_flushed_in_one_update(self):
+        with self.assertNumQueries(0):
+            for _ in range(20):
+                counters.increment(self.phone.id, 'views')
+            counters.increment_many({self.phone.id: 3, self.tablet.id: 1}, 'sales')
+        self.assertEqual(Goods.objects.get(id=self.phone.id).views, 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.flush(), 2)
+
+        self.assertEqual(
+            list(Goods.objects.order_by('id').values_list('sales', 'views')),
+            [(3, 20), (1, 0)],
+        )
+        self.assertEqual(counters.pending(), {})
+
+    def test_failed_flush_keeps_deltas(self):
+        from django.db import DatabaseError
+
+        with patch.object(Goods.objects, 'filter', side_effect=DatabaseError('down')):
+            counters.increment(self.phone.id, 'sales', 2)
+            self.assertEqual(counters.flush(), 0)
+        self.assertEqual(counters.pending()[self.phone.id]['sales'], 2)
+
+        counters.increment(self.phone.id, 'sales', 1)
+        counters.flush()
+        self.assertEqual(Goods.objects.get(id=self.phone.id).sales, 3)
+
+    def test_timer_thread_flushes_after_interval(self):
+        ticked = threading.Event()
+        with override_settings(COUNTER_FLUSH_INTERVAL_SECONDS=0.01), \
+                patch.object(counters, '_tick', side_effect=ticked.set):
+            counters.increment(self.phone.id, 'views')
+            self.assertTrue(ticked.wait(5))
+        # 写回由计时线程完成，请求里的自增不直接写库
+        self.assertEqual(Goods.objects.get(id=self.phone.id).views, 0)
+
+    def test_orders_and_detail_views_feed_counters(self):
+        from eventstream.subscribers import handlers_for
+
+        self.assertIn(counters.on_order_created, handlers_for('order.created'))
+        counters.record_order_lines([
+            {'goods_id': self.phone.id, 'quantity': 2},
+            {'goods_id': self.phone.id, 'quantity': 1},
+        ])
+        APIClient().get(reverse('goods_detail', args=[self.tablet.id]))
+
+        self.assertEqual(counters.pending(), {
+            self.phone.id: {'sales': 3, 'views': 0},
+            self.tablet.id: {'sales': 0, 'views': 1},
+        })
+
+
+class GoodsImportTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        self.category = Category.objects.create(cname='茶叶')
+        Goods.objects.create(gname='green tea', gdesc='old', price=Decimal('5.00'), category=self.category,
+                             brand='old brand', stock=3)
+
+    def _import(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as handle:
+            handle.write(content)
+        self.addCleanup(os.unlink, handle.name)
+        out, err = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_goods', handle.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upserts_in_chunks_and_reports_errors(self):
+        content = (
+            'gname,price,category,brand,stock,name_en,images\n'
+            f'green tea,6.50,{self.category.id},,,Green Tea,tea/a.jpg|tea/b.jpg\n'
+            f'black tea,8.00,{self.category.id},acme,10,,tea/c.jpg\n'
+            f'bad price,abc,{self.category.id},acme,1,,\n'
+            f'no category,1.00,999,acme,1,,\n'
+        )
+        out, err = self._import(content, '.csv', '--chunk-size', '2')
+
+        self.assertIn('行/秒', out)
+        self.assertIn('line 4', err)
+        self.assertIn('line 5', err)
+        green = Goods.objects.get(gname='green tea')
+        # 未提供的列保持原值
+        self.assertEqual((green.price, green.brand, green.stock), (Decimal('6.50'), 'old brand', 3))
+        self.assertEqual(green.name_i18n, {'en': 'Green Tea'})
+        self.assertEqual(Goods.objects.get(gname='black tea').stock, 10)
+        self.assertEqual(
+            list(green.goodsdetail_set.order_by('gdurl').values_list('gdurl', 'is_main')),
+            [('tea/a.jpg', True), ('tea/b.jpg', False)],
+        )
+        localized = GoodsLocalized.objects.get(goods=green, lang='en')
+        self.assertEqual((localized.name, localized.main_image_url), ('Green Tea', '/media/tea/a.jpg'))
+
+    def test_jsonl_reimport_updates_rows_without_duplicates(self):
+        line = (
+            '{"name_i18n": {"zh": "乌龙茶", "en": "Oolong"}, "gdesc": "-", "price": "%s", '
+            '"category": %d, "brand": "b", "is_hot": true, "images": ["tea/o.jpg", "tea/p.jpg"]}\n'
+        )
+        self._import(line % ('9.90', self.category.id), '.jsonl')
+        self._import((line % ('12.00', self.category.id)).replace('"tea/o.jpg", "tea/p.jpg"', '"tea/p.jpg"'), '.jsonl')
+
+        oolong = Goods.objects.get(gname='乌龙茶')
+        self.assertEqual((oolong.price, oolong.is_hot), (Decimal('12.00'), True))
+        self.assertEqual(
+            list(oolong.goodsdetail_set.order_by('gdurl').values_list('gdurl', 'is_main')),
+            [('tea/o.jpg', False), ('tea/p.jpg', True)],
+        )
+        self.assertEqual(GoodsLocalized.objects.get(goods=oolong, lang='zh').price, Decimal('12.00'))
+
+    def test_dry_run_writes_nothing(self):
+        content = f'gname,price,category\nnew tea,1.00,{self.category.id}\n'
+        out, _ = self._import(content, '.csv', '--dry-run')
+        self.assertIn('校验完成', out)
+        self.assertFalse(Goods.objects.filter(gname='new tea').exists())
+
+
+@override_settings(GOODS_BULK_UPDATE_CHUNK_SIZE=2)
+class GoodsBulkUpdateTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(cname='批量')
+        self.goods = [
+            Goods.objects.create(gname=f'bulk-{index}', gdesc='-', price=Decimal('10.00'), category=category,
+                                 brand='b', stock=5)
+            for index in range(3)
+        ]
+        self.admin = UserInfo.objects.create_user(account='ops@example.com', password='pass1234', username='ops')
+        self.admin.is_staff = True
+        self.admin.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_updates_in_chunks_with_one_event_per_chunk(self):
+        first, second, third = self.goods
+        payload = [
+            {'id': first.id, 'price': '12.50'},
+            {'id': second.id, 'stock': 0},
+            {'id': third.id, 'price': '8.00', 'stock': 20},
+            {'id': 999999, 'stock': 1},
+            {'id': first.id, 'price': 'abc'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('goods_bulk_update') + '?batch_id=ops-1', payload, format='json')
+
+        data = response.data
+        self.assertEqual((data['rows'], data['updated'], data['chunks'], data['invalid']), (5, 3, 2, 2))
+        first.refresh_from_db()
+        self.assertEqual((first.price, first.stock), (Decimal('12.50'), 5))
+        self.assertEqual(Goods.objects.get(id=second.id).stock, 0)
+        self.assertEqual(GoodsLocalized.objects.get(goods=third, lang='zh').price, Decimal('8.00'))
+
+        events = OutboxEvent.objects.filter(event_type='goods.bulk_updated').order_by('id')
+        self.assertEqual([len(event.payload['items']) for event in events], [2, 1])
+        self.assertEqual(events[0].payload['items'][0], {
+            'goods_id': first.id, 'price': '12.50', 'previous_price': '10.00',
+        })
+
+        # 相同 batch_id 重试不会产生重复事件
+        self.client.post(reverse('goods_bulk_update') + '?batch_id=ops-1', payload, format='json')
+        self.assertEqual(OutboxEvent.objects.filter(event_type='goods.bulk_updated').count(), 2)
+
+    def test_streamed_csv_upload(self):
+        content = 'id,price,stock\n' + ''.join(f'{goods.id},,{index}\n' for index, goods in enumerate(self.goods))
+        upload = SimpleUploadedFile('stock.csv', content.encode(), content_type='text/csv')
+        response = self.client.post(reverse('goods_bulk_update'), {'file': upload}, format='multipart')
+
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(list(Goods.objects.order_by('id').values_list('stock', flat=True)), [0, 1, 2])
+
+    def test_requires_staff(self):
+        user = UserInfo.objects.create_user(account='shopper@example.com', password='pass1234', username='s')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.post(reverse('goods_bulk_update'), [], format='json').status_code, 403)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counters.reset()
+        self.addCleanup(counters.reset)
+        self.category = Category.objects.create(cname='稀疏')
+        long_text = '详细描述' * 500
+        self.goods = Goods.objects.create(
+            gname='茶', gdesc=long_text, price=Decimal('9.90'), category=self.category, brand='b',
+            name_i18n={'zh': '茶', 'en': 'Tea'}, description_i18n={'zh': long_text, 'en': 'Long text ' * 500},
+        )
+
+    @staticmethod
+    def _row_bytes(rows):
+        return sum(len(str(value).encode()) for row in rows for value in row.values())
+
+    def test_detail_projection_reaches_the_query(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('goods_detail', args=[self.goods.id]), {'fields': 'gname,price,bogus'})
+
+        self.assertEqual(response.data['goods'], {'id': self.goods.id, 'gname': '茶', 'price': '9.90'})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('description_i18n', sql)
+        self.assertNotIn('"gdesc"', sql)
+        self.assertNotIn('goodsapp_goodsdetail', sql)
+
+        # 未传 fields 时输出完整，但也不再读取序列化器用不到的多语言 JSON 列
+        with CaptureQueriesContext(connection) as queries:
+            full = client.get(reverse('goods_detail', args=[self.goods.id])).data['goods']
+        self.assertEqual(set(full), set(GoodsDetailPageSerializer.Meta.fields))
+        self.assertNotIn('description_i18n', ' '.join(query['sql'] for query in queries.captured_queries))
+
+    def test_fewer_bytes_fetched_per_row(self):
+        rows = Goods.objects.filter(id=self.goods.id)
+        sparse = self._row_bytes(rows.values(*GoodsSerializer.columns_for(['name', 'price'])))
+        full = self._row_bytes(rows.values(*GoodsSerializer.columns_for(None)))
+        self.assertLess(sparse * 10, full)
+
+        localized = GoodsLocalized.objects.filter(goods=self.goods)
+        self.assertLess(
+            self._row_bytes(localized.values(*GoodsLocalizedListSerializer.columns_for(None))) * 10,
+            self._row_bytes(localized.values()),
+        )
+
+    def test_list_endpoint_trims_output_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse('category_goods', args=[self.category.id]),
+                                       {'fields': 'price', 'lang': 'en'})
+
+        self.assertEqual(response.data['goods'], [{'id': self.goods.id, 'price': '9.90'}])
+        projection_sql = [query['sql'] for query in queries.captured_queries
+                          if 'goodsapp_goodslocalized' in query['sql']]
+        self.assertTrue(projection_sql)
+        self.assertFalse(any('"description"' in sql or '"main_image_url"' in sql for sql in projection_sql))
+
+
+class GoodsMultiGetTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        counters.reset()
+        self.addCleanup(counters.reset)
+        category = Category.objects.create(cname='批量查询')
+        detail_name = GoodsDetailName.objects.create(gdname='图片')
+        self.goods = [
+            Goods.objects.create(gname=f'multi-{index}', gdesc='-', price=Decimal('5.00') + index, category=category,
+                                 brand='b')
+            for index in range(3)
+        ]
+        for goods in self.goods:
+            GoodsDetail.objects.create(gdurl=f'books/{goods.id}.jpg', goodsdname=detail_name, goods=goods, is_main=True)
+        self.client = APIClient()
+        self.url = reverse('goods_multi_get')
+
+    def test_read_through_in_request_order(self):
+        first, second, third = self.goods
+        self.client.get(reverse('goods_detail', args=[second.id]))
+        ids = f'{third.id},{first.id},999999,{second.id},{third.id}'
+
+        # 未命中的两个商品：一次查询（含分类）+ 一次图片预取
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url, {'ids': ids}).data
+        self.assertEqual([item['id'] for item in data['goods']], [third.id, first.id, second.id])
+        self.assertEqual(data['missing'], [999999])
+        self.assertEqual(data['goods'][0]['images'][0]['gdurl'], f'/media/books/{third.id}.jpg')
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, {'ids': ids, 'fields': 'price'}).data
+        self.assertEqual(cached['goods'],
+                         [{'id': goods.id, 'price': str(goods.price)} for goods in (third, first, second)])
+
+    def test_writes_invalidate_entries(self):
+        goods = self.goods[0]
+        self.client.get(self.url, {'ids': goods.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            goods.price = Decimal('99.00')
+            goods.save()
+
+        self.assertEqual(self.client.get(self.url, {'ids': goods.id}).data['goods'][0]['price'], '99.00')
+
+    @override_settings(GOODS_MULTI_GET_MAX_IDS=2)
+    def test_rejects_invalid_or_too_many_ids(self):
+        self.assertEqual(self.client.get(self.url, {'ids': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'ids': '1,2,3'}).status_code, 400)
+
+
+class CatalogDeltaSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(cname='同步')
+        self.goods = [
+            Goods.objects.create(gname=f'sync-{index}', gdesc='-', price=Decimal('3.00'), category=self.category,
+                                 brand='b', name_i18n={'zh': f'sync-{index}', 'en': f'Sync {index}'})
+            for index in range(3)
+        ]
+        self.image = GoodsDetail.objects.create(gdurl='books/sync.jpg', goods=self.goods[0],
+                                                goodsdname=GoodsDetailName.objects.create(gdname='图片'))
+        self.client = APIClient()
+        self.url = reverse('catalog_changes')
+
+    def _pull(self, since, **params):
+        return self.client.get(self.url, {'since': since, **params}).data
+
+    def test_versions_are_monotonic_and_skip_counter_writes(self):
+        versions = [self.category.catalog_version] + [goods.catalog_version for goods in self.goods]
+        self.assertEqual(versions, sorted(set(versions)))
+
+        goods = self.goods[1]
+        before = goods.catalog_version
+        goods.stock = 9
+        goods.save(update_fields=['stock'])
+        self.assertEqual(Goods.objects.get(pk=goods.pk).catalog_version, before)
+        goods.price = Decimal('4.00')
+        goods.save(update_fields=['price'])
+        self.assertGreater(Goods.objects.get(pk=goods.pk).catalog_version, self.image.catalog_version)
+
+    def test_paged_full_sync_then_incremental_changes(self):
+        seen, since, has_more = [], 0, True
+        while has_more:
+            page = self._pull(since, limit=2, lang='en')
+            seen += [('category', row['id']) for row in page['categories']]
+            seen += [('goods', row['id']) for row in page['goods']]
+            seen += [('image', row['id']) for row in page['images']]
+            since, has_more = page['next_since'], page['has_more']
+        self.assertEqual(sorted(seen), sorted([('category', self.category.id), ('image', self.image.id)]
+                                              + [('goods', goods.id) for goods in self.goods]))
+        self.assertEqual(self._pull(since)['goods'], [])
+
+        changed = self.goods[2]
+        changed.price = Decimal('7.50')
+        changed.save()
+        image_id = self.image.id
+        self.image.delete()
+        bulk.apply_updates([(1, {'id': self.goods[0].id, 'price': '1.00'}), (2, {'id': self.goods[1].id, 'stock': 0})])
+
+        page = self._pull(since, lang='en')
+        self.assertEqual([(row['id'], row['price'], row['name']) for row in page['goods']],
+                         [(changed.id, '7.50', 'Sync 2'), (self.goods[0].id, '1.00', 'Sync 0')])
+        self.assertNotIn('stock', page['goods'][0])
+        self.assertEqual(page['deleted'], {'goods': [], 'images': [image_id], 'categories': []})
+        self.assertFalse(page['has_more'])
+
+    def test_invalid_or_future_tokens(self):
+        self.assertEqual(self.client.get(self.url, {'since': '-1'}).status_code, 400)
+        page = self._pull(10 ** 12)
+        self.assertTrue(page['reset'])
+        self.assertEqual(len(page['goods']), 3)
+
+
+class HomepagePayloadTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        self.tea, self.toys = Category.objects.create(cname='茶'), Category.objects.create(cname='玩具')
+        self.goods = {}
+        for name, category, sales, hot, new in (('oolong', self.tea, 50, True, False),
+                                                ('pu-erh', self.tea, 80, True, True),
+                                                ('green', self.tea, 10, False, True),
+                                                ('kite', self.toys, 5, False, False)):
+            self.goods[name] = Goods.objects.create(gname=name, gdesc='-', price=Decimal('9.00'), category=category,
+                                                    brand='b', sales=sales, is_hot=hot, is_new=new)
+        self.client = APIClient()
+
+    @override_settings(HOMEPAGE_CATEGORY_HIGHLIGHTS=2)
+    def test_payload_is_prerendered_bytes(self):
+        response = self.client.get(reverse('homepage'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual([item['gname'] for item in data['hot']], ['pu-erh', 'oolong'])
+        self.assertEqual([item['gname'] for item in data['new']], ['green', 'pu-erh'])
+        self.assertEqual({row['category']: [item['gname'] for item in row['goods']] for row in data['highlights']},
+                         {self.tea.id: ['pu-erh', 'oolong'], self.toys.id: ['kite']})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('homepage')).content, response.content)
+
+    # 防抖窗口放大：其他任务入队在没有 broker 时会阻塞数秒，不能让两次变更落在不同窗口
+    @override_settings(HOMEPAGE_REBUILD_DEBOUNCE_SECONDS=3600)
+    def test_catalog_change_schedules_one_background_rebuild(self):
+        first = self.client.get(reverse('homepage')).content
+        with patch('goodsapp.tasks.rebuild_homepage.apply_async') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                kite = self.goods['kite']
+                kite.is_hot = True
+                kite.save()
+                Category.objects.filter(pk=self.toys.pk).get().save()
+            self.assertEqual(enqueue.call_count, 1)
+
+            # 重建完成前继续返回旧数据
+            self.assertEqual(self.client.get(reverse('homepage')).content, first)
+
+        homepage.rebuild()
+        hot = self.client.get(reverse('homepage')).json()['hot']
+        self.assertIn('kite', [item['gname'] for item in hot])
+
+
+class CatalogSnapshotExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self._output = tempfile.TemporaryDirectory()
+        self.addCleanup(self._output.cleanup)
+        self.root = self._output.name
+        self.tea, self.toys = Category.objects.create(cname='茶'), Category.objects.create(cname='玩具')
+        self.goods = [
+            Goods.objects.create(gname=f'茶{index}', gdesc='-', price=Decimal('9.00'), category=self.tea, brand='b',
+                                 name_i18n={'zh': f'茶{index}', 'en': f'Tea {index}'})
+            for index in range(3)
+        ]
+
+    def _export(self, **kwargs):
+        return CatalogExporter(self.root, page_size=2, **kwargs).run()
+
+    def _read(self, relpath):
+        with open(os.path.join(self.root, *relpath.split('/')), 'rb') as handle:
+            return handle.read()
+
+    def test_full_export_writes_pages_details_and_hashes(self):
+        stats = self._export()
+
+        self.assertTrue(stats.full)
+        manifest = json.loads(self._read('manifest.json'))
+        for relpath, digest in manifest['files'].items():
+            self.assertEqual(hashlib.sha256(self._read(relpath)).hexdigest(), digest)
+        self.assertEqual(json.loads(self._read(f'en/goods/{self.goods[0].id}.json'))['gname'], 'Tea 0')
+        self.assertEqual(manifest['pages'], {str(self.tea.id): 2})
+        page = json.loads(self._read(f'zh/categories/{self.tea.id}/page-2.json'))
+        self.assertEqual((page['total'], [item['gname'] for item in page['goods']]), (3, ['茶2']))
+
+        again = self._export()
+        self.assertFalse(again.full)
+        self.assertEqual((again.goods, again.written), (0, 0))
+
+    def test_incremental_run_rewrites_only_changed_files(self):
+        self._export()
+        changed, moved, removed = self.goods
+        changed.price = Decimal('5.00')
+        changed.save()
+        stats = self._export()
+        # 两种语言各一个详情文件和一个列表页；同分类另一页内容未变
+        self.assertEqual((stats.goods, stats.written), (1, 4))
+
+        moved.category = self.toys
+        moved.save()
+        removed_id = removed.id
+        removed.delete()
+        stats = self._export()
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'zh', 'goods', f'{removed_id}.json')))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'zh', 'categories', str(self.tea.id), 'page-2.json')))
+        toys = json.loads(self._read(f'en/categories/{self.toys.id}/page-1.json'))
+        self.assertEqual([item['id'] for item in toys['goods']], [moved.id])
+        manifest = json.loads(self._read('manifest.json'))
+        self.assertNotIn(str(removed_id), manifest['goods'])
+        self.assertNotIn(f'zh/goods/{removed_id}.json', manifest['files'])
+
+
+@override_settings(SITEMAP_SHARD_SIZE=2, STOREFRONT_URL='https://shop.example')
+class SitemapFeedTests(TestCase):
+    def setUp(self):
+        self._output = tempfile.TemporaryDirectory()
+        self.addCleanup(self._output.cleanup)
+        self.root = self._output.name
+        category = Category.objects.create(cname='茶')
+        self.goods = [
+            Goods.objects.create(gname=f'茶<{index}>', gdesc='-', price=Decimal('9.00'), category=category, brand='b',
+                                 stock=5)
+            for index in range(4)
+        ]
+        self.shards = {feeds.shard_of(goods.id): [] for goods in self.goods}
+        for goods in self.goods:
+            self.shards[feeds.shard_of(goods.id)].append(goods)
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.root, name), 'rt', encoding='utf-8') as handle:
+            return handle.read()
+
+    def test_only_changed_shards_are_rewritten(self):
+        stats = feeds.write_feeds(self.root)
+        self.assertEqual(len(stats.written), 2 * len(self.shards))
+        first, *_ = self.goods
+        shard = feeds.shard_of(first.id)
+        self.assertIn(f'<loc>https://shop.example/goods/{first.id}</loc>', self._read(f'sitemap-{shard}.xml.gz'))
+        self.assertIn('<title>茶&lt;0&gt;</title>', self._read(f'feed-{shard}.xml.gz'))
+        self.assertEqual(feeds.write_feeds(self.root).written, [])
+
+        # 只改库存不升目录版本：只有 feed 分片重写
+        Goods.objects.filter(id=first.id).update(stock=0)
+        self.assertEqual(feeds.write_feeds(self.root).written, [f'feed-{shard}.xml.gz'])
+        self.assertIn('out of stock', self._read(f'feed-{shard}.xml.gz'))
+
+        last = self.goods[-1]
+        last.price = Decimal('8.00')
+        last.save()
+        last_shard = feeds.shard_of(last.id)
+        self.assertEqual(feeds.write_feeds(self.root).written,
+                         [f'sitemap-{last_shard}.xml.gz', f'feed-{last_shard}.xml.gz'])
+
+        for goods in self.shards[last_shard]:
+            goods.delete()
+        stats = feeds.write_feeds(self.root)
+        self.assertEqual(stats.removed, [f'sitemap-{last_shard}.xml.gz', f'feed-{last_shard}.xml.gz'])
+        with open(os.path.join(self.root, 'sitemap.xml'), encoding='utf-8') as handle:
+            index = handle.read()
+        self.assertNotIn(f'sitemap-{last_shard}.xml.gz', index)
+        self.assertIn(f'https://shop.example/sitemap-{shard}.xml.gz', index)
+
+    def test_streaming_views_and_keyset_iteration(self):
+        response = self.client.get(reverse('sitemap_index'))
+        self.assertTrue(response.streaming)
+        index = b''.join(response.streaming_content).decode()
+        self.assertEqual(index.count('<sitemap>'), feeds.shard_count())
+
+        shard, goods_list = next(iter(self.shards.items()))
+        body = b''.join(self.client.get(reverse('sitemap_shard', args=[shard])).streaming_content).decode()
+        self.assertEqual(body.count('<url>'), len(goods_list))
+        feed = b''.join(self.client.get(reverse('product_feed', args=[shard])).streaming_content).decode()
+        self.assertIn(f'<g:id>{goods_list[0].id}</g:id>', feed)
+        self.assertIn('<g:availability>in stock</g:availability>', feed)
+
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(feeds.iter_rows(('id',), chunk=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 1])
+        self.assertEqual(len(queries), 2)
+
+
+class ShardedStockTests(TempSnapshotMixin, TestCase):
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(cname='秒杀')
+        self.goods = Goods.objects.create(gname='秒杀商品', gdesc='-', price=Decimal('1.00'), category=category,
+                                          brand='b', stock=10)
+        stock.enable_sharding(self.goods.id, shards=4)
+
+    def _shards(self):
+        shards = GoodsStockShard.objects.filter(goods=self.goods).order_by('shard')
+        return list(shards.values_list('quantity', flat=True))
+
+    def test_decrements_fall_back_across_shards_without_overselling(self):
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self.assertTrue(stock.decrement(self.goods.id, 3))
+        self.assertEqual(sum(self._shards()), 7)
+
+        # 没有单个分片够 6 件时跨分片扣减
+        self.assertTrue(stock.decrement(self.goods.id, 6, shards=4))
+        self.assertEqual(sum(self._shards()), 1)
+        self.assertFalse(stock.decrement(self.goods.id, 2, shards=4))
+        self.assertEqual(sum(self._shards()), 1)
+
+        stock.increment(self.goods.id, 4)
+        self.assertEqual(stock.rebalance(self.goods.id), 5)
+        self.assertEqual(self._shards(), [2, 1, 1, 1])
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.stock, 5)
+
+    def test_total_is_cached_and_bulk_updates_resplit_shards(self):
+        self.assertEqual(stock.available(self.goods.id), 10)
+        stock.decrement(self.goods.id, 1)
+        with self.assertNumQueries(1):  # 只查非分片商品的库存列，分片总数命中缓存
+            self.assertEqual(stock.available(self.goods.id), 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.apply_updates([(1, {'id': self.goods.id, 'stock': 6})])
+        self.assertEqual(self._shards(), [2, 2, 1, 1])
+        self.assertEqual(stock.available(self.goods.id), 6)
+
+        stock.disable_sharding(self.goods.id)
+        self.goods.refresh_from_db()
+        self.assertEqual((self.goods.stock, self.goods.stock_shard_count), (6, 0))
+        self.assertTrue(stock.decrement(self.goods.id, 6))
+        self.assertFalse(stock.decrement(self.goods.id, 1))
+
+    def test_imported_and_edited_stock_survives_rebalance(self):
+        from .importer import GoodsImporter
+
+        row = {'gname': self.goods.gname, 'price': '1.00', 'category': self.goods.category_id, 'stock': '20'}
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = GoodsImporter().run([(1, row)])
+        self.assertEqual(stats.upserted, 1)
+        self.assertEqual(self._shards(), [5, 5, 5, 5])
+        self.assertEqual(stock.rebalance(self.goods.id), 20)
+        self.assertEqual(stock.available(self.goods.id), 20)
+
+        self.goods.refresh_from_db()
+        serializer = GoodsSerializer(self.goods, data={'stock': 7}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        self.assertEqual(stock.rebalance(self.goods.id), 7)
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.stock, 7)
+
+    def test_increment_on_missing_shard_goes_to_an_existing_shard(self):
+        GoodsStockShard.objects.filter(goods=self.goods, shard=3).delete()
+        with patch('goodsapp.stock.random.randrange', return_value=3):
+            stock.increment(self.goods.id, 5, shards=4)
+        self.assertEqual(self._shards(), [8, 3, 2])
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.stock, 10)  # 不加到 Goods.stock：rebalance 会用分片之和覆盖它
+        self.assertEqual(stock.rebalance(self.goods.id), 13)
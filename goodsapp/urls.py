@@ -6,8 +6,18 @@ from goodsapp import views
 urlpatterns = [
     # userapp路由操作
     path('home/', views.get_categories, name='home'),
+    path('homepage/', views.homepage_view, name='homepage'),
     path('categories/', views.category_list, name='category_list'),
     path('category/<int:cid>/', views.category_goods, name='category_goods'),
+    path('goods/', views.goods_multi_get, name='goods_multi_get'),
     path('goods/<int:goods_id>/', views.goods_detail, name='goods_detail'),
+    path('goods/suggest/', views.goods_suggest, name='goods_suggest'),
+    path('goods/hot/', views.hot_products, name='hot_products'),
+    path('sitemap.xml', views.sitemap_index_view, name='sitemap_index'),
+    path('sitemap-<int:shard>.xml', views.sitemap_shard_view, name='sitemap_shard'),
+    path('feed-<int:shard>.xml', views.product_feed_view, name='product_feed'),
+    path('catalog/changes/', views.catalog_changes, name='catalog_changes'),
+    path('goods/bulk-update/', views.goods_bulk_update, name='goods_bulk_update'),
+    path('goods/<int:goods_id>/recommendations/', views.goods_recommendations, name='goods_recommendations'),
 ]
 
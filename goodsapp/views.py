@@ -1,11 +1,26 @@
-from rest_framework.decorators import api_view
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+import io
+from dataclasses import asdict
+import re
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import viewsets
 # 分页器
 # from rest_framework import status
 # from rest_framework.pagination import PageNumberPagination
-from goodsapp.models import Category, Goods
-from goodsapp.serializers import CategorySerializer, GoodsListSerializer, GoodsDetailPageSerializer,GoodsSerializer
+from goodsapp.models import SUPPORTED_LANGUAGES, Category, Goods
+from goodsapp.serializers import CategorySerializer, GoodsSerializer, \
+    GoodsLocalizedListSerializer, parse_fields
+from goodsapp import autocomplete, bulk, columnar, counters, detail_cache, facets, feeds, homepage, leaderboard, \
+    projections, recommendations, sync
+from goodsapp.importer import detect_format, read_rows
+from pricingapp.currency import base_currency, localize_goods
+from pricingapp.decorators import currency_param
 
 
 # from django.http import FileResponse, HttpResponseNotFound
@@ -13,10 +28,6 @@ from goodsapp.serializers import CategorySerializer, GoodsListSerializer, GoodsD
 # import os
 
 
-# 个性推荐
-# from django.http import HttpRequest
-
-
 # # 自定义分页类
 # class GoodsPagination(PageNumberPagination):
 #     page_size = 8
@@ -24,48 +35,19 @@ from goodsapp.serializers import CategorySerializer, GoodsListSerializer, GoodsD
 #     max_page_size = 100
 
 
-# # 装饰器：实现推荐商品功能  以后可能会用到结算页面之下
-# def recommend_view(func):
-#     def _wrapper(request: HttpRequest, *args, **kwargs):
-#         # 从cookie中获取用户访问的goodid字符串
-#         c_goodidStr = request.COOKIES.get('recommend', '')
-#
-#         # 专门存放goodsid的列表  ['1','2']  ==>   '1 2'
-#         goodsIdList = [gid for gid in c_goodidStr.split() if gid.strip()]
-#
-#         # 获取当前请求的商品id
-#         goodsid = kwargs.get('goodsid')
-#
-#         # 如果有商品id，才进行推荐商品的处理
-#         if goodsid:
-#             # 专门存放推荐商品对象的列表
-#             goodsObjList = [
-#                                Goods.objects.get(id=ggid) for ggid in goodsIdList
-#                                if ggid != goodsid and Goods.objects.get(id=ggid).category_id == Goods.objects.get(
-#                     id=goodsid).category_id
-#                            ][:4]
-#
-#             # 将推荐商品对象列表传递给func函数
-#             response = func(request, *args, **kwargs, recommend_list=goodsObjList)
-#
-#             # 判断用户访问的商品是否已经存在goodsIdList中
-#             if goodsid in goodsIdList:
-#                 goodsIdList.remove(goodsid)
-#                 goodsIdList.insert(0, goodsid)
-#             else:
-#                 goodsIdList.insert(0, goodsid)
-#
-#             # 将用户每次访问的商品ID存放在cookie中
-#             response.set_cookie('recommend', ' '.join(goodsIdList), max_age=3 * 24 * 60 * 60)
-#         else:
-#             response = func(request, *args, **kwargs)
-#
-#         return response
-#
-#     return _wrapper
-#
 # 获取类名
 
+def resolve_language(request):
+    """从查询参数或 Accept-Language 中解析语言，只支持中文和英文（每个请求只解析一次）"""
+    lang = getattr(request, '_goods_language', None)
+    if lang is None:
+        lang = request.query_params.get('lang') or \
+               request.headers.get('Accept-Language', 'zh').split(',')[0]
+        lang = lang if lang in SUPPORTED_LANGUAGES else 'zh'
+        request._goods_language = lang
+    return lang
+
+
 @api_view(['GET'])
 def get_categories(request):
     """原有的获取分类列表的视图函数，用于导航栏"""
@@ -77,6 +59,15 @@ def get_categories(request):
     })
 
 
+@api_view(['GET'])
+def homepage_view(request):
+    """
+    首页聚合数据：分类、热门商品、新品、各分类精选
+    数据由 Celery 任务预先渲染成 JSON 字节存在缓存中，请求只读一次缓存直接返回（价格为基础货币）
+    """
+    return HttpResponse(homepage.get_payload(resolve_language(request)), content_type='application/json')
+
+
 @api_view(['GET'])
 def category_list(request):
     categories = Category.objects.all()
@@ -87,16 +78,63 @@ def category_list(request):
     })
 
 
+def _parse_int(value):
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed >= 0 else None
+
+
+def _query_category_goods_ids(category_id, filters, ordering, limit, offset):
+    """优先使用内存列式快照做筛选排序，快照过期或按销量、库存排序时回退到 ORM"""
+    volatile = bool(ordering) and ordering.lstrip('-') in columnar.VOLATILE_FIELDS
+    snapshot = None if volatile else columnar.get_snapshot()
+    if snapshot is not None:
+        return snapshot.query(category_id=category_id, filters=filters, ordering=ordering,
+                              limit=limit, offset=offset)
+
+    queryset = facets.filter_queryset(Goods.objects.filter(category_id=category_id), filters)
+    queryset = queryset.order_by(ordering, 'id') if ordering else queryset.order_by('id')
+    ids = queryset.values_list('id', flat=True)
+    if limit is not None:
+        return list(ids[offset:offset + limit])
+    return list(ids[offset:])
+
+
+def _localized_list(request, goods_ids):
+    """按 ?fields= 只读取并输出需要的列（未传时不读取描述等列表页不用的列）"""
+    fields = parse_fields(request)
+    rows = projections.localized_rows(goods_ids, resolve_language(request),
+                                      GoodsLocalizedListSerializer.columns_for(fields))
+    return GoodsLocalizedListSerializer(rows, many=True, fields=fields).data
+
+
 @api_view(['GET'])
+@currency_param
 def category_goods(request, cid):
     try:
         category = Category.objects.get(id=cid)
-        goods = Goods.objects.filter(category=category)
-        serializer = GoodsListSerializer(goods, many=True)
+        # 分面筛选：品牌、价格区间、热门、新品
+        filters = facets.parse_filters(request.query_params)
+        ordering = request.query_params.get('ordering') or None
+        if ordering and ordering.lstrip('-') not in columnar.ORDERING_FIELDS:
+            ordering = None
+        limit = _parse_int(request.query_params.get('limit'))
+        offset = _parse_int(request.query_params.get('offset')) or 0
+        goods_ids = _query_category_goods_ids(category.id, filters, ordering, limit, offset)
+        # 从按语言展开的读模型中一次取出整页数据
+        goods = _localized_list(request, goods_ids)
+        localize_goods(goods, request.currency)
+        facet_index = facets.get_facet_index(category.id)
         return Response({
             'status': 'success',
             'category': CategorySerializer(category).data,
-            'goods': serializer.data
+            'goods': goods,
+            'currency': request.currency or base_currency(),
+            'filters': filters,
+            'total': facet_index.count(filters),
+            'facets': facet_index.facet_counts(filters),
         })
     except Category.DoesNotExist:
         return Response({
@@ -106,19 +144,196 @@ def category_goods(request, cid):
 
 
 @api_view(['GET'])
+@currency_param
 def goods_detail(request, goods_id):
+    # 详情走按商品缓存；?fields= 同时裁剪输出和未命中时的查询列
+    data = detail_cache.get(goods_id, parse_fields(request))
+    if data is None:
+        return Response({
+            'status': 'error',
+            'message': '商品不存在'
+        }, status=404)
+    localize_goods([data], request.currency)
+    counters.increment(goods_id, 'views')
+    return Response({
+        'status': 'success',
+        'goods': data,
+        'currency': request.currency or base_currency(),
+    })
+
+
+@api_view(['GET'])
+@currency_param
+def goods_multi_get(request):
+    """
+    批量获取商品详情：goods/?ids=1,2,3
+    先批量读详情缓存，未命中的商品一次查询 + 一次图片预取，结果按请求顺序返回
+    """
+    max_ids = getattr(settings, 'GOODS_MULTI_GET_MAX_IDS', 200)
+    try:
+        goods_ids = list(dict.fromkeys(int(value) for value in request.query_params.get('ids', '').split(',')
+                                       if value.strip()))
+    except ValueError:
+        return Response({'status': 'error', 'message': 'ids 必须是逗号分隔的商品 ID'}, status=400)
+    if not goods_ids:
+        return Response({'status': 'error', 'message': '缺少 ids 参数'}, status=400)
+    if len(goods_ids) > max_ids:
+        return Response({'status': 'error', 'message': f'一次最多查询 {max_ids} 个商品'}, status=400)
+
+    found = detail_cache.get_many(goods_ids, parse_fields(request))
+    goods = [found[goods_id] for goods_id in goods_ids if goods_id in found]
+    localize_goods(goods, request.currency)
+    return Response({
+        'status': 'success',
+        'goods': goods,
+        'missing': [goods_id for goods_id in goods_ids if goods_id not in found],
+        'currency': request.currency or base_currency(),
+    })
+
+
+@api_view(['GET'])
+def goods_suggest(request):
+    """商品名称联想（输入前缀，按销量排序）"""
+    prefix = request.query_params.get('q', '').strip()
     try:
-        goods = Goods.objects.get(id=goods_id)
-        serializer = GoodsDetailPageSerializer(goods)
+        limit = int(request.query_params.get('limit', 0)) or None
+    except ValueError:
+        limit = None
+    max_results = getattr(settings, 'AUTOCOMPLETE_MAX_RESULTS', 10)
+    limit = min(limit or max_results, max_results)
+    lang = resolve_language(request)
+    return Response({
+        'status': 'success',
+        'lang': lang,
+        'suggestions': autocomplete.suggest(prefix, lang, limit) if prefix else [],
+    })
+
+
+@api_view(['GET'])
+@currency_param
+def hot_products(request):
+    """热销榜：按窗口（1h/24h/7d）统计销量，可按分类筛选"""
+    window = request.query_params.get('window', '24h')
+    if window not in leaderboard.WINDOWS:
         return Response({
-            'status': 'success',
-            'goods': serializer.data
-        })
-    except Goods.DoesNotExist:
+            'status': 'error',
+            'message': f"window 只支持 {', '.join(leaderboard.WINDOWS)}"
+        }, status=400)
+    category_id = _parse_int(request.query_params.get('category'))
+    limit = _parse_int(request.query_params.get('limit'))
+    top = leaderboard.top_products(window, category_id=category_id, limit=limit)
+    units = dict(top)
+    goods = _localized_list(request, [goods_id for goods_id, _ in top])
+    for item in goods:
+        item['units_sold'] = units[item['id']]
+    localize_goods(goods, request.currency)
+    return Response({
+        'status': 'success',
+        'window': window,
+        'category': category_id,
+        'goods': goods,
+        'currency': request.currency or base_currency(),
+    })
+
+
+@api_view(['GET'])
+@currency_param
+def goods_recommendations(request, goods_id):
+    """“买了该商品的用户还买了”：邻居列表来自缓存，商品信息来自 GoodsLocalized 读模型"""
+    goods_ids = recommendations.get_recommendations(goods_id)
+    if not goods_ids and not Goods.objects.filter(id=goods_id).exists():
         return Response({
             'status': 'error',
             'message': '商品不存在'
         }, status=404)
+    goods = _localized_list(request, goods_ids)
+    localize_goods(goods, request.currency)
+    return Response({
+        'status': 'success',
+        'goods_id': goods_id,
+        'recommendations': goods,
+        'currency': request.currency or base_currency(),
+    })
+
+
+@require_safe
+def sitemap_index_view(request):
+    """
+    sitemap 索引：每个分片最多 50000 个商品 URL，分片按商品 id 区间划分
+    """
+    locations = (request.build_absolute_uri(reverse('sitemap_shard', args=[shard]))
+                 for shard in range(feeds.shard_count()))
+    return StreamingHttpResponse(feeds.sitemap_index(locations), content_type='application/xml')
+
+
+@require_safe
+def sitemap_shard_view(request, shard):
+    """
+    单个 sitemap 分片：按 id 键集分页流式输出，不在内存中保留整张表
+    """
+    return StreamingHttpResponse(feeds.sitemap(shard), content_type='application/xml')
+
+
+@require_safe
+def product_feed_view(request, shard):
+    """
+    商品 feed 分片（Google Merchant RSS 格式，价格为基础货币），同样流式输出
+    """
+    return StreamingHttpResponse(feeds.product_feed(shard), content_type='application/xml')
+
+
+@api_view(['GET'])
+def catalog_changes(request):
+    """
+    目录增量同步：返回 since 之后新增、修改和删除的商品、图片和分类
+    客户端保存返回的 next_since 作为下次的 since，has_more 为 true 时继续拉取；reset 为 true 时需丢弃本地数据
+    """
+    since = _parse_int(request.query_params.get('since', 0))
+    if since is None:
+        return Response({'status': 'error', 'message': 'since 必须是非负整数'}, status=400)
+    page = sync.changes_since(since, _parse_int(request.query_params.get('limit')), resolve_language(request))
+    return Response({'status': 'success', **asdict(page)})
+
+
+_BATCH_ID_RE = re.compile(r'^[\w-]{1,40}$')
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def goods_bulk_update(request):
+    """
+    批量更新商品价格和库存
+    请求体为 [{"id": 1, "price": "9.90", "stock": 5}, ...]（或 {"items": [...]}），
+    也可以上传 CSV/JSONL 文件（字段 file，列 id,price,stock），文件按行流式读取。
+    可选 batch_id 用于重试去重：同一批次重复提交不会重复产生外盒事件。
+    """
+    batch_id = request.query_params.get('batch_id') or (
+        request.data.get('batch_id') if hasattr(request.data, 'get') else None
+    )
+    if batch_id is not None and not _BATCH_ID_RE.match(str(batch_id)):
+        return Response({'status': 'error', 'message': 'batch_id 只能包含字母、数字、下划线和连字符（最多 40 个字符）'},
+                        status=400)
+
+    upload = request.FILES.get('file')
+    if upload is not None:
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        rows = read_rows(stream, detect_format(upload.name))
+    else:
+        items = request.data.get('items') if hasattr(request.data, 'get') else request.data
+        if not isinstance(items, list):
+            return Response({'status': 'error', 'message': '请求体必须是商品列表或上传文件'}, status=400)
+        rows = enumerate(items, start=1)
+
+    result = bulk.apply_updates(rows, batch_id=batch_id, source='goods.bulk_update')
+    return Response({
+        'status': 'success',
+        'batch_id': result.batch_id,
+        'rows': result.rows,
+        'updated': result.updated,
+        'chunks': result.chunks,
+        'invalid': result.invalid,
+        'errors': result.errors,
+    })
 
 
 class GoodsViewSet(viewsets.ModelViewSet):
@@ -129,12 +344,20 @@ class GoodsViewSet(viewsets.ModelViewSet):
         """添加语言参数到序列化器上下文"""
         context = super().get_serializer_context()
         # 从请求头或查询参数中获取语言设置
-        lang = self.request.query_params.get('lang') or \
-               self.request.headers.get('Accept-Language', 'zh').split(',')[0]
-        # 只支持中文和英文
-        context['language'] = lang if lang in ['zh', 'en'] else 'zh'
+        context['language'] = resolve_language(self.request)
         return context
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = queryset.only(*GoodsSerializer.columns_for(parse_fields(self.request)))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method in SAFE_METHODS:
+            kwargs.setdefault('fields', parse_fields(self.request))
+        return super().get_serializer(*args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """创建商品时处理多语言数据"""
         serializer = self.get_serializer(data=request.data)
@@ -0,0 +1,228 @@
+"""Flash-sale admission with pre-allocated stock tokens.
+
+When a :class:`~orderapp.models.FlashSale` starts, :func:`start` moves its
+quantity out of ``Goods.stock`` and stores it in one integer cache key:
+Redis in production and the local memory cache in tests. Checkout
+(:func:`admit`) ``DECR``\\ s that counter before opening a transaction. A
+buyer who gets no token is rejected before any order, stock or reservation
+query runs. ``add_to_cart`` also rejects a goods whose tokens are exhausted
+(:func:`remaining`), but it does not hold tokens. Carts are not orders, and
+holding tokens in carts would let idle carts hoard the sale.
+
+Admitted lines do not decrement ``Goods.stock`` again. Their
+``StockReservation`` points at the sale. An expired order returns its tokens
+while the sale runs, and returns its stock after reconciliation.
+:func:`reconcile` runs ``FLASH_SALE_RECONCILE_GRACE_SECONDS`` after the sale
+ends, so that checkouts admitted before the end have committed. It counts
+the reservations still held as sold and gives the rest back to
+``Goods.stock``.
+
+Admission fails closed. If the counter is missing, for example after a
+cache flush, buyers are rejected until :func:`sync` reloads it from the
+database. Checkouts that were admitted before the loss may not have
+committed their reservations yet, and counting the reservations at that
+moment would hand out their tokens twice. :func:`sync` therefore waits
+``FLASH_SALE_RECONCILE_GRACE_SECONDS`` after it first sees the loss before
+it reloads. If the cache is unreachable, the buyer is rejected.
+"""
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from goodsapp import stock
+
+from .models import FlashSale, StockReservation
+
+logger = logging.getLogger(__name__)
+
+_CACHE_PREFIX = 'orderapp:flash'
+
+
+class SoldOut(Exception):
+    def __init__(self, goods_id: int):
+        super().__init__(f'goods {goods_id}: flash sale sold out')
+        self.goods_id = goods_id
+
+
+def _tokens_key(sale_id: int) -> str:
+    return f'{_CACHE_PREFIX}:tokens:{sale_id}'
+
+
+def _goods_key(goods_id: int) -> str:
+    return f'{_CACHE_PREFIX}:goods:{goods_id}'
+
+
+def _lost_key(sale_id: int) -> str:
+    return f'{_CACHE_PREFIX}:lost:{sale_id}'
+
+
+def _grace_seconds() -> int:
+    return getattr(settings, 'FLASH_SALE_RECONCILE_GRACE_SECONDS', 60)
+
+
+def _held(sale: FlashSale) -> int:
+    """Units of ``sale`` in unreleased reservations."""
+    return StockReservation.objects.filter(flash_sale=sale, released_at__isnull=True) \
+        .aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def _publish(sale: FlashSale, tokens: int, *, replace: bool = True) -> None:
+    (cache.set if replace else cache.add)(_tokens_key(sale.id), tokens, None)
+    cache.set(_goods_key(sale.goods_id), (sale.id, sale.ends_at.timestamp()), None)
+
+
+def start(sale: FlashSale) -> FlashSale:
+    """Pre-allocate the stock of ``sale`` and load its tokens (at most the stock on hand)."""
+    with transaction.atomic():
+        sale = FlashSale.objects.select_for_update().get(pk=sale.pk)
+        if sale.started_at is not None:
+            return sale
+        taken = min(sale.quantity, max(stock.available(sale.goods_id), 0))
+        if not stock.decrement(sale.goods_id, taken):  # 读取后库存被并发扣减：下次 sync 重试
+            raise RuntimeError(f'goods {sale.goods_id}: stock changed while starting flash sale {sale.pk}')
+        sale.quantity, sale.started_at = taken, timezone.now()
+        sale.save(update_fields=['quantity', 'started_at'])
+        transaction.on_commit(lambda: _publish(sale, taken))
+    return sale
+
+
+def remaining(goods_id: int) -> int | None:
+    """Tokens left for ``goods_id``; None when the goods has no running flash sale."""
+    entry = cache.get(_goods_key(goods_id))
+    if entry is None or entry[1] <= timezone.now().timestamp():
+        return None
+    return cache.get(_tokens_key(entry[0])) or 0
+
+
+def _take(sale_id: int, quantity: int) -> bool:
+    try:
+        left = cache.decr(_tokens_key(sale_id), quantity)
+    except ValueError:  # 计数器丢失（缓存被清空）：拒绝，等 sync() 在宽限期后按数据库重新装载
+        return False
+    if left is None:  # 缓存不可用（IGNORE_EXCEPTIONS），拒绝而不是超卖
+        return False
+    if left < 0:
+        _return_tokens(sale_id, quantity)
+        return False
+    return True
+
+
+def admit(lines: Iterable[tuple[int, int]]) -> dict[int, tuple[int, int]]:
+    """Take tokens for the flash-sale goods among ``lines``; returns ``{goods id: (sale id, quantity)}``.
+
+    Raises :class:`SoldOut` (after giving back what was taken) when a goods
+    has too few tokens left. Goods without a running sale are ignored.
+    """
+    wanted: Counter[int] = Counter()
+    for goods_id, quantity in lines:
+        wanted[goods_id] += quantity
+    now = timezone.now().timestamp()
+    entries = cache.get_many([_goods_key(goods_id) for goods_id in wanted])
+    admitted: dict[int, tuple[int, int]] = {}
+    for goods_id in sorted(wanted):
+        entry = entries.get(_goods_key(goods_id))
+        if entry is None or entry[1] <= now:
+            continue
+        if not _take(entry[0], wanted[goods_id]):
+            refund(admitted)
+            raise SoldOut(goods_id)
+        admitted[goods_id] = (entry[0], wanted[goods_id])
+    return admitted
+
+
+def _return_tokens(sale_id: int, quantity: int) -> None:
+    try:
+        cache.incr(_tokens_key(sale_id), quantity)
+    except ValueError:  # 计数器丢失：下次 _take 时按数据库重新装载，不会少算
+        pass
+
+
+def refund(admitted: dict[int, tuple[int, int]]) -> None:
+    for sale_id, quantity in admitted.values():
+        _return_tokens(sale_id, quantity)
+
+
+@contextmanager
+def admission(lines: Iterable[tuple[int, int]]):
+    """:func:`admit` for the block; tokens are given back if the block raises."""
+    admitted = admit(lines)
+    try:
+        yield admitted
+    except BaseException:
+        refund(admitted)
+        raise
+
+
+def give_back(sale: FlashSale, quantity: int) -> None:
+    """Return the tokens of a released reservation of a running sale."""
+    _return_tokens(sale.id, quantity)
+
+
+def reconcile(sale: FlashSale) -> FlashSale:
+    """Close ``sale``: count the held reservations as sold and return the rest to ``Goods.stock``."""
+    with transaction.atomic():
+        sale = FlashSale.objects.select_for_update().get(pk=sale.pk)
+        if sale.reconciled_at is not None or sale.started_at is None:
+            return sale
+        sale.sold = _held(sale)
+        unsold = sale.quantity - sale.sold
+        if unsold > 0:
+            stock.increment(sale.goods_id, unsold)
+        sale.reconciled_at = timezone.now()
+        sale.save(update_fields=['sold', 'reconciled_at'])
+
+        def unpublish(sale=sale):
+            cache.delete_many([_tokens_key(sale.id), _goods_key(sale.goods_id)])
+
+        transaction.on_commit(unpublish)
+    return sale
+
+
+def _restore(sale: FlashSale, now) -> None:
+    """Re-publish the lost keys of a running ``sale`` (for example after a Redis restart)."""
+    keys = cache.get_many([_tokens_key(sale.id), _goods_key(sale.goods_id)])
+    if _tokens_key(sale.id) in keys:
+        if _goods_key(sale.goods_id) not in keys:
+            _publish(sale, 0, replace=False)  # 计数器还在：只补回商品键，不覆盖正在扣减的计数器
+        return
+    # 计数器丢失时，已拿到令牌的下单可能尚未提交预留，此刻按数据库重算会多发令牌。
+    # 先记下丢失时间，宽限期过后（这些下单已提交或已回滚）再重新装载；期间 _take 一律拒绝
+    cache.add(_lost_key(sale.id), now.timestamp(), None)
+    lost_at = cache.get(_lost_key(sale.id), now.timestamp())
+    if now.timestamp() - lost_at < _grace_seconds():
+        return
+    _publish(sale, sale.quantity - _held(sale), replace=False)
+    cache.delete(_lost_key(sale.id))
+
+
+def sync() -> dict:
+    """Start due sales, restore lost keys of running ones and reconcile finished ones (beat task)."""
+    now = timezone.now()
+    due = FlashSale.objects.filter(started_at__isnull=True, starts_at__lte=now, ends_at__gt=now)
+    started = []
+    for sale in due:
+        try:
+            started.append(start(sale).id)
+        except RuntimeError as exc:
+            logger.warning('Failed to start flash sale %s: %s', sale.pk, exc)
+    for sale in FlashSale.objects.filter(started_at__isnull=False, reconciled_at__isnull=True, ends_at__gt=now):
+        _restore(sale, now)
+    cutoff = now - timedelta(seconds=_grace_seconds())
+    reconciled = [reconcile(sale).id for sale in FlashSale.objects.filter(
+        started_at__isnull=False, reconciled_at__isnull=True, ends_at__lte=cutoff)]
+    if started or reconciled:
+        logger.info('Flash sales started=%s reconciled=%s', started, reconciled)
+    return {'started': started, 'reconciled': reconciled}
+
+
+__all__ = ['SoldOut', 'admission', 'admit', 'give_back', 'reconcile', 'refund', 'remaining', 'start', 'sync']
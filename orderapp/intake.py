@@ -0,0 +1,147 @@
+"""Asynchronous checkout intake (``CHECKOUT_ASYNC_ENABLED``).
+
+With the flag on, ``POST /api/order/checkout/`` only checks the real-name
+status and the address, stores a :class:`~orderapp.models.CheckoutTicket`
+and answers ``202`` with the ticket id. Tax lookups, stock row locks and
+order inserts move to the ``orders`` Celery queue. Clients poll
+``GET /api/order/checkout/tickets/<id>/`` for the outcome.
+
+:func:`submit` schedules :func:`drain` at most once per
+``_SCHEDULE_TTL`` window through a cache key. The task deletes the key
+before it claims tickets, so a ticket committed while a batch runs
+schedules the next run. The ``process-checkout-intake`` beat task catches
+tickets whose enqueue was lost.
+
+:func:`process_batch` reads up to ``CHECKOUT_INTAKE_BATCH_SIZE`` pending
+tickets and loads their real-name status in one query. Each ticket is then
+placed and committed in its own short transaction, which claims it with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so several workers can drain the
+queue side by side. Goods row locks are therefore held for one order, in
+the goods id order :func:`~orderapp.reservations.reserve` uses, never across
+a batch. Order items and reservations are still inserted with one bulk
+statement per order. Any error while placing a ticket rolls back that
+ticket's savepoint and marks only that ticket failed, whether it is a
+rejected cart or an unexpected database error. One bad ticket therefore
+cannot block the queue.
+"""
+from __future__ import annotations
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from cartapp.models import CartItem
+from userapp.models import RealName
+
+from .checkout import CheckoutRejected, OrderWrites, place_order
+from .models import CheckoutTicket
+
+logger = logging.getLogger(__name__)
+
+_SCHEDULED_KEY = 'orderapp:intake:scheduled'
+_SCHEDULE_TTL = 30
+_MAX_BATCHES = 20
+
+
+def enabled() -> bool:
+    return getattr(settings, 'CHECKOUT_ASYNC_ENABLED', False)
+
+
+def batch_size() -> int:
+    return getattr(settings, 'CHECKOUT_INTAKE_BATCH_SIZE', 50)
+
+
+def schedule() -> None:
+    """Enqueue the intake task unless a run is already pending."""
+    if not cache.add(_SCHEDULED_KEY, 1, _SCHEDULE_TTL):
+        return
+    try:
+        from .tasks import process_checkout_intake
+    except ModuleNotFoundError:
+        logger.warning("未安装 Celery，无法处理异步下单。")
+        return
+
+    try:
+        process_checkout_intake.delay()
+    except Exception as exc:  # pragma: no cover - Celery misconfiguration fallback
+        cache.delete(_SCHEDULED_KEY)
+        logger.warning("异步下单任务入队失败: %s", exc)
+
+
+def submit(user_id: int, address_id: int) -> CheckoutTicket:
+    ticket = CheckoutTicket.objects.create(userinfo_id=user_id, address_id=address_id)
+    transaction.on_commit(schedule)
+    return ticket
+
+
+def _process(ticket_id, verified: bool) -> str | None:
+    """Place one ticket in its own transaction; returns its new status, None if another worker has it."""
+    with transaction.atomic():
+        ticket = (CheckoutTicket.objects.select_for_update(skip_locked=True, of=('self',))
+                  .select_related('address')
+                  .filter(pk=ticket_id, status=CheckoutTicket.Status.PENDING)
+                  .first())
+        if ticket is None:
+            return None
+        try:
+            with OrderWrites(source='checkout.intake') as writes, transaction.atomic():
+                if not verified:
+                    raise CheckoutRejected('请先完成实名认证')
+                # 同一用户的第二张凭据拿到空购物车：第一张已经下单
+                cart_items = CartItem.objects.select_related('goods') \
+                    .filter(userInfo_id=ticket.userinfo_id, is_delete=False).order_by('id')
+                placed = place_order(ticket.userinfo_id, ticket.address, cart_items, writes)
+                writes.flush()
+        except CheckoutRejected as exc:
+            ticket.status, ticket.message, ticket.goods_id = CheckoutTicket.Status.FAILED, exc.message, exc.goods_id
+        except Exception:  # 死锁、约束冲突等：只让这一张凭据失败，不阻塞后面的凭据
+            logger.exception('Checkout ticket %s failed', ticket.id)
+            ticket.status, ticket.message = CheckoutTicket.Status.FAILED, '下单失败，请重新提交'
+        else:
+            ticket.status, ticket.order = CheckoutTicket.Status.COMPLETED, placed.order
+        ticket.processed_at = timezone.now()
+        ticket.save(update_fields=['status', 'order', 'message', 'goods_id', 'processed_at'])
+        return ticket.status
+
+
+def process_batch(limit: int | None = None) -> dict[str, int]:
+    """Place the orders of up to ``limit`` pending tickets; returns the ticket counts."""
+    limit = limit or batch_size()
+    counts = {'claimed': 0, 'completed': 0, 'failed': 0}
+    candidates = list(CheckoutTicket.objects.filter(status=CheckoutTicket.Status.PENDING)
+                      .order_by('created_at').values_list('id', 'userinfo_id')[:limit])
+    if not candidates:
+        return counts
+    verified = set(RealName.objects.filter(rUserInfo__in={user_id for _, user_id in candidates}, is_verified=True)
+                   .values_list('rUserInfo_id', flat=True))
+    for ticket_id, user_id in candidates:
+        status = _process(ticket_id, user_id in verified)
+        if status is not None:
+            counts['claimed'] += 1
+            counts[status] += 1
+    return counts
+
+
+def drain(max_batches: int = _MAX_BATCHES) -> dict[str, int]:
+    """Process batches until no pending ticket is left; reschedules itself after ``max_batches``."""
+    cache.delete(_SCHEDULED_KEY)
+    limit = batch_size()
+    totals = {'batches': 0, 'completed': 0, 'failed': 0}
+    for _ in range(max_batches):
+        counts = process_batch(limit)
+        if not counts['claimed']:
+            break
+        totals['batches'] += 1
+        totals['completed'] += counts['completed']
+        totals['failed'] += counts['failed']
+        if counts['claimed'] < limit:
+            break
+    else:
+        schedule()  # 积压未清空：交给下一次任务，不长时间占用工作进程
+    return totals
+
+
+__all__ = ['batch_size', 'drain', 'enabled', 'process_batch', 'schedule', 'submit']
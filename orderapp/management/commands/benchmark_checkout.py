@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import statistics
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from cartapp.models import CartItem
+from goodsapp.models import Category, Goods
+from orderapp.views import CheckoutAPIView
+from pricingapp.landed_cost import destination_for, get_table
+from pricingapp.shipping import get_tables
+from userapp.models import Address, RealName, UserInfo
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "结账耗时与查询数基准：按不同购物车行数重复下单，报告 p50/p99 延迟和每单查询数（全部在事务内执行后回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', default='1,10,100', help='逗号分隔的购物车行数')
+        parser.add_argument('--runs', type=int, default=50, help='每种行数的下单次数')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(value) for value in options['lines'].split(',') if value.strip()})
+        except ValueError:
+            raise CommandError('--lines 必须是逗号分隔的整数')
+        runs = options['runs']
+        if not sizes or min(sizes) < 1 or runs < 1:
+            raise CommandError('--lines 和 --runs 必须大于 0')
+        try:
+            with transaction.atomic():
+                self._run(sizes, runs)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write('已回滚测试数据')
+
+    def _run(self, sizes, runs):
+        tag = uuid.uuid4().hex[:8]
+        user = UserInfo.objects.create_user(account=f'bench-{tag}@example.com', password=uuid.uuid4().hex,
+                                            username=f'bench-{tag}')
+        RealName.objects.create(identity_card=tag.ljust(18, '0'), realname='bench', is_verified=True, rUserInfo=user)
+        address = Address.objects.create(aname='bench', aphone='00000000000', addr='-', aUserInfo=user)
+        category = Category.objects.create(cname=f'bench-{tag}')
+        goods = Goods.objects.bulk_create([
+            Goods(gname=f'bench-{tag}-{index}', gdesc='-', brand='-', price=Decimal('1.00'), category=category,
+                  stock=runs * (len(sizes) + 1))
+            for index in range(max(sizes))
+        ])
+        # 预热进程内的税率表和运费表，首单不计入表加载
+        get_table(destination_for(address))
+        get_tables()
+        view = CheckoutAPIView.as_view()
+        factory = APIRequestFactory()
+
+        query_counts = {}
+        for size in sizes:
+            latencies, counts = [], set()
+            for _ in range(runs):
+                CartItem.objects.bulk_create([
+                    CartItem(userInfo=user, goods=item, price=1, num=1, is_delete=False) for item in goods[:size]
+                ])
+                request = factory.post('/api/order/checkout/', {'address_id': address.id}, format='json')
+                force_authenticate(request, user=user)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 201:
+                    raise CommandError(f'{size} 行结账失败: {response.status_code} {response.data}')
+                counts.add(len(queries))
+            latencies.sort()
+            query_counts[size] = counts
+            self.stdout.write(
+                f"{size} 行：p50 {statistics.median(latencies):.2f}ms，"
+                f"p99 {latencies[max(int(len(latencies) * 0.99) - 1, 0)]:.2f}ms，"
+                f"每单查询 {'/'.join(map(str, sorted(counts)))}"
+            )
+
+        if len(set().union(*query_counts.values())) == 1:
+            self.stdout.write(self.style.SUCCESS('查询数与购物车行数无关'))
+        else:
+            self.stdout.write(self.style.WARNING(f'查询数随行数变化: {query_counts}'))
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from goodsapp.models import Goods
+from orderapp import flash_sale
+from orderapp.models import FlashSale
+
+
+class Command(BaseCommand):
+    help = "创建秒杀活动：开始时从库存预扣件数装入缓存令牌，结束后由 sync_flash_sales 任务把未售出的件数归还库存"
+
+    def add_arguments(self, parser):
+        parser.add_argument('goods_id', type=int)
+        parser.add_argument('quantity', type=int, help='本场可售件数（开始时不超过当时库存）')
+        parser.add_argument('--starts-at', help='开始时间（ISO 8601），默认立即开始')
+        parser.add_argument('--minutes', type=int, default=30, help='持续分钟数')
+
+    def handle(self, *args, **options):
+        if options['quantity'] < 1 or options['minutes'] < 1:
+            raise CommandError('quantity 和 --minutes 必须大于 0')
+        if not Goods.objects.filter(id=options['goods_id']).exists():
+            raise CommandError(f"商品不存在: {options['goods_id']}")
+        starts_at = timezone.now()
+        if options['starts_at']:
+            starts_at = parse_datetime(options['starts_at'])
+            if starts_at is None:
+                raise CommandError('--starts-at 格式错误')
+            if timezone.is_naive(starts_at):
+                starts_at = timezone.make_aware(starts_at)
+        sale = FlashSale.objects.create(goods_id=options['goods_id'], quantity=options['quantity'],
+                                        starts_at=starts_at, ends_at=starts_at + timedelta(minutes=options['minutes']))
+        if starts_at <= timezone.now():
+            sale = flash_sale.start(sale)
+        state = '已开始' if sale.started_at else '待开始'
+        self.stdout.write(self.style.SUCCESS(f'秒杀活动 {sale.id}（{state}）: 商品 {sale.goods_id}，{sale.quantity} 件'))
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import random
+import statistics
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Sum
+
+from goodsapp.models import Category, Goods
+from orderapp.models import Order, StockReservation
+from orderapp.reservations import InsufficientStock, release, reserve
+from userapp.models import Address, UserInfo
+
+
+class Command(BaseCommand):
+    help = "并发下单压测库存预留：多线程随机顺序购买同一批商品，检查无死锁、无超卖，过期归还后库存复原（结束后删除测试数据）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='并发线程数（每个线程一个数据库连接）')
+        parser.add_argument('--checkouts', type=int, default=1000, help='下单总次数')
+        parser.add_argument('--goods', type=int, default=5, help='参与争用的商品数')
+        parser.add_argument('--lines', type=int, default=3, help='每单购买的商品种数')
+        parser.add_argument('--stock', type=int, default=500, help='每个商品的初始库存')
+
+    def handle(self, *args, **options):
+        threads, checkouts = options['threads'], options['checkouts']
+        if min(threads, checkouts, options['goods'], options['lines']) < 1:
+            raise CommandError('--threads、--checkouts、--goods、--lines 必须大于 0')
+        tag = uuid.uuid4().hex[:8]
+        user = UserInfo.objects.create_user(account=f'loadtest-{tag}@example.com', password=uuid.uuid4().hex,
+                                            username=f'loadtest-{tag}')
+        address = Address.objects.create(aname='loadtest', aphone='00000000000', addr='-', aUserInfo=user)
+        category = Category.objects.create(cname=f'loadtest-{tag}')
+        goods_ids = [
+            Goods.objects.create(gname=f'loadtest-{tag}-{index}', gdesc='-', brand='-', price=Decimal('1.00'),
+                                 category=category, stock=options['stock']).id
+            for index in range(options['goods'])
+        ]
+        try:
+            self._run(user, address, goods_ids, options)
+        finally:
+            user.delete()
+            Goods.objects.filter(id__in=goods_ids).delete()
+            category.delete()
+
+    def _run(self, user, address, goods_ids, options):
+        threads, checkouts, initial = options['threads'], options['checkouts'], options['stock']
+        lines_per_order = min(options['lines'], len(goods_ids))
+        latencies, outcomes, lock = [], {'ok': 0, 'short': 0, 'error': 0}, threading.Lock()
+
+        def worker(count):
+            local_latencies, local_outcomes = [], []
+            try:
+                for _ in range(count):
+                    # 购物车行顺序随机，由 reserve() 负责按商品 id 排序加锁
+                    lines = [(goods_id, random.randint(1, 3)) for goods_id in random.sample(goods_ids, lines_per_order)]
+                    started = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            order = Order.objects.create(userinfo=user, address=address, order_num=uuid.uuid4().hex,
+                                                         trade_no=f'LOADTEST{time.time_ns()}')
+                            reserve(order, lines)
+                        outcome = 'ok'
+                    except InsufficientStock:
+                        outcome = 'short'
+                    except DatabaseError:  # 死锁或锁等待超时
+                        outcome = 'error'
+                    local_latencies.append((time.perf_counter() - started) * 1000)
+                    local_outcomes.append(outcome)
+            finally:
+                connections.close_all()  # 每个线程使用独立连接，结束时关闭
+            with lock:
+                latencies.extend(local_latencies)
+                for outcome in local_outcomes:
+                    outcomes[outcome] += 1
+
+        workers = [
+            threading.Thread(target=worker, args=(checkouts // threads + (1 if index < checkouts % threads else 0),))
+            for index in range(threads)
+        ]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"{checkouts / elapsed:.1f} 单/秒，p50 {statistics.median(latencies):.2f}ms，"
+            f"p99 {latencies[max(int(len(latencies) * 0.99) - 1, 0)]:.2f}ms，"
+            f"成功 {outcomes['ok']}，库存不足 {outcomes['short']}，数据库错误 {outcomes['error']}"
+        )
+
+        reserved = dict(StockReservation.objects.filter(goods_id__in=goods_ids).values('goods_id')
+                        .annotate(total=Sum('quantity')).values_list('goods_id', 'total'))
+        stocks = dict(Goods.objects.filter(id__in=goods_ids).values_list('id', 'stock'))
+        for goods_id in goods_ids:
+            current, taken = stocks[goods_id], reserved.get(goods_id, 0)
+            if current < 0 or current + taken != initial:
+                raise CommandError(f'商品 {goods_id}: 库存 {current} + 预留 {taken} != {initial}')
+
+        for order in Order.objects.filter(userinfo=user):
+            release(order)
+        stocks = dict(Goods.objects.filter(id__in=goods_ids).values_list('id', 'stock'))
+        if any(value != initial for value in stocks.values()):
+            raise CommandError(f'归还后库存未复原: {stocks}')
+        self.stdout.write(self.style.SUCCESS('库存守恒：扣减与预留一致，归还后全部复原'))
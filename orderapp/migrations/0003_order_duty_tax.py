@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderapp', '0002_order_order_num_alter_order_trade_no'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='duty_amount',
+            field=models.FloatField(default=0, verbose_name='关税'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax_amount',
+            field=models.FloatField(default=0, verbose_name='进口增值税'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0014_goods_stock_shard'),
+        ('orderapp', '0004_order_shipping_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='goodsapp.goods')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='orderapp.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'goods'), name='stock_reservation_order_goods_uniq')],
+            },
+        ),
+    ]
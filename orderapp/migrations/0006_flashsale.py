@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0014_goods_stock_shard'),
+        ('orderapp', '0005_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlashSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('goods', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flash_sales', to='goodsapp.goods')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='flash_sale',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orderapp.flashsale'),
+        ),
+        migrations.AddIndex(
+            model_name='flashsale',
+            index=models.Index(fields=['reconciled_at', 'ends_at'], name='flash_sale_pending_idx'),
+        ),
+    ]
@@ -19,7 +19,10 @@ class Order(models.Model):
     status = models.CharField(max_length=50, default='待支付')  # 状态（待支付，待发货，待收货）
     pay = models.CharField(max_length=50, default='alipay') # 支付方式
     create_time = models.DateTimeField(auto_now_add=True) # 订单创建时间
-    total_amount = models.FloatField(default=0, verbose_name="总金额")
+    total_amount = models.FloatField(default=0, verbose_name="总金额")  # 含关税、进口增值税和运费
+    duty_amount = models.FloatField(default=0, verbose_name="关税")
+    tax_amount = models.FloatField(default=0, verbose_name="进口增值税")
+    shipping_amount = models.FloatField(default=0, verbose_name="运费")
 
     address = models.ForeignKey(Address, on_delete=models.CASCADE)
     userinfo = models.ForeignKey(UserInfo, on_delete=models.CASCADE)
@@ -63,3 +66,68 @@ class Orderitem(models.Model):
     # class Order(models.Model):
     #     # 订单其他字段
     #     payments = models.ManyToManyField('payment.Payment', related_name='orders')
+
+
+class FlashSale(models.Model):
+    """秒杀活动：开始时从 Goods.stock 预扣 quantity 件，装入缓存令牌计数器；结束后未售出的件数归还库存"""
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='flash_sales')
+    quantity = models.PositiveIntegerField()  # 本场可售件数
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)  # 实际预扣库存、装载令牌的时间
+    reconciled_at = models.DateTimeField(null=True, blank=True)  # 未售件数归还库存的时间
+    sold = models.PositiveIntegerField(default=0)  # 对账时统计的售出件数
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('reconciled_at', 'ends_at'), name='flash_sale_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.goods_id} x {self.quantity} ({self.starts_at:%Y-%m-%d %H:%M} - {self.ends_at:%H:%M})'
+
+
+class StockReservation(models.Model):
+    """下单时实际扣减的库存；订单过期或取消时按这些行原样归还"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    goods = models.ForeignKey(Goods, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    # 秒杀商品的件数在活动开始时已从库存预扣，下单只消耗缓存令牌，归还时退回令牌（已对账则退回库存）
+    flash_sale = models.ForeignKey(FlashSale, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(null=True, blank=True)  # 已归还库存的时间
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('order', 'goods'), name='stock_reservation_order_goods_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id}: {self.goods_id} x {self.quantity}'
+
+
+class CheckoutTicket(models.Model):
+    """异步下单凭据：请求只做轻量校验后入队（202），orders 队列的工作进程批量创建订单并回写结果"""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', '处理中'
+        COMPLETED = 'completed', '已下单'
+        FAILED = 'failed', '下单失败'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    userinfo = models.ForeignKey(UserInfo, on_delete=models.CASCADE, related_name='+')
+    address = models.ForeignKey(Address, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    message = models.CharField(max_length=100, blank=True, default='')  # 失败原因
+    goods_id = models.PositiveIntegerField(null=True, blank=True)  # 库存不足或已抢光的商品
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('status', 'created_at'), name='checkout_ticket_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} ({self.status})'
@@ -0,0 +1,124 @@
+"""Stock reservation for checkout.
+
+:func:`reserve` takes the stock of every cart line inside the caller's
+transaction. The goods without sharded stock share one conditional
+``UPDATE ... SET stock = stock - n WHERE stock >= n`` with a ``CASE`` per
+goods (:func:`goodsapp.stock.decrement_many`). Goods with sharded stock get
+one shard decrement each (see :mod:`goodsapp.stock`). The statement count
+therefore does not grow with the number of cart lines.
+
+Lines are merged per goods. On databases with row locks, a single
+``SELECT ... FOR UPDATE ... ORDER BY id`` first locks the non-sharded goods
+rows that the ``UPDATE`` is about to change, in ascending id order. Sharded
+goods keep their parent row unlocked. Every checkout therefore locks goods
+rows in the same order, and two checkouts that share goods wait on each
+other instead of deadlocking. SQLite takes one lock for
+the whole database, so the locking read is skipped there. A short goods
+raises :class:`InsufficientStock`, and rolling back the transaction returns
+whatever was already taken.
+
+A :class:`~orderapp.models.StockReservation` row records each quantity that
+was taken. :func:`release` gives back exactly those quantities once and
+marks the rows released. Orders created before reservations existed have no
+rows, so releasing them changes no stock.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from typing import Iterable, Mapping
+
+from django.db import transaction
+from django.utils import timezone
+
+from goodsapp import stock
+from goodsapp.models import Goods
+
+from . import flash_sale
+from .models import FlashSale, Order, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, goods_id: int, requested: int):
+        super().__init__(f'goods {goods_id}: insufficient stock for {requested}')
+        self.goods_id = goods_id
+        self.requested = requested
+
+
+def merge_lines(lines: Iterable[tuple[int, int]]) -> dict[int, int]:
+    """Sum ``(goods id, quantity)`` pairs per goods, in goods id order."""
+    totals: Counter[int] = Counter()
+    for goods_id, quantity in lines:
+        totals[goods_id] += quantity
+    return {goods_id: totals[goods_id] for goods_id in sorted(totals) if totals[goods_id] > 0}
+
+
+def _lock_goods(goods_ids: list[int]) -> None:
+    """Lock the ``Goods`` rows of non-sharded goods in ascending id order.
+
+    Sharded goods are never locked here. Their decrements only touch shard
+    rows, and locking the parent row would queue every checkout of a hot
+    goods behind one lock again.
+    """
+    list(Goods.objects.select_for_update().filter(id__in=goods_ids).order_by('id').values_list('id', flat=True))
+
+
+def reserve(order: Order, lines: Iterable[tuple[int, int]], *, shard_counts: Mapping[int, int] | None = None,
+            flash: Mapping[int, tuple[int, int]] | None = None) -> list[StockReservation]:
+    """Take the stock of ``lines`` for ``order``; must run inside ``transaction.atomic()``.
+
+    ``shard_counts`` maps goods ids to ``Goods.stock_shard_count`` when the
+    caller has already loaded the goods. Goods that are missing from it are
+    looked up in one query. ``flash`` is the result of
+    :func:`orderapp.flash_sale.admit`. Those goods were pre-allocated when
+    their sale started and are only recorded.
+    """
+    flash = flash or {}
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        raise RuntimeError('reserve() must run inside transaction.atomic()')
+    wanted = merge_lines(lines)
+    stocked = [goods_id for goods_id in wanted if goods_id not in flash]
+    if shard_counts is None or not set(stocked) <= set(shard_counts):
+        shard_counts = dict(Goods.objects.filter(id__in=stocked).values_list('id', 'stock_shard_count'))
+    for goods_id in stocked:
+        if goods_id not in shard_counts:  # 商品已删除
+            raise InsufficientStock(goods_id, wanted[goods_id])
+    plain = [goods_id for goods_id in stocked if not shard_counts[goods_id]]
+    if plain and connection.features.has_select_for_update:
+        _lock_goods(plain)
+    short = stock.decrement_many({goods_id: wanted[goods_id] for goods_id in plain})
+    if short is not None:
+        raise InsufficientStock(short, wanted[short])
+    for goods_id in stocked:
+        if shard_counts[goods_id] and not stock.decrement(goods_id, wanted[goods_id], shards=shard_counts[goods_id]):
+            raise InsufficientStock(goods_id, wanted[goods_id])
+    return StockReservation.objects.bulk_create([
+        StockReservation(order=order, goods_id=goods_id, quantity=quantity,
+                         flash_sale_id=flash[goods_id][0] if goods_id in flash else None)
+        for goods_id, quantity in wanted.items()
+    ])
+
+
+def release(order: Order) -> dict[int, int]:
+    """Return the unreleased reservations of ``order``; returns ``{goods id: quantity}``."""
+    with transaction.atomic():
+        reservations = list(StockReservation.objects.select_for_update()
+                            .filter(order=order, released_at__isnull=True).order_by('goods_id'))
+        if not reservations:
+            return {}
+        shard_counts = dict(Goods.objects.filter(id__in=[item.goods_id for item in reservations])
+                            .values_list('id', 'stock_shard_count'))
+        # 秒杀预留：活动未对账时退回令牌，已对账（件数计入售出）时退回库存
+        sales = FlashSale.objects.select_for_update().in_bulk(
+            {item.flash_sale_id for item in reservations if item.flash_sale_id})
+        for item in reservations:
+            sale = sales.get(item.flash_sale_id)
+            if sale is not None and sale.reconciled_at is None:
+                flash_sale.give_back(sale, item.quantity)
+            else:
+                stock.increment(item.goods_id, item.quantity, shards=shard_counts.get(item.goods_id, 0))
+        StockReservation.objects.filter(id__in=[item.id for item in reservations]).update(released_at=timezone.now())
+    return {item.goods_id: item.quantity for item in reservations}
+
+
+__all__ = ['InsufficientStock', 'merge_lines', 'release', 'reserve']
@@ -19,6 +19,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'trade_no', 'order_num', 'status', 'pay', 'create_time', 'total_amount', 'address',
-                  'order_items']
-        read_only_fields = ['trade_no', 'order_num', 'status', 'create_time', 'total_amount', 'order_items', 'address']
+        fields = ['id', 'trade_no', 'order_num', 'status', 'pay', 'create_time', 'total_amount', 'duty_amount',
+                  'tax_amount', 'shipping_amount', 'address', 'order_items']
+        read_only_fields = ['trade_no', 'order_num', 'status', 'create_time', 'total_amount', 'duty_amount',
+                            'tax_amount', 'shipping_amount', 'order_items', 'address']
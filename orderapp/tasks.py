@@ -7,10 +7,12 @@ from django.conf import settings
 from django.db import transaction
 from django.utils import timezone
 
-from goodsapp.models import Goods
+from goodsapp.stock import available_many
 from eventstream.dispatcher import OutboxDispatcher
 from eventstream.outbox import enqueue_order_event, enqueue_outbox_event
 from .models import Order
+from . import flash_sale, intake
+from .reservations import release
 
 logger = get_task_logger(__name__)
 
@@ -70,29 +72,25 @@ def expire_unpaid_orders(self) -> dict:
 
     expired_orders = []
     with transaction.atomic():
-        orders = (
-            Order.objects.select_for_update()
-            .filter(status='待支付', create_time__lt=cutoff)
-            .prefetch_related("orderitem_set__goods")
-        )
+        orders = Order.objects.select_for_update().filter(status='待支付', create_time__lt=cutoff)
         for order in orders:
-            for item in order.orderitem_set.all():
-                goods: Goods = item.goods
-                goods.stock += item.quantity
-                goods.save(update_fields=["stock"])
+            # 只归还下单时实际扣减（有预留记录）的库存
+            restored = release(order)
+            levels = available_many(restored)
+            for goods_id, quantity in restored.items():
                 enqueue_outbox_event(
                     topic=stock_topic,
                     aggregate_type="goods",
-                    aggregate_id=str(goods.id),
+                    aggregate_id=str(goods_id),
                     event_type="stock.adjusted",
                     payload={
-                        "goods_id": goods.id,
-                        "new_stock": goods.stock,
-                        "delta": item.quantity,
+                        "goods_id": goods_id,
+                        "new_stock": levels.get(goods_id),
+                        "delta": quantity,
                         "reason": f"expired-order-{order.id}",
                     },
                     headers={"source": "orders.expire_unpaid"},
-                    idempotency_key=f"goods:{goods.id}:restored:{order.id}",
+                    idempotency_key=f"goods:{goods_id}:restored:{order.id}",
                 )
 
             order.update_status('已取消', reason='expired')
@@ -133,3 +131,29 @@ def publish_outbox_events(self, limit: int | None = None) -> dict:
         logger.debug("Outbox dispatcher errors: %s", summary["errors"])
 
     return summary
+
+
+@shared_task(bind=True)
+def sync_flash_sales(self) -> dict:
+    """Start due flash sales, restore lost token counters and reconcile finished sales."""
+    return flash_sale.sync()
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    retry_jitter=True,
+    retry_kwargs={"max_retries": 3},
+)
+def process_checkout_intake(self) -> dict:
+    """Place the orders of pending checkout tickets in micro-batches."""
+    totals = intake.drain()
+    if totals["batches"]:
+        logger.info(
+            "Checkout intake: batches=%s completed=%s failed=%s",
+            totals["batches"],
+            totals["completed"],
+            totals["failed"],
+        )
+    return totals
@@ -4,18 +4,26 @@ from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from cartapp.models import CartItem
+from goodsapp import counters, stock
 from goodsapp.models import Category, Goods
 from userapp.models import Address, RealName, UserInfo
+from pricingapp.landed_cost import destination_for, get_table
+from pricingapp.shipping import get_tables
 from eventstream.models import OutboxEvent
-from .models import Order, Orderitem
-from .tasks import expire_unpaid_orders, send_order_confirmation_notification
+from . import flash_sale, intake
+from .models import CheckoutTicket, FlashSale, Order, Orderitem, StockReservation
+from .reservations import InsufficientStock, release, reserve
+from .tasks import expire_unpaid_orders, process_checkout_intake, send_order_confirmation_notification
 from crossborder_trade.celery_compat import CELERY_AVAILABLE
 
 if CELERY_AVAILABLE:  # pragma: no cover - exercised when Celery is installed
@@ -48,6 +56,8 @@ class CeleryEagerTestMixin:
 
 class CheckoutTaskEnqueueTests(TestCase):
     def setUp(self):
+        counters.reset()
+        self.addCleanup(counters.reset)
         self.client = APIClient()
         self.user = UserInfo.objects.create_user(
             account='shopper@example.com', password='pass1234', username='shopper'
@@ -83,11 +93,12 @@ class CheckoutTaskEnqueueTests(TestCase):
 
     @patch('orderapp.views._queue_order_confirmation_task')
     def test_checkout_post_enqueues_notification_task(self, mock_queue):
-        response = self.client.post(
-            reverse('checkout'),
-            data={'address_id': self.address.id},
-            format='json',
-        )
+        with self.captureOnCommitCallbacks(execute=True):  # 通知在事务提交后入队
+            response = self.client.post(
+                reverse('checkout'),
+                data={'address_id': self.address.id},
+                format='json',
+            )
         self.assertEqual(response.status_code, 201)
         mock_queue.assert_called_once()
         self.assertEqual(mock_queue.call_args.args[0], response.data['order_id'])
@@ -134,6 +145,8 @@ class OrderCeleryTaskTests(CeleryEagerTestMixin, TestCase):
             quantity=1,
             count=int(self.goods.price),
         )
+        # 下单时预留（扣减）的库存，过期后归还
+        StockReservation.objects.create(order=self.order, goods=self.goods, quantity=1)
 
     def test_order_confirmation_task_runs(self):
         result = send_order_confirmation_notification.delay(self.order.id)
@@ -176,6 +189,287 @@ class OrderCeleryTaskTests(CeleryEagerTestMixin, TestCase):
         self.assertTrue(status_events.exists())
 
 
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserInfo.objects.create_user(
+            account='stock@example.com', password='pass1234', username='stock-user'
+        )
+        RealName.objects.create(
+            identity_card='123456789012345679', realname='stock-user', is_verified=True, rUserInfo=self.user
+        )
+        self.address = Address.objects.create(
+            aname='stock-user', aphone='12345678903', addr='Stock Road', aUserInfo=self.user,
+        )
+        category = Category.objects.create(cname='Flash sale')
+        self.phone, self.case = (
+            Goods.objects.create(gname=name, gdesc='-', price=Decimal('10.00'), category=category, brand='B', stock=3)
+            for name in ('Flash Phone', 'Flash Case')
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _new_order(self):
+        return Order.objects.create(userinfo=self.user, address=self.address, order_num=f'ORD{Order.objects.count()}',
+                                    trade_no='TRADE', total_amount=0)
+
+    def _stock(self):
+        return tuple(Goods.objects.filter(id__in=(self.phone.id, self.case.id)).order_by('id')
+                     .values_list('stock', flat=True))
+
+    def test_checkout_reserves_stock_and_rejects_oversell(self):
+        for goods in (self.case, self.phone):
+            CartItem.objects.create(userInfo=self.user, goods=goods, price=10, num=2, is_delete=False)
+        response = self.client.post(reverse('checkout'), data={'address_id': self.address.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._stock(), (1, 1))
+        reserved = StockReservation.objects.filter(order_id=response.data['order_id'])
+        self.assertEqual(sorted(reserved.values_list('goods_id', 'quantity')), [(self.phone.id, 2), (self.case.id, 2)])
+
+        CartItem.objects.create(userInfo=self.user, goods=self.phone, price=10, num=1, is_delete=False)
+        CartItem.objects.create(userInfo=self.user, goods=self.case, price=10, num=2, is_delete=False)
+        response = self.client.post(reverse('checkout'), data={'address_id': self.address.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['goods_id'], self.case.id)
+        # 已扣减的手机库存随事务回滚，订单和购物车保持不变
+        self.assertEqual(self._stock(), (1, 1))
+        self.assertEqual(Order.objects.filter(userinfo=self.user).count(), 1)
+        self.assertEqual(CartItem.objects.filter(userInfo=self.user, is_delete=False).count(), 2)
+
+    def test_lines_are_merged_and_release_restores_exactly_once(self):
+        order = self._new_order()
+        with transaction.atomic():
+            reserve(order, [(self.case.id, 1), (self.phone.id, 1), (self.case.id, 1)])
+        self.assertEqual(self._stock(), (2, 1))
+
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            reserve(self._new_order(), [(self.phone.id, 1), (self.case.id, 2)])
+        self.assertEqual(self._stock(), (2, 1))
+
+        self.assertEqual(release(order), {self.phone.id: 1, self.case.id: 2})
+        self.assertEqual(release(order), {})
+        self.assertEqual(self._stock(), (3, 3))
+        self.assertEqual(release(self._new_order()), {})  # 无预留记录的旧订单不改库存
+        self.assertEqual(self._stock(), (3, 3))
+
+    def test_sharded_goods_are_not_row_locked(self):
+        stock.enable_sharding(self.phone.id, 2)
+        features = type(connection.features)
+        # SQLite 不支持行锁：打开特性开关，只记录要加锁的商品而不真正执行 SELECT ... FOR UPDATE
+        with patch.object(features, 'has_select_for_update', True), \
+                patch('orderapp.reservations._lock_goods') as lock, transaction.atomic():
+            reserve(self._new_order(), [(self.phone.id, 1), (self.case.id, 2)])
+        lock.assert_called_once_with([self.case.id])
+        self.assertEqual((stock.available(self.phone.id), self._stock()[1]), (2, 1))
+
+
+class FlashSaleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserInfo.objects.create_user(account='flash@example.com', password='pass1234', username='flash')
+        RealName.objects.create(
+            identity_card='123456789012345670', realname='flash', is_verified=True, rUserInfo=self.user
+        )
+        self.address = Address.objects.create(aname='flash', aphone='12345678904', addr='Flash Road',
+                                              aUserInfo=self.user)
+        category = Category.objects.create(cname='Flash')
+        self.goods = Goods.objects.create(gname='Flash Watch', gdesc='-', price=Decimal('99.00'), category=category,
+                                          brand='W', stock=10)
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):  # 提交后装载令牌
+            self.sale = flash_sale.start(FlashSale.objects.create(
+                goods=self.goods, quantity=3, starts_at=now, ends_at=now + timedelta(minutes=10)))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _checkout(self, num):
+        CartItem.objects.update_or_create(userInfo=self.user, goods=self.goods,
+                                          defaults={'price': 99, 'num': num, 'is_delete': False})
+        return self.client.post(reverse('checkout'), data={'address_id': self.address.id}, format='json')
+
+    def test_tokens_gate_checkout_and_cart(self):
+        self.goods.refresh_from_db()
+        self.assertEqual((self.goods.stock, flash_sale.remaining(self.goods.id)), (7, 3))
+
+        response = self._checkout(2)
+        self.assertEqual(response.status_code, 201)
+        self.goods.refresh_from_db()
+        # 令牌已在开始时预扣，下单不再扣减 Goods.stock
+        self.assertEqual((self.goods.stock, flash_sale.remaining(self.goods.id)), (7, 1))
+        reservation = StockReservation.objects.get(order_id=response.data['order_id'])
+        self.assertEqual((reservation.flash_sale_id, reservation.quantity), (self.sale.id, 2))
+
+        response = self._checkout(2)
+        self.assertEqual((response.status_code, response.data['message']), (409, '商品已抢光'))
+        self.assertEqual(flash_sale.remaining(self.goods.id), 1)
+        self.assertEqual(Order.objects.filter(userinfo=self.user).count(), 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('add_to_cart', args=[self.goods.id]), data={'num': 2}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_expired_orders_return_tokens_and_reconcile_returns_unsold_stock(self):
+        first = self._checkout(2)
+        self.assertEqual(self._checkout(1).status_code, 201)
+        self.assertEqual(flash_sale.remaining(self.goods.id), 0)
+
+        Order.objects.filter(id=first.data['order_id']).update(create_time=timezone.now() - timedelta(hours=1))
+        expire_unpaid_orders.apply().get()
+        self.assertEqual(flash_sale.remaining(self.goods.id), 2)
+
+        FlashSale.objects.filter(id=self.sale.id).update(ends_at=timezone.now() - timedelta(minutes=5))
+        with self.captureOnCommitCallbacks(execute=True):
+            result = flash_sale.sync()
+        self.assertEqual(result['reconciled'], [self.sale.id])
+        self.sale.refresh_from_db()
+        self.goods.refresh_from_db()
+        self.assertEqual((self.sale.sold, self.goods.stock), (1, 9))
+        self.assertIsNone(flash_sale.remaining(self.goods.id))
+
+    def test_lost_counter_rejects_until_sync_reloads_after_grace(self):
+        self.assertEqual(self._checkout(1).status_code, 201)
+        cache.delete(flash_sale._tokens_key(self.sale.id))
+        self.assertEqual(self._checkout(1).status_code, 409)
+
+        flash_sale.sync()  # 第一次发现丢失只记录时间，宽限期内不装载
+        self.assertEqual(self._checkout(1).status_code, 409)
+        with override_settings(FLASH_SALE_RECONCILE_GRACE_SECONDS=0):
+            flash_sale.sync()
+        self.assertEqual(flash_sale.remaining(self.goods.id), 2)
+        self.assertEqual(self._checkout(2).status_code, 201)
+        self.assertEqual(flash_sale.remaining(self.goods.id), 0)
+
+
+class CheckoutIntakeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(cname='Intake')
+        self.goods = Goods.objects.create(gname='Intake Lamp', gdesc='-', price=Decimal('20.00'), category=category,
+                                          brand='L', stock=3)
+        self.buyers = []
+        for index in range(2):
+            user = UserInfo.objects.create_user(account=f'intake{index}@example.com', password='pass1234',
+                                                username=f'intake{index}')
+            RealName.objects.create(identity_card=f'12345678901234560{index}', realname=f'intake{index}',
+                                    is_verified=True, rUserInfo=user)
+            address = Address.objects.create(aname=f'intake{index}', aphone=f'1234567891{index}', addr='Queue Road',
+                                             aUserInfo=user)
+            CartItem.objects.create(userInfo=user, goods=self.goods, price=20, num=2 + index * 3, is_delete=False)
+            self.buyers.append((user, address))
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyers[0][0])
+
+    @override_settings(CHECKOUT_ASYNC_ENABLED=True)
+    def test_checkout_returns_ticket_and_worker_places_order(self):
+        response = self.client.post(reverse('checkout'), data={'address_id': self.buyers[0][1].id}, format='json')
+        self.assertEqual((response.status_code, response.data['ticket_status']), (202, 'pending'))
+        self.assertFalse(Order.objects.exists())
+        status_url = reverse('checkout_ticket', args=[response.data['ticket_id']])
+        self.assertEqual(response.data['status_url'], status_url)
+        self.assertEqual(self.client.get(status_url).data['ticket_status'], 'pending')
+
+        self.assertEqual(process_checkout_intake.apply().get()['completed'], 1)
+        data = self.client.get(status_url).data
+        self.assertEqual(data['ticket_status'], 'completed')
+        order = Order.objects.get(id=data['order_id'])
+        self.assertEqual(list(order.orderitem_set.values_list('goods_id', 'quantity')), [(self.goods.id, 2)])
+        self.assertFalse(CartItem.objects.filter(userInfo=self.buyers[0][0], is_delete=False).exists())
+        self.assertTrue(OutboxEvent.objects.filter(event_type='order.created', aggregate_id=str(order.id)).exists())
+
+        self.client.force_authenticate(self.buyers[1][0])  # 其他用户查不到这张凭据
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_batch_fails_only_rejected_tickets(self):
+        (first, first_address), (second, second_address) = self.buyers
+        placed = intake.submit(first.id, first_address.id)
+        short = intake.submit(second.id, second_address.id)
+        repeat = intake.submit(first.id, first_address.id)
+
+        self.assertEqual(intake.process_batch(), {'claimed': 3, 'completed': 1, 'failed': 2})
+        placed, short, repeat = (CheckoutTicket.objects.get(id=ticket.id) for ticket in (placed, short, repeat))
+        self.assertEqual(placed.status, CheckoutTicket.Status.COMPLETED)
+        self.assertEqual((short.status, short.message, short.goods_id), ('failed', '库存不足', self.goods.id))
+        self.assertEqual((repeat.status, repeat.message), ('failed', '购物车为空'))
+        self.goods.refresh_from_db()
+        self.assertEqual(self.goods.stock, 1)
+        self.assertEqual(Orderitem.objects.count(), 1)
+        self.assertTrue(CartItem.objects.filter(userInfo=second, is_delete=False).exists())
+        self.assertEqual(intake.process_batch()['claimed'], 0)
+
+    def test_unexpected_error_fails_only_its_ticket(self):
+        (first, first_address), (second, second_address) = self.buyers
+        CartItem.objects.filter(userInfo=second).update(num=1)
+        broken = intake.submit(first.id, first_address.id)
+        healthy = intake.submit(second.id, second_address.id)
+        real_place_order = intake.place_order
+
+        def place_order(user_id, *args):
+            if user_id == first.id:
+                raise IntegrityError('simulated')
+            return real_place_order(user_id, *args)
+
+        with patch('orderapp.intake.place_order', side_effect=place_order):
+            self.assertEqual(intake.process_batch(), {'claimed': 2, 'completed': 1, 'failed': 1})
+        broken, healthy = (CheckoutTicket.objects.get(id=ticket.id) for ticket in (broken, healthy))
+        self.assertEqual((broken.status, broken.message), ('failed', '下单失败，请重新提交'))
+        self.assertEqual(healthy.status, CheckoutTicket.Status.COMPLETED)
+        self.assertFalse(Order.objects.filter(userinfo=first).exists())
+        self.assertTrue(CartItem.objects.filter(userInfo=first, is_delete=False).exists())
+
+
+class CheckoutQueryBudgetTests(TestCase):
+    # 地址+实名 1、购物车+商品 1、订单 1、扣库存 1、预留 1、订单项 1、清购物车 1、事件 1、三层保存点 6
+    # （PostgreSQL/MySQL 另有一条按 id 加锁的 SELECT；运费变化时另有一条回写，均与行数无关）
+    QUERY_BUDGET = 14
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserInfo.objects.create_user(account='budget@example.com', password='pass1234', username='budget')
+        RealName.objects.create(
+            identity_card='123456789012345671', realname='budget', is_verified=True, rUserInfo=self.user
+        )
+        self.address = Address.objects.create(aname='budget', aphone='12345678905', addr='Budget Road',
+                                              aUserInfo=self.user)
+        category = Category.objects.create(cname='Budget')
+        self.goods = Goods.objects.bulk_create([
+            Goods(gname=f'Budget {index}', gdesc='-', price=Decimal('5.00'), category=category, brand='B', stock=10)
+            for index in range(100)
+        ])
+        # 预热进程内的税率表和运费表，两次结账都不再加载
+        get_table(destination_for(self.address))
+        get_tables()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _checkout_queries(self, lines):
+        CartItem.objects.bulk_create([
+            CartItem(userInfo=self.user, goods=goods, price=5, num=2, is_delete=False) for goods in self.goods[:lines]
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('checkout'), data={'address_id': self.address.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Orderitem.objects.filter(order_id=response.data['order_id']).count(), lines)
+        self.assertEqual(StockReservation.objects.filter(order_id=response.data['order_id']).count(), lines)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.assertEqual(self._checkout_queries(1), self.QUERY_BUDGET)
+        self.assertEqual(self._checkout_queries(100), self.QUERY_BUDGET)
+        self.assertEqual(sorted(set(Goods.objects.filter(id__in=[goods.id for goods in self.goods])
+                                    .values_list('stock', flat=True))), [6, 8])
+        self.assertEqual(OutboxEvent.objects.filter(event_type='order.created').count(), 2)
+
+    def test_short_goods_in_large_cart_takes_nothing(self):
+        Goods.objects.filter(id=self.goods[57].id).update(stock=1)
+        CartItem.objects.bulk_create([
+            CartItem(userInfo=self.user, goods=goods, price=5, num=2, is_delete=False) for goods in self.goods
+        ])
+        response = self.client.post(reverse('checkout'), data={'address_id': self.address.id}, format='json')
+        self.assertEqual((response.status_code, response.data['goods_id']), (409, self.goods[57].id))
+        self.assertEqual(Goods.objects.filter(stock=10).count(), 99)
+        self.assertFalse(Order.objects.filter(userinfo=self.user).exists())
+
+
 class OrderOutboxEventTests(TestCase):
     def setUp(self):
         self.user = UserInfo.objects.create_user(
@@ -1,9 +1,11 @@
 from django.urls import path
-from orderapp.views import CheckoutAPIView, OrderDetailAPIView, OrderListAPIView
+from orderapp.views import CheckoutAPIView, CheckoutTicketAPIView, OrderDetailAPIView, OrderListAPIView
 
 urlpatterns = [
     # 结账 API
     path('checkout/', CheckoutAPIView.as_view(), name='checkout'),
+    # 异步下单凭据查询 API
+    path('checkout/tickets/<uuid:ticket_id>/', CheckoutTicketAPIView.as_view(), name='checkout_ticket'),
     # 订单详情 API
     path('orders/<int:order_id>/', OrderDetailAPIView.as_view(), name='order_detail'),
     path('orders/', OrderListAPIView.as_view(), name='order_list'),
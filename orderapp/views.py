@@ -4,63 +4,100 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.db import transaction
+from django.db.models import Exists, OuterRef
 
-from .models import Order, Orderitem
+from .checkout import CheckoutRejected, OrderWrites, estimate_cart_landed_cost, line_amounts, place_order
+from .checkout import queue_order_confirmation as _queue_order_confirmation_task
+from .models import CheckoutTicket, Order
+from . import intake
 from .serializers import OrderSerializer, OrderitemSerializer
 from cartapp.models import CartItem  # 从 cartapp 导入 CartItem
 from goodsapp.serializers import GoodsListSerializer
 from userapp.models import Address, RealName  # 从 userapp 导入 Address
-from eventstream.outbox import enqueue_order_event
+from pricingapp.currency import base_currency, localize_amounts, localize_goods, localize_lines
+from pricingapp.landed_cost import destination_for
+from pricingapp.shipping import quote_cart
+from pricingapp.decorators import currency_param
 
-from django.utils import timezone
 import logging
-import uuid
 
 
 logger = logging.getLogger(__name__)
 
 
-def _queue_order_confirmation_task(order_id: int) -> None:
-    try:
-        from .tasks import send_order_confirmation_notification
-    except ModuleNotFoundError:
-        logger.warning("未安装 Celery，无法发送订单通知任务。")
-        return
-
-    try:
-        send_order_confirmation_notification.delay(order_id)
-    except Exception as exc:  # pragma: no cover - Celery misconfiguration fallback
-        logger.warning("订单通知任务入队失败: %s", exc)
-
-
 class CheckoutAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     @staticmethod
+    @currency_param
     def get(request):
-        """处理 GET 请求，返回购物车详情和总价"""
-        cart_items = CartItem.objects.select_related('goods').filter(
+        """处理 GET 请求，返回购物车详情、总价、预估进口税费和运费（?address_id= 指定收货地址，默认取默认地址）"""
+        addresses = Address.objects.filter(aUserInfo=request.user)
+        address_id = request.query_params.get('address_id')
+        if address_id:
+            address = addresses.filter(id=address_id).first() if str(address_id).isdigit() else None
+            if address is None:
+                return Response({
+                    'status': 'error',
+                    'message': '收货地址不存在'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            address = addresses.filter(isdefault=True).first()
+
+        cart_items = list(CartItem.objects.select_related('goods').filter(
             userInfo=request.user,
             is_delete=False,
-        )
+        ))
+        destination = destination_for(address)
+
+        # 整个购物车一次性计算关税、进口增值税和运费（运费与购物车页共用按购物车版本缓存的报价）
+        # 预览与下单按同一口径计价：商品当前售价，而不是加入购物车时记录的价格
+        landed = estimate_cart_landed_cost(destination, cart_items)
+        shipping = quote_cart(request.user.id, cart_items, destination)
 
         items = []
         total = 0
-        for item in cart_items:
-            line_total = item.price * item.num
+        for item, line_total, duty, tax in zip(cart_items, line_amounts(cart_items), landed.duties, landed.taxes):
             total += line_total
             items.append({
                 'id': item.id,
                 'quantity': item.num,
-                'count': item.price,
+                'count': item.goods.price,
                 'line_total': line_total,
+                'duty': str(duty),
+                'tax': str(tax),
+                'post_fee': str(item.post_fee),
                 'goods': GoodsListSerializer(item.goods).data,
             })
 
+        converted_total = localize_lines(
+            items, request.currency, price_key='count', quantity_key='quantity', total_key='line_total',
+        )
+        converted_fees = localize_amounts(items, request.currency, ('duty', 'tax', 'post_fee'))
+        localize_goods([item['goods'] for item in items], request.currency)
+        if converted_total is None:
+            goods_total, duty_total, tax_total, shipping_fee = (
+                total, landed.duty_total, landed.tax_total, shipping.fee,
+            )
+        else:
+            goods_total = converted_total
+            duty_total, tax_total, shipping_fee = (
+                converted_fees['duty'], converted_fees['tax'], converted_fees['post_fee'],
+            )
         return Response({
             'items': items,
-            'total': total,
+            'total': total if converted_total is None else str(converted_total),
+            'base_total': total,
+            'duty_total': str(duty_total),
+            'tax_total': str(tax_total),
+            'shipping_fee': str(shipping_fee),
+            'shipping_zone': shipping.zone,
+            'free_shipping': shipping.free_shipping,
+            'landed_total': str(goods_total + duty_total + tax_total + shipping_fee),
+            'destination': destination,
+            'currency': request.currency or base_currency(),
         })
 
     @staticmethod
@@ -133,108 +170,68 @@ class CheckoutAPIView(APIView):
         #         'total_amount': total
         #     }, status=status.HTTP_201_CREATED)
         try:
-            # 检查实名认证状态
-            real_name = RealName.objects.filter(rUserInfo=request.user).first()
-            if not real_name or not real_name.is_verified:
+            # 收货地址与实名认证状态一次查询取得
+            address_id = request.data.get('address_id')
+            address = None
+            if address_id and str(address_id).isdigit():
+                address = Address.objects.filter(id=address_id, aUserInfo=request.user).annotate(
+                    verified=Exists(RealName.objects.filter(rUserInfo=OuterRef('aUserInfo'), is_verified=True))
+                ).first()
+            # 地址不存在时单独确认实名状态，错误提示的先后顺序保持不变
+            verified = address.verified if address is not None else \
+                RealName.objects.filter(rUserInfo=request.user, is_verified=True).exists()
+            if not verified:
                 return Response({
                     'status': 'error',
                     'message': '请先完成实名认证'
                 }, status=status.HTTP_400_BAD_REQUEST)
-
-            # 获取当前用户默认地址 - 注意这里使用的是 isdefault 字段
-            address_id = request.data.get('address_id')
             if not address_id:
                 return Response({
                     'status': 'error',
                     'message': '请选择收货地址'
                 }, status=status.HTTP_400_BAD_REQUEST)
-            # address_id = request.data.get('address_id')
-            try:
-                address = Address.objects.get(id=address_id, aUserInfo=request.user)
-            except Address.DoesNotExist:
+            if address is None:
                 return Response({
                     'status': 'error',
                     'message': '收货地址不存在'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # 获取当前请求用户的购物车项
-            cart_items = CartItem.objects.filter(userInfo=request.user, is_delete=False)
-            if not cart_items.exists():
-                return Response(
-                    {'status': 'error', 'message': '购物车为空'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-                # 生成订单号和交易编号
-            order_num = uuid.uuid4().hex[:32]
-            trade_no = f"TRADE{timezone.now().strftime('%Y%m%d%H%M%S')}"
-
-            # 计算总价
-            total_amount = sum(item.num * item.goods.price for item in cart_items)
-
-            line_items_payload = []
-            with transaction.atomic():
-                # 创建订单 - 使用正确的字段名
-                order = Order.objects.create(
-                    userinfo=request.user,  # 使用模型中定义的 userinfo 字段
-                    address=address,
-                    order_num=order_num,
-                    trade_no=trade_no,
-                    total_amount=total_amount,
-                    status='待支付',
-                    pay='alipay'  # 默认支付方式
-                )
-
-                # 批量创建订单项 - 使用正确的字段名
-                order_items = []
-                for item in cart_items:
-                    order_items.append(
-                        Orderitem(
-                            order=order,
-                            goods=item.goods,
-                            quantity=item.num,  # 使用 quantity 字段存储数量
-                            count=item.goods.price  # 使用 count 字段存储价格
-                        )
-                    )
-                    line_items_payload.append(
-                        {
-                            'goods_id': item.goods_id,
-                            'quantity': item.num,
-                            'unit_price': float(item.goods.price),
-                            'line_total': float(item.num * item.goods.price),
-                        }
-                    )
-                Orderitem.objects.bulk_create(order_items)
-
-                # 标记购物车项为已删除
-                cart_items.update(is_delete=True)
+            if intake.enabled():
+                # 异步下单：只做上面的轻量校验，税费、库存和订单写入交给 orders 队列批量处理
+                ticket = intake.submit(request.user.id, address.id)
+                return Response({
+                    'status': 'success',
+                    'message': '订单处理中',
+                    'ticket_id': str(ticket.id),
+                    'ticket_status': ticket.status,
+                    'status_url': reverse('checkout_ticket', args=[ticket.id]),
+                }, status=status.HTTP_202_ACCEPTED)
 
-                enqueue_order_event(
-                    order,
-                    event_type='order.created',
-                    payload={
-                        'items': line_items_payload,
-                        'source': 'checkout.api',
-                    },
-                    headers={'initiator': 'checkout.api'},
-                    idempotency_key=f'order:{order.id}:created',
-                )
+            # 获取当前请求用户的购物车项（连同商品一次取出，后续计价、扣库存、建订单项不再逐行查询）
+            cart_items = list(CartItem.objects.select_related('goods').filter(userInfo=request.user, is_delete=False))
 
-                transaction.on_commit(
-                    lambda order_id=order.id: _queue_order_confirmation_task(order_id)
-                )
+            with OrderWrites(notify=_queue_order_confirmation_task) as writes, transaction.atomic():
+                placed = place_order(request.user.id, address, cart_items, writes)
+                # 批量创建订单项、清空购物车、写入 order.created 事件，提交后发送订单通知
+                writes.flush()
 
+            order = placed.order
             return Response(
                 {
                     'status': 'success',
                     'message': '订单已创建',
                     'order_id': order.id,
-                    'total_amount': float(total_amount),  # 转换为浮点数，因为模型使用的是 FloatField
-                    'order_num': order_num,
-                    'trade_no': trade_no
+                    'total_amount': float(order.total_amount),  # 转换为浮点数，因为模型使用的是 FloatField
+                    'duty_amount': float(placed.landed.duty_total),
+                    'tax_amount': float(placed.landed.tax_total),
+                    'shipping_amount': float(placed.shipping.fee),
+                    'order_num': order.order_num,
+                    'trade_no': order.trade_no
                 },
                 status=status.HTTP_201_CREATED
             )
+        except CheckoutRejected as exc:
+            return Response(exc.payload(), status=exc.status_code)
         except Exception as e:
             # 打印详细错误信息
             import traceback
@@ -246,6 +243,33 @@ class CheckoutAPIView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class CheckoutTicketAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    def get(request, ticket_id):
+        """查询异步下单凭据：pending 时稍后重试，completed 时返回订单，failed 时返回失败原因"""
+        ticket = get_object_or_404(CheckoutTicket.objects.select_related('order'), id=ticket_id,
+                                   userinfo=request.user)
+        data = {
+            'status': 'success',
+            'ticket_id': str(ticket.id),
+            'ticket_status': ticket.status,
+        }
+        if ticket.status == CheckoutTicket.Status.FAILED:
+            data['message'] = ticket.message
+            if ticket.goods_id is not None:
+                data['goods_id'] = ticket.goods_id
+        elif ticket.order is not None:
+            data.update({
+                'order_id': ticket.order.id,
+                'order_num': ticket.order.order_num,
+                'trade_no': ticket.order.trade_no,
+                'total_amount': float(ticket.order.total_amount),
+            })
+        return Response(data)
+
+
 class OrderDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,27 @@
+from django.contrib import admin
+
+from .models import FxRate, ShippingRate, ShippingZone, TariffRule
+
+
+# Register your models here.
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate', 'decimals', 'rounding_step', 'updated_at')
+
+
+@admin.register(TariffRule)
+class TariffRuleAdmin(admin.ModelAdmin):
+    list_display = ('destination', 'hs_prefix', 'category', 'duty_rate', 'tax_rate', 'updated_at')
+    list_filter = ('destination',)
+    search_fields = ('hs_prefix',)
+
+
+class ShippingRateInline(admin.TabularInline):
+    model = ShippingRate
+    extra = 1
+
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    list_display = ('name', 'countries', 'basis', 'free_shipping_threshold', 'updated_at')
+    inlines = [ShippingRateInline]
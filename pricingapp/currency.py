@@ -0,0 +1,267 @@
+"""Convert base-currency prices into the buyer's currency.
+
+Rates and rounding rules come from the local ``FxRate`` table. Each process
+reloads the table when the FX version stamp in the cache changes. Amounts
+are converted as whole arrays: ``amount * rate``, scaled to the target minor
+unit and rounded half-up to the currency's rounding step. The catalog-wide
+converted price list is built from the columnar snapshot and kept per
+(currency, catalog version, FX version), so rendering a page costs a
+``searchsorted`` over arrays that are already converted.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Iterable, Mapping, MutableMapping, Sequence
+
+from django.conf import settings
+
+from crossborder_trade.cache_utils import bump_version, get_version
+
+try:  # pragma: no cover - optional dependency
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - executed when numpy isn't installed
+    np = None  # type: ignore[assignment]
+
+FX_VERSION_KEY = 'pricingapp:fx:version'
+_BASE_DECIMALS = 2  # Goods.price 为两位小数
+
+
+class UnsupportedCurrency(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class CurrencyRule:
+    code: str
+    rate: Decimal
+    decimals: int = 2
+    rounding_step: int = 1
+
+    def quantize(self, minor_units: int) -> Decimal:
+        return (Decimal(minor_units) / (10 ** self.decimals)).quantize(Decimal(1).scaleb(-self.decimals))
+
+    def convert_one(self, amount) -> Decimal:
+        """Exact Decimal conversion; the reference for the vectorized path."""
+        scaled = Decimal(str(amount)) * self.rate * (10 ** self.decimals) / self.rounding_step
+        return self.quantize(int(scaled.to_integral_value(rounding=ROUND_HALF_UP)) * self.rounding_step)
+
+
+def base_currency() -> str:
+    return getattr(settings, 'BASE_CURRENCY', 'CNY')
+
+
+def get_fx_version() -> int:
+    return get_version(FX_VERSION_KEY)
+
+
+def bump_fx_version() -> int:
+    return bump_version(FX_VERSION_KEY)
+
+
+_rules: tuple[int, dict[str, CurrencyRule]] | None = None
+_price_lists: OrderedDict[tuple, 'PriceList'] = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_rules() -> dict[str, CurrencyRule]:
+    global _rules
+    version = get_fx_version()
+    current = _rules
+    if current is not None and current[0] == version:
+        return current[1]
+    from .models import FxRate
+
+    rules = {base_currency(): CurrencyRule(base_currency(), Decimal(1), _BASE_DECIMALS, 1)}
+    for row in FxRate.objects.all():
+        rules[row.currency.upper()] = CurrencyRule(
+            row.currency.upper(), row.rate, row.decimals, max(row.rounding_step, 1)
+        )
+    _rules = (version, rules)
+    return rules
+
+
+def get_rule(currency: str) -> CurrencyRule:
+    try:
+        return get_rules()[currency]
+    except KeyError:
+        raise UnsupportedCurrency(currency) from None
+
+
+def resolve_currency(value: str | None) -> str | None:
+    """Normalise a ``?currency=`` value; ``None`` when absent or equal to the base currency."""
+    if not value:
+        return None
+    code = value.strip().upper()
+    get_rule(code)
+    return None if code == base_currency() else code
+
+
+def _convert_minor(base_cents, rule: CurrencyRule):
+    """Vectorized: base-currency cents -> rounded target minor units (int64)."""
+    scale = float(rule.rate) * 10 ** (rule.decimals - _BASE_DECIMALS) / rule.rounding_step
+    scaled = np.asarray(base_cents, dtype=np.float64) * scale
+    # 半数进位；微小偏移抵消 x.5 附近的二进制浮点误差
+    return (np.floor(scaled + 0.5 + 1e-9) * rule.rounding_step).astype(np.int64)
+
+
+def convert_amounts(amounts: Sequence[Any], currency: str) -> list[Decimal]:
+    """Convert base-currency amounts in one pass."""
+    rule = get_rule(currency)
+    if not amounts:
+        return []
+    if np is None:
+        return [rule.convert_one(amount) for amount in amounts]
+    cents = [int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP)) for amount in amounts]
+    return [rule.quantize(minor) for minor in _convert_minor(cents, rule).tolist()]
+
+
+@dataclass
+class PriceList:
+    """Converted prices of the whole catalog, sorted by goods id."""
+    ids: Any
+    minor: Any
+    rule: CurrencyRule
+
+    def lookup(self, goods_ids: Iterable[int]) -> dict[int, Decimal]:
+        goods_ids = list(goods_ids)
+        if not goods_ids or self.ids.size == 0:
+            return {}
+        wanted = np.asarray(goods_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, wanted), self.ids.size - 1)
+        found = self.ids[positions] == wanted
+        return {
+            goods_id: self.rule.quantize(minor)
+            for goods_id, minor, hit in zip(goods_ids, self.minor[positions].tolist(), found.tolist())
+            if hit
+        }
+
+
+def _cache_size() -> int:
+    return getattr(settings, 'PRICE_LIST_CACHE_SIZE', 8)
+
+
+def price_list(currency: str) -> PriceList | None:
+    """Catalog price list for ``currency``, or ``None`` when no fresh snapshot is available."""
+    from goodsapp import columnar
+
+    snapshot = columnar.get_snapshot()
+    if snapshot is None:
+        return None
+    rule = get_rule(currency)
+    key = (currency, snapshot.version, get_fx_version())
+    with _lock:
+        cached = _price_lists.get(key)
+        if cached is not None:
+            _price_lists.move_to_end(key)
+            return cached
+    built = PriceList(ids=snapshot.ids, minor=_convert_minor(snapshot.prices, rule), rule=rule)
+    with _lock:
+        _price_lists[key] = built
+        while len(_price_lists) > _cache_size():
+            _price_lists.popitem(last=False)
+    return built
+
+
+def goods_prices(prices: Mapping[int, Any], currency: str) -> dict[int, Decimal]:
+    """Converted prices for ``{goods_id: base price}``.
+
+    Prices come from the cached catalog price list when the snapshot is fresh.
+    Goods it does not cover are converted from the given base prices.
+    """
+    converted: dict[int, Decimal] = {}
+    if np is not None:
+        cached = price_list(currency)
+        if cached is not None:
+            converted = cached.lookup(prices)
+    missing = [goods_id for goods_id in prices if goods_id not in converted]
+    if missing:
+        converted.update(zip(missing, convert_amounts([prices[goods_id] for goods_id in missing], currency)))
+    return converted
+
+
+def localize_goods(items: Iterable[MutableMapping], currency: str | None) -> None:
+    """Rewrite ``price`` of serialized goods in place, keeping the original as ``base_price``."""
+    if not currency:
+        return
+    items = [item for item in items if item.get('price') is not None]
+    converted = goods_prices({item['id']: item['price'] for item in items}, currency)
+    for item in items:
+        item['base_price'] = item['price']
+        item['price'] = str(converted[item['id']])
+
+
+def localize_lines(lines: Iterable[MutableMapping], currency: str | None, *, price_key: str = 'price',
+                   quantity_key: str = 'num', total_key: str = 'total_price') -> Decimal | None:
+    """Convert cart/checkout lines in place and return the converted grand total.
+
+    Line totals are recomputed from the converted unit price so that
+    ``price * quantity == total`` holds in the buyer's currency as well.
+    """
+    if not currency:
+        return None
+    lines = list(lines)
+    converted = convert_amounts([line[price_key] for line in lines], currency)
+    total = get_rule(currency).quantize(0)
+    for line, unit_price in zip(lines, converted):
+        line[f'base_{price_key}'] = line[price_key]
+        line[price_key] = str(unit_price)
+        line_total = unit_price * line[quantity_key]
+        line[total_key] = str(line_total)
+        total += line_total
+    return total
+
+
+def localize_amounts(lines: Iterable[MutableMapping], currency: str | None,
+                     keys: Sequence[str]) -> dict[str, Decimal] | None:
+    """Convert the amount columns ``keys`` of ``lines`` in one pass, keeping ``base_<key>``.
+
+    Returns the converted sum of every column.
+    """
+    if not currency:
+        return None
+    lines = list(lines)
+    converted = iter(convert_amounts([line[key] for key in keys for line in lines], currency))
+    totals = {}
+    for key in keys:
+        total = get_rule(currency).quantize(0)
+        for line in lines:
+            value = next(converted)
+            line[f'base_{key}'] = line[key]
+            line[key] = str(value)
+            total += value
+        totals[key] = total
+    return totals
+
+
+def request_currency(request) -> str | None:
+    """``?currency=`` of a DRF/Django request; raises :class:`UnsupportedCurrency`."""
+    params = getattr(request, 'query_params', None) or request.GET
+    return resolve_currency(params.get('currency'))
+
+
+def clear_local_caches() -> None:
+    global _rules
+    with _lock:
+        _rules = None
+        _price_lists.clear()
+
+
+__all__ = [
+    'CurrencyRule',
+    'UnsupportedCurrency',
+    'base_currency',
+    'bump_fx_version',
+    'convert_amounts',
+    'get_rule',
+    'get_rules',
+    'goods_prices',
+    'localize_amounts',
+    'localize_goods',
+    'localize_lines',
+    'price_list',
+    'request_currency',
+    'resolve_currency',
+]
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from functools import wraps
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .currency import UnsupportedCurrency, request_currency
+
+
+def currency_param(view):
+    """解析 ?currency= 参数并放到 request.currency（None 表示基础货币），不支持的币种返回 400"""
+
+    @wraps(view)
+    def _wrapper(request, *args, **kwargs):
+        try:
+            request.currency = request_currency(request)
+        except UnsupportedCurrency as exc:
+            return Response({
+                'status': 'error',
+                'message': f'不支持的币种: {exc}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return view(request, *args, **kwargs)
+
+    return _wrapper
@@ -0,0 +1,236 @@
+"""Import duty and tax estimates for a cart.
+
+``TariffRule`` rows of a destination are compiled into sorted arrays: one
+array of HS-code keys per prefix length, one of category ids, plus the
+destination default. A cart is priced in one pass. Each line's HS code
+becomes a fixed-width integer, the prefix keys of every length are looked
+up with ``searchsorted`` (longest match wins), and unmatched lines fall back
+to their category rule and then to the default. Amounts are integer cents
+and rates integer basis points, so ``duty = value * duty_rate`` and
+``tax = (value + duty) * tax_rate`` are exact before the half-up rounding to
+the cent. Compiled tables are cached per process until the tariff version
+stamp in the cache changes.
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Iterable, Sequence
+
+from django.conf import settings
+
+from crossborder_trade.cache_utils import bump_version, get_version
+
+try:  # pragma: no cover - optional dependency
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - executed when numpy isn't installed
+    np = None  # type: ignore[assignment]
+
+TARIFF_VERSION_KEY = 'pricingapp:tariff:version'
+_HS_DIGITS = 10  # HS 编码最长 10 位，短编码右侧补零后按整数比较
+_BASIS = 10_000  # 税率以万分之一为单位
+_CENT = Decimal('0.01')
+
+
+def get_tariff_version() -> int:
+    return get_version(TARIFF_VERSION_KEY)
+
+
+def bump_tariff_version() -> int:
+    return bump_version(TARIFF_VERSION_KEY)
+
+
+def default_destination() -> str:
+    return getattr(settings, 'DEFAULT_DESTINATION_COUNTRY', 'CN')
+
+
+def destination_for(address) -> str:
+    """Destination country of a shipping ``Address`` (or the default when absent)."""
+    country = getattr(address, 'country', '') if address is not None else ''
+    return (country or default_destination()).upper()
+
+
+def _hs_digits(code: str | None) -> str:
+    return ''.join(ch for ch in code or '' if ch.isdigit())[:_HS_DIGITS]
+
+
+def _basis_points(rate) -> int:
+    return int((Decimal(str(rate)) * _BASIS).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _to_cents(amount) -> int:
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _columns(rates: dict[int, tuple[int, int]]):
+    """``{key: (duty, tax)}`` -> sorted ``(keys, duty, tax)`` columns."""
+    keys = sorted(rates)
+    columns = (keys, [rates[key][0] for key in keys], [rates[key][1] for key in keys])
+    if np is None:
+        return columns
+    return tuple(np.asarray(column, dtype=np.int64) for column in columns)
+
+
+def _search(keys, wanted):
+    if len(keys) == 0:
+        return np.zeros(wanted.shape, dtype=bool), np.zeros(wanted.shape, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    return keys[positions] == wanted, positions
+
+
+@dataclass(frozen=True)
+class TariffTable:
+    """Compiled rules of one destination; rates are in basis points."""
+    destination: str
+    levels: tuple = ()  # ((前缀长度, keys, duty, tax), ...)，长前缀在前
+    categories: tuple = ((), (), ())
+    default: tuple[int, int] = (0, 0)
+
+    @classmethod
+    def build(cls, destination: str, rules: Iterable[tuple[str, int | None, Any, Any]]) -> 'TariffTable':
+        """Compile ``(hs_prefix, category_id, duty_rate, tax_rate)`` rows."""
+        prefixes: dict[int, dict[int, tuple[int, int]]] = {}
+        categories: dict[int, tuple[int, int]] = {}
+        default = (0, 0)
+        for hs_prefix, category_id, duty_rate, tax_rate in rules:
+            rates = (_basis_points(duty_rate), _basis_points(tax_rate))
+            digits = _hs_digits(hs_prefix)
+            if digits:
+                prefixes.setdefault(len(digits), {})[int(digits)] = rates
+            elif category_id is not None:
+                categories[int(category_id)] = rates
+            else:
+                default = rates
+        levels = tuple((length, *_columns(prefixes[length])) for length in sorted(prefixes, reverse=True))
+        return cls(destination.upper(), levels, _columns(categories), default)
+
+    def rate_for(self, hs_code: str | None, category_id: int | None) -> tuple[int, int]:
+        """Rates of a single line (reference for :meth:`rates`)."""
+        digits = _hs_digits(hs_code)
+        candidates = [(int(digits[:length]), level) for length, *level in self.levels if len(digits) >= length]
+        if category_id is not None:
+            candidates.append((int(category_id), self.categories))
+        for key, (keys, duty, tax) in candidates:
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                return int(duty[position]), int(tax[position])
+        return self.default
+
+    def rates(self, hs_codes: Sequence[str | None], category_ids: Sequence[int | None]):
+        """``(duty, tax)`` basis-point arrays for whole columns of lines."""
+        count = len(hs_codes)
+        digits = [_hs_digits(code) for code in hs_codes]
+        values = np.fromiter((int(code.ljust(_HS_DIGITS, '0')) for code in digits), dtype=np.int64, count=count)
+        lengths = np.fromiter((len(code) for code in digits), dtype=np.int64, count=count)
+
+        duty = np.full(count, self.default[0], dtype=np.int64)
+        tax = np.full(count, self.default[1], dtype=np.int64)
+        matched = np.zeros(count, dtype=bool)
+        for length, keys, level_duty, level_tax in self.levels:
+            hit, positions = _search(keys, values // 10 ** (_HS_DIGITS - length))
+            hit &= (lengths >= length) & ~matched
+            duty[hit], tax[hit] = level_duty[positions[hit]], level_tax[positions[hit]]
+            matched |= hit
+
+        categories = np.fromiter(
+            (-1 if category_id is None else category_id for category_id in category_ids), dtype=np.int64, count=count,
+        )
+        keys, category_duty, category_tax = self.categories
+        hit, positions = _search(keys, categories)
+        hit &= ~matched
+        duty[hit], tax[hit] = category_duty[positions[hit]], category_tax[positions[hit]]
+        return duty, tax
+
+
+@dataclass
+class LandedCost:
+    destination: str
+    duties: list[Decimal] = field(default_factory=list)
+    taxes: list[Decimal] = field(default_factory=list)
+
+    @property
+    def duty_total(self) -> Decimal:
+        return sum(self.duties, Decimal('0.00'))
+
+    @property
+    def tax_total(self) -> Decimal:
+        return sum(self.taxes, Decimal('0.00'))
+
+
+def reference_estimate(table: TariffTable, hs_codes, category_ids, amounts) -> LandedCost:
+    """Line-by-line Decimal calculation; used without numpy and as the test oracle."""
+    cost = LandedCost(table.destination)
+    for hs_code, category_id, amount in zip(hs_codes, category_ids, amounts):
+        duty_rate, tax_rate = table.rate_for(hs_code, category_id)
+        value = Decimal(str(amount)).quantize(_CENT, rounding=ROUND_HALF_UP)
+        duty = (value * duty_rate / _BASIS).quantize(_CENT, rounding=ROUND_HALF_UP)
+        cost.duties.append(duty)
+        cost.taxes.append(((value + duty) * tax_rate / _BASIS).quantize(_CENT, rounding=ROUND_HALF_UP))
+    return cost
+
+
+def estimate(table: TariffTable, hs_codes: Sequence[str | None], category_ids: Sequence[int | None],
+             amounts: Sequence[Any]) -> LandedCost:
+    """Duty and tax of every line (``amounts`` are line totals in the base currency)."""
+    if np is None or not amounts:
+        return reference_estimate(table, hs_codes, category_ids, amounts)
+    cents = np.fromiter((_to_cents(amount) for amount in amounts), dtype=np.int64, count=len(amounts))
+    duty_rate, tax_rate = table.rates(hs_codes, category_ids)
+    duty = (cents * duty_rate + _BASIS // 2) // _BASIS
+    tax = ((cents + duty) * tax_rate + _BASIS // 2) // _BASIS
+    return LandedCost(
+        table.destination,
+        [Decimal(value).scaleb(-2) for value in duty.tolist()],
+        [Decimal(value).scaleb(-2) for value in tax.tolist()],
+    )
+
+
+_tables: tuple[int, dict[str, TariffTable]] | None = None
+_lock = threading.Lock()
+
+
+def get_table(destination: str) -> TariffTable:
+    global _tables
+    destination = destination.upper()
+    version = get_tariff_version()
+    with _lock:
+        if _tables is None or _tables[0] != version:
+            _tables = (version, {})
+        tables = _tables[1]
+        table = tables.get(destination)
+    if table is None:
+        from .models import TariffRule
+
+        rules = TariffRule.objects.filter(destination=destination).values_list(
+            'hs_prefix', 'category_id', 'duty_rate', 'tax_rate',
+        )
+        table = TariffTable.build(destination, rules)
+        with _lock:
+            tables[destination] = table
+    return table
+
+
+def estimate_landed_cost(destination: str, hs_codes: Sequence[str | None], category_ids: Sequence[int | None],
+                         amounts: Sequence[Any]) -> LandedCost:
+    return estimate(get_table(destination), hs_codes, category_ids, amounts)
+
+
+def clear_local_caches() -> None:
+    global _tables
+    with _lock:
+        _tables = None
+
+
+__all__ = [
+    'LandedCost',
+    'TariffTable',
+    'bump_tariff_version',
+    'default_destination',
+    'destination_for',
+    'estimate',
+    'estimate_landed_cost',
+    'get_table',
+    'reference_estimate',
+]
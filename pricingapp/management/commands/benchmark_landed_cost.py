@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pricingapp import landed_cost
+
+
+class Command(BaseCommand):
+    help = "对比整车向量化计算与逐行 Decimal 计算进口税费的耗时（使用内存中生成的税则表，不读写数据库）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[10, 100, 1000, 10000], help='购物车行数')
+        parser.add_argument('--rules', type=int, default=5000, help='生成的 HS 前缀规则条数')
+        parser.add_argument('--categories', type=int, default=200)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if landed_cost.np is None:
+            raise CommandError('numpy 未安装，无法运行向量化税费基准')
+        generator = random.Random(options['seed'])
+        table = self._table(generator, options['rules'], options['categories'])
+        self.stdout.write(
+            f"rules={options['rules']} categories={options['categories']} "
+            f"levels={[level[0] for level in table.levels]}"
+        )
+        for count in options['lines']:
+            hs_codes = [
+                ''.join(generator.choice('0123456789') for _ in range(generator.choice((0, 4, 6, 8, 10))))
+                for _ in range(count)
+            ]
+            category_ids = [generator.randrange(options['categories']) for _ in range(count)]
+            amounts = [Decimal(generator.randint(100, 500_000)) / 100 for _ in range(count)]
+            vectorized = landed_cost.estimate(table, hs_codes, category_ids, amounts)
+            reference = landed_cost.reference_estimate(table, hs_codes, category_ids, amounts)
+            if (vectorized.duties, vectorized.taxes) != (reference.duties, reference.taxes):
+                raise CommandError('向量化结果与逐行计算不一致')
+
+            results = []
+            for label, func in (('reference', landed_cost.reference_estimate), ('vectorized', landed_cost.estimate)):
+                timings = []
+                for _ in range(options['iterations']):
+                    tick = time.perf_counter()
+                    func(table, hs_codes, category_ids, amounts)
+                    timings.append((time.perf_counter() - tick) * 1000)
+                results.append(f'{label}={statistics.median(timings):.3f}ms')
+            self.stdout.write(f'lines={count:>6}: ' + ' '.join(results))
+
+    @staticmethod
+    def _table(generator, rules, categories):
+        rows = [('', None, Decimal('0.0500'), Decimal('0.1300'))]
+        for _ in range(rules):
+            length = generator.choice((2, 4, 6, 8, 10))
+            prefix = ''.join(generator.choice('0123456789') for _ in range(length))
+            rows.append((prefix, None, Decimal(generator.randint(0, 3000)) / 10000, Decimal('0.1300')))
+        rows.extend(
+            ('', category_id, Decimal(generator.randint(0, 2500)) / 10000, Decimal('0.0900'))
+            for category_id in range(categories)
+        )
+        return landed_cost.TariffTable.build('XX', rows)
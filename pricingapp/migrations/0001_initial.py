@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3, unique=True, verbose_name='币种')),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18, verbose_name='汇率')),
+                ('decimals', models.PositiveSmallIntegerField(default=2, verbose_name='小数位数')),
+                ('rounding_step', models.PositiveIntegerField(default=1, verbose_name='舍入步长')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
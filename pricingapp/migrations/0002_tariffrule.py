@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goodsapp', '0009_goods_hs_code'),
+        ('pricingapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TariffRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.CharField(db_index=True, max_length=2, verbose_name='目的国')),
+                ('hs_prefix', models.CharField(blank=True, default='', max_length=10, verbose_name='HS 编码前缀')),
+                ('duty_rate', models.DecimalField(decimal_places=4, default=0, max_digits=6, verbose_name='关税税率')),
+                ('tax_rate', models.DecimalField(decimal_places=4, default=0, max_digits=6, verbose_name='进口增值税税率')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='goodsapp.category')),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pricingapp', '0002_tariffrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='区域名称')),
+                ('countries', models.JSONField(blank=True, default=list, verbose_name='目的国')),
+                ('basis', models.CharField(choices=[('weight', '按重量（克）'), ('quantity', '按件数')], default='weight', max_length=10, verbose_name='计费方式')),
+                ('free_shipping_threshold', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='包邮门槛')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShippingRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_value', models.PositiveIntegerField(default=0, verbose_name='档位起点')),
+                ('fee', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='运费')),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='pricingapp.shippingzone')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('zone', 'min_value'), name='shipping_rate_zone_min_uniq')],
+            },
+        ),
+    ]
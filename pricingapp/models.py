@@ -0,0 +1,97 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+# Create your models here.
+class FxRate(models.Model):
+    """本地汇率表：1 单位基础货币（settings.BASE_CURRENCY）可兑换的目标货币数量"""
+    currency = models.CharField(max_length=3, unique=True, verbose_name="币种")  # ISO 4217，如 USD
+    rate = models.DecimalField(max_digits=18, decimal_places=8, verbose_name="汇率")
+    decimals = models.PositiveSmallIntegerField(default=2, verbose_name="小数位数")  # JPY/KRW 为 0
+    rounding_step = models.PositiveIntegerField(default=1, verbose_name="舍入步长")  # 以最小单位计，CHF 为 5
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.currency} {self.rate}'
+
+
+class TariffRule(models.Model):
+    """进口税费规则：目的国 + HS 编码前缀（最长前缀优先），其次按商品分类，最后是目的国默认规则"""
+    destination = models.CharField(max_length=2, db_index=True, verbose_name="目的国")  # ISO 3166-1，如 US
+    hs_prefix = models.CharField(max_length=10, blank=True, default='', verbose_name="HS 编码前缀")  # 只含数字
+    category = models.ForeignKey('goodsapp.Category', null=True, blank=True, on_delete=models.CASCADE)
+    duty_rate = models.DecimalField(max_digits=6, decimal_places=4, default=0, verbose_name="关税税率")  # 0.0800 即 8%
+    tax_rate = models.DecimalField(max_digits=6, decimal_places=4, default=0, verbose_name="进口增值税税率")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def clean(self):
+        if self.hs_prefix and not self.hs_prefix.isdigit():
+            raise ValidationError({'hs_prefix': 'HS 编码前缀只能包含数字'})
+        if self.hs_prefix and self.category_id:
+            raise ValidationError('HS 编码前缀和商品分类只能填写一个')
+
+    def __str__(self):
+        target = self.hs_prefix or (f'category {self.category_id}' if self.category_id else '*')
+        return f'{self.destination} {target} duty={self.duty_rate} tax={self.tax_rate}'
+
+
+class ShippingZone(models.Model):
+    """运费区域：一组目的国，countries 为空的区域作为兜底区域"""
+    BASIS_CHOICES = (
+        ('weight', '按重量（克）'),
+        ('quantity', '按件数'),
+    )
+    name = models.CharField(max_length=50, unique=True, verbose_name="区域名称")
+    countries = models.JSONField(default=list, blank=True, verbose_name="目的国")  # ['US', 'CA']
+    basis = models.CharField(max_length=10, choices=BASIS_CHOICES, default='weight', verbose_name="计费方式")
+    free_shipping_threshold = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, verbose_name="包邮门槛",
+    )  # 商品金额达到门槛免运费，空表示不包邮
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ShippingRate(models.Model):
+    """运费档位：总重量或总件数 >= min_value 时收取 fee，直到下一档"""
+    zone = models.ForeignKey(ShippingZone, on_delete=models.CASCADE, related_name='rates')
+    min_value = models.PositiveIntegerField(default=0, verbose_name="档位起点")
+    fee = models.DecimalField(max_digits=7, decimal_places=2, verbose_name="运费")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('zone', 'min_value'), name='shipping_rate_zone_min_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.zone_id} >= {self.min_value}: {self.fee}'
+
+
+# 汇率变更后让各进程重新加载汇率表和换算后的价目表
+@receiver(post_save, sender=FxRate)
+@receiver(post_delete, sender=FxRate)
+def fx_rate_changed_handler(sender, instance=None, **kwargs):
+    from pricingapp.currency import bump_fx_version
+
+    bump_fx_version()
+
+
+@receiver(post_save, sender=TariffRule)
+@receiver(post_delete, sender=TariffRule)
+def tariff_rule_changed_handler(sender, instance=None, **kwargs):
+    from pricingapp.landed_cost import bump_tariff_version
+
+    bump_tariff_version()
+
+
+@receiver(post_save, sender=ShippingZone)
+@receiver(post_delete, sender=ShippingZone)
+@receiver(post_save, sender=ShippingRate)
+@receiver(post_delete, sender=ShippingRate)
+def shipping_table_changed_handler(sender, instance=None, **kwargs):
+    from pricingapp.shipping import bump_shipping_version
+
+    bump_shipping_version()
@@ -0,0 +1,232 @@
+"""Shipping fees from zone rate tables.
+
+``ShippingZone`` maps destination countries to a zone; a zone without
+countries is the fallback. A zone charges by total weight or by quantity.
+Its ``ShippingRate`` bands are compiled into two sorted lists (band lower
+bounds and fees in cents), and the band of a cart is found with ``bisect``.
+Carts whose goods subtotal reaches the zone's free-shipping threshold ship
+free. The subtotal uses the current ``Goods.price``, as checkout charges it,
+not the price stored on the cart line. The cart fee is split over the lines
+in proportion to their weight or quantity (largest remainder, so the line
+fees add up to the cart fee) and set on the loaded cart lines.
+
+Quotes are cached per user, keyed by the cart version, destination, shipping
+table version and catalog version. Repeated cart views cost one cache read
+and write nothing. ``CartItem.post_fee`` is stored by :func:`store_cart_fees`
+after a cart line is saved or deleted (default address), never by a read.
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+
+from crossborder_trade.cache_utils import bump_version, get_version
+
+SHIPPING_VERSION_KEY = 'pricingapp:shipping:version'
+_QUOTE_PREFIX = 'pricingapp:shipping:quote'
+
+
+def get_shipping_version() -> int:
+    return get_version(SHIPPING_VERSION_KEY)
+
+
+def bump_shipping_version() -> int:
+    return bump_version(SHIPPING_VERSION_KEY)
+
+
+def _quote_timeout() -> int:
+    return getattr(settings, 'SHIPPING_QUOTE_CACHE_TIMEOUT', 600)
+
+
+def _to_cents(amount) -> int:
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+@dataclass(frozen=True)
+class ZoneTable:
+    name: str
+    basis: str
+    bounds: tuple[int, ...] = ()
+    fees: tuple[int, ...] = ()  # 单位：分
+    free_threshold: int | None = None  # 单位：分
+
+    def fee_for(self, measure: int, subtotal_cents: int) -> int:
+        """Fee in cents for a cart weighing (or counting) ``measure``."""
+        if not self.bounds:
+            return 0
+        if self.free_threshold is not None and subtotal_cents >= self.free_threshold:
+            return 0
+        return self.fees[max(bisect_right(self.bounds, measure) - 1, 0)]
+
+
+@dataclass(frozen=True)
+class RateTables:
+    by_country: dict[str, ZoneTable] = field(default_factory=dict)
+    fallback: ZoneTable | None = None
+
+    def zone_for(self, country: str) -> ZoneTable | None:
+        return self.by_country.get(country.upper(), self.fallback)
+
+
+def compile_tables(zones, rates) -> RateTables:
+    """Compile ``ShippingZone``/``ShippingRate`` rows into lookup tables."""
+    bands: dict[int, list[tuple[int, int]]] = {}
+    for rate in rates:
+        bands.setdefault(rate.zone_id, []).append((rate.min_value, _to_cents(rate.fee)))
+    by_country: dict[str, ZoneTable] = {}
+    fallback = None
+    for zone in zones:
+        zone_bands = sorted(bands.get(zone.id, ()))
+        table = ZoneTable(
+            name=zone.name,
+            basis=zone.basis,
+            bounds=tuple(bound for bound, _ in zone_bands),
+            fees=tuple(fee for _, fee in zone_bands),
+            free_threshold=None if zone.free_shipping_threshold is None else _to_cents(zone.free_shipping_threshold),
+        )
+        if zone.countries:
+            for country in zone.countries:
+                by_country[str(country).upper()] = table
+        else:
+            fallback = table
+    return RateTables(by_country, fallback)
+
+
+_tables: tuple[int, RateTables] | None = None
+_lock = threading.Lock()
+
+
+def get_tables() -> RateTables:
+    global _tables
+    version = get_shipping_version()
+    current = _tables
+    if current is not None and current[0] == version:
+        return current[1]
+    from .models import ShippingRate, ShippingZone
+
+    tables = compile_tables(ShippingZone.objects.order_by('id'), ShippingRate.objects.all())
+    with _lock:
+        _tables = (version, tables)
+    return tables
+
+
+@dataclass
+class ShippingQuote:
+    zone: str | None
+    fee: Decimal
+    line_fees: dict[int, Decimal]
+    free_shipping: bool = False
+
+
+def _split(total: int, weights: Sequence[int]) -> list[int]:
+    """Split ``total`` cents proportionally to ``weights`` (largest remainder)."""
+    if not weights:
+        return []
+    if sum(weights) <= 0:
+        weights = [1] * len(weights)
+    weight_sum = sum(weights)
+    shares = [total * weight // weight_sum for weight in weights]
+    by_remainder = sorted(range(len(weights)), key=lambda index: -(total * weights[index] % weight_sum))
+    for index in by_remainder[:total - sum(shares)]:
+        shares[index] += 1
+    return shares
+
+
+def compute_quote(items: Sequence, destination: str, tables: RateTables | None = None) -> ShippingQuote:
+    """Quote cart ``items`` (``CartItem`` with ``goods`` loaded) for ``destination``."""
+    zone = (tables or get_tables()).zone_for(destination)
+    if zone is None or not items:
+        return ShippingQuote(zone.name if zone else None, Decimal('0.00'), {item.id: Decimal('0.00') for item in items})
+
+    if zone.basis == 'quantity':
+        measures = [item.num for item in items]
+    else:
+        measures = [item.goods.weight_grams * item.num for item in items]
+    # 与下单金额一致：按商品当前价格计算小计，不用加购时记录的整数价格
+    subtotal = sum(_to_cents(item.goods.price) * item.num for item in items)
+    fee = zone.fee_for(sum(measures), subtotal)
+    return ShippingQuote(
+        zone=zone.name,
+        fee=_from_cents(fee),
+        line_fees={item.id: _from_cents(share) for item, share in zip(items, _split(fee, measures))},
+        free_shipping=bool(zone.bounds) and zone.free_threshold is not None and subtotal >= zone.free_threshold,
+    )
+
+
+def _quote_key(user_id: int, destination: str) -> str:
+    from cartapp.changes import get_cart_version
+    from goodsapp.changes import get_catalog_version
+
+    return (
+        f'{_QUOTE_PREFIX}:{user_id}:{get_cart_version(user_id)}:{destination}:'
+        f'{get_shipping_version()}:{get_catalog_version()}'
+    )
+
+
+def quote_cart(user_id: int, items: Sequence, destination: str) -> ShippingQuote:
+    """Shipping quote for a user's cart; sets ``post_fee`` on ``items`` in memory only."""
+    items = list(items)
+    destination = destination.upper()
+    key = _quote_key(user_id, destination)
+    quote = cache.get(key)
+    if quote is not None and set(quote.line_fees) == {item.id for item in items}:
+        for item in items:
+            item.post_fee = quote.line_fees[item.id]
+        return quote
+
+    quote = compute_quote(items, destination)
+    for item in items:
+        item.post_fee = quote.line_fees[item.id]
+    cache.set(key, quote, _quote_timeout())
+    return quote
+
+
+def store_cart_fees(user_id: int) -> int:
+    """Write the user's line fees at the default address to ``CartItem.post_fee``; returns the lines changed.
+
+    ``bulk_update`` sends no signals, so the cart version stays put.
+    """
+    from cartapp.models import CartItem
+    from userapp.models import Address
+
+    from .landed_cost import destination_for
+
+    items = list(CartItem.objects.select_related('goods').filter(userInfo_id=user_id, is_delete=False))
+    if not items:
+        return 0
+    stored = {item.id: item.post_fee for item in items}
+    address = Address.objects.filter(aUserInfo_id=user_id, isdefault=True).first()
+    quote_cart(user_id, items, destination_for(address))
+    changed = [item for item in items if item.post_fee != stored[item.id]]
+    if changed:
+        CartItem.objects.bulk_update(changed, ['post_fee'])
+    return len(changed)
+
+
+def clear_local_caches() -> None:
+    global _tables
+    with _lock:
+        _tables = None
+
+
+__all__ = [
+    'RateTables',
+    'ShippingQuote',
+    'ZoneTable',
+    'bump_shipping_version',
+    'compile_tables',
+    'compute_quote',
+    'get_tables',
+    'quote_cart',
+    'store_cart_fees',
+]
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import random
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from cartapp.models import CartItem
+from goodsapp import columnar
+from goodsapp.models import Category, Goods
+from userapp.models import Address, RealName, UserInfo
+
+from . import currency, landed_cost, shipping
+from .models import FxRate, ShippingRate, ShippingZone, TariffRule
+
+
+class CurrencyTestMixin:
+    def setUp(self):  # type: ignore[override]
+        super().setUp()
+        cache.clear()
+        currency.clear_local_caches()
+        columnar.reset_snapshot()
+        FxRate.objects.create(currency='USD', rate=Decimal('0.13800000'))
+        FxRate.objects.create(currency='JPY', rate=Decimal('20.51000000'), decimals=0)
+        FxRate.objects.create(currency='CHF', rate=Decimal('0.12300000'), rounding_step=5)
+
+
+class CurrencyConversionTests(CurrencyTestMixin, TestCase):
+    def test_rounding_rules_per_currency(self):
+        amounts = ['19.99', '0.01', '1000.00']
+
+        self.assertEqual(currency.convert_amounts(amounts, 'USD'), [Decimal('2.76'), Decimal('0.00'), Decimal('138.00')])
+        self.assertEqual(currency.convert_amounts(amounts, 'JPY'), [Decimal('410'), Decimal('0'), Decimal('20510')])
+        # CHF 以 0.05 为舍入步长
+        self.assertEqual(currency.convert_amounts(['19.99', '10.00'], 'CHF'), [Decimal('2.45'), Decimal('1.25')])
+
+    def test_vectorized_path_matches_decimal_reference(self):
+        generator = random.Random(7)
+        amounts = [Decimal(generator.randint(0, 9_999_999)) / 100 for _ in range(2000)]
+        for code in ('USD', 'JPY', 'CHF'):
+            rule = currency.get_rule(code)
+            self.assertEqual(currency.convert_amounts(amounts, code), [rule.convert_one(a) for a in amounts])
+
+    def test_rates_reload_when_table_changes(self):
+        self.assertEqual(currency.convert_amounts(['10.00'], 'USD'), [Decimal('1.38')])
+        rate = FxRate.objects.get(currency='USD')
+        rate.rate = Decimal('0.15')
+        rate.save()
+        self.assertEqual(currency.convert_amounts(['10.00'], 'USD'), [Decimal('1.50')])
+
+        with self.assertRaises(currency.UnsupportedCurrency):
+            currency.resolve_currency('xxx')
+        self.assertIsNone(currency.resolve_currency('cny'))
+
+
+class CurrencyEndpointTests(CurrencyTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(cname='茶叶')
+        self.tea, self.cup = [
+            Goods.objects.create(gname=name, gdesc='-', price=Decimal(price), category=self.category, brand='b')
+            for name, price in (('tea', '19.99'), ('cup', '120.00'))
+        ]
+
+    def test_category_goods_uses_cached_price_list(self):
+        client = APIClient()
+        url = reverse('category_goods', args=[self.category.id])
+
+        response = client.get(url, {'currency': 'usd'})
+
+        self.assertEqual(response.data['currency'], 'USD')
+        prices = {item['id']: (item['price'], item['base_price']) for item in response.data['goods']}
+        self.assertEqual(prices, {self.tea.id: ('2.76', '19.99'), self.cup.id: ('16.56', '120.00')})
+        self.assertEqual(len(currency._price_lists), 1)
+
+        client.get(url, {'currency': 'USD'})
+        self.assertEqual(len(currency._price_lists), 1)
+
+        self.assertEqual(client.get(url, {'currency': 'XYZ'}).status_code, 400)
+        plain = client.get(url)
+        self.assertEqual(plain.data['currency'], 'CNY')
+        self.assertNotIn('base_price', plain.data['goods'][0])
+
+    def test_cart_and_checkout_convert_lines(self):
+        user = UserInfo.objects.create_user(account='fx@example.com', password='pass1234', username='fx')
+        CartItem.objects.create(userInfo=user, goods=self.tea, price=20, num=3)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        cart = client.get(reverse('cart_detail'), {'currency': 'JPY'}).data
+        line = cart['cart'][0]
+        self.assertEqual((line['price'], line['base_price'], line['total_price']), ('410', 20, '1230'))
+        self.assertEqual(line['goods']['price'], '410')
+
+        checkout = client.get(reverse('checkout'), {'currency': 'JPY'}).data
+        # 结账按商品当前售价 19.99 计价，不用购物车里记录的 20
+        self.assertEqual((checkout['total'], checkout['base_total'], checkout['currency']),
+                         ('1230', Decimal('59.97'), 'JPY'))
+        self.assertEqual(checkout['items'][0]['line_total'], '1230')
+
+
+class LandedCostTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        landed_cost.clear_local_caches()
+        self.category = Category.objects.create(cname='服装')
+        self.other = Category.objects.create(cname='杂货')
+        for hs_prefix, category, duty, tax in (
+            ('', None, '0.0500', '0.0000'),
+            ('6109', None, '0.1650', '0.0000'),
+            ('610910', None, '0.3200', '0.0000'),
+            ('', self.category, '0.1000', '0.0800'),
+        ):
+            TariffRule.objects.create(destination='US', hs_prefix=hs_prefix, category=category,
+                                      duty_rate=Decimal(duty), tax_rate=Decimal(tax))
+        TariffRule.objects.create(destination='DE', duty_rate=Decimal('0.1200'), tax_rate=Decimal('0.1900'))
+
+    def test_longest_prefix_then_category_then_default(self):
+        table = landed_cost.get_table('us')
+
+        self.assertEqual(table.rate_for('6109.10.0012', self.other.id), (3200, 0))
+        self.assertEqual(table.rate_for('6109.90', None), (1650, 0))
+        self.assertEqual(table.rate_for('8517', self.category.id), (1000, 800))
+        self.assertEqual(table.rate_for('', self.other.id), (500, 0))
+
+        cost = landed_cost.estimate(table, ['610910', '', ''], [None, self.category.id, None], ['100.00', '19.99', 7])
+        self.assertEqual(cost.duties, [Decimal('32.00'), Decimal('2.00'), Decimal('0.35')])
+        # 增值税按（货值 + 关税）计征
+        self.assertEqual(cost.taxes, [Decimal('0.00'), Decimal('1.76'), Decimal('0.00')])
+
+    def test_vectorized_path_matches_reference(self):
+        generator = random.Random(11)
+        codes = ['', '6109', '610910', '61091000', '8517', '0101']
+        count = 3000
+        hs_codes = [generator.choice(codes) for _ in range(count)]
+        category_ids = [generator.choice([None, self.category.id, self.other.id]) for _ in range(count)]
+        amounts = [Decimal(generator.randint(1, 5_000_000)) / 100 for _ in range(count)]
+        for destination in ('US', 'DE', 'FR'):
+            table = landed_cost.get_table(destination)
+            expected = landed_cost.reference_estimate(table, hs_codes, category_ids, amounts)
+            cost = landed_cost.estimate(table, hs_codes, category_ids, amounts)
+            self.assertEqual((cost.duties, cost.taxes), (expected.duties, expected.taxes))
+
+    def test_tables_reload_when_rules_change(self):
+        self.assertEqual(landed_cost.get_table('DE').default, (1200, 1900))
+        TariffRule.objects.filter(destination='DE').get().delete()
+        self.assertEqual(landed_cost.get_table('DE').default, (0, 0))
+
+    def test_checkout_quotes_and_stores_duty(self):
+        user = UserInfo.objects.create_user(account='duty@example.com', password='pass1234', username='duty')
+        RealName.objects.create(identity_card='1', realname='duty', rUserInfo=user)
+        address = Address.objects.create(aname='a', aphone='1', addr='x', country='US', isdefault=True, aUserInfo=user)
+        shirt = Goods.objects.create(gname='shirt', gdesc='-', price=Decimal('50.00'), category=self.other,
+                                     brand='b', hs_code='6109.10', stock=10)
+        # 购物车里记录的是加购时的旧价格：预览与下单都按商品当前售价计算
+        CartItem.objects.create(userInfo=user, goods=shirt, price=40, num=2)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        quote = client.get(reverse('checkout')).data
+        self.assertEqual((quote['destination'], quote['duty_total'], quote['landed_total']), ('US', '32.00', '132.00'))
+        self.assertEqual((quote['items'][0]['duty'], quote['items'][0]['line_total']), ('32.00', Decimal('100.00')))
+        self.assertEqual(client.get(reverse('checkout'), {'address_id': address.id + 1}).status_code, 400)
+
+        created = client.post(reverse('checkout'), {'address_id': address.id}, format='json').data
+        self.assertEqual((created['total_amount'], created['duty_amount']), (132.0, 32.0))
+
+
+class ShippingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        shipping.clear_local_caches()
+        north_america = ShippingZone.objects.create(name='北美', countries=['US', 'ca'],
+                                                    free_shipping_threshold=Decimal('200.00'))
+        world = ShippingZone.objects.create(name='其他地区', basis='quantity')
+        for zone, min_value, fee in ((north_america, 0, '10.00'), (north_america, 500, '15.00'),
+                                     (north_america, 2000, '30.00'), (world, 1, '20.00'), (world, 3, '35.00')):
+            ShippingRate.objects.create(zone=zone, min_value=min_value, fee=Decimal(fee))
+        category = Category.objects.create(cname='运费')
+        self.user = UserInfo.objects.create_user(account='ship@example.com', password='pass1234', username='ship')
+        self.address = Address.objects.create(aname='a', aphone='1', addr='x', country='US', isdefault=True,
+                                              aUserInfo=self.user)
+        self.heavy, self.light = [
+            Goods.objects.create(gname=name, gdesc='-', price=Decimal('30.00'), category=category, brand='b',
+                                 weight_grams=weight, stock=10)
+            for name, weight in (('heavy', 400), ('light', 100))
+        ]
+
+    def test_bands_zones_and_free_threshold(self):
+        tables = shipping.get_tables()
+        zone = tables.zone_for('us')
+        self.assertIs(tables.zone_for('CA'), zone)
+        self.assertEqual(tables.zone_for('FR').name, '其他地区')
+        self.assertEqual([zone.fee_for(grams, 0) for grams in (0, 499, 500, 1999, 2000, 10 ** 6)],
+                         [1000, 1000, 1500, 1500, 3000, 3000])
+        self.assertEqual(zone.fee_for(2000, 20000), 0)
+
+    def test_free_threshold_uses_current_fractional_goods_price(self):
+        Goods.objects.filter(id=self.light.id).update(price=Decimal('66.67'))
+        self.light.refresh_from_db()
+        # 加购时记录的整数价格 66 × 3 = 198 不到门槛；按当前价格 200.01 包邮，与下单金额一致
+        line = CartItem(id=1, userInfo=self.user, goods=self.light, price=66, num=3)
+        quote = shipping.compute_quote([line], 'US')
+        self.assertEqual((quote.fee, quote.free_shipping), (Decimal('0.00'), True))
+
+        self.light.price = Decimal('66.66')
+        quote = shipping.compute_quote([line], 'US')
+        self.assertEqual((quote.fee, quote.free_shipping), (Decimal('10.00'), False))
+
+    def test_cart_fee_is_split_and_cached_per_cart_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            heavy = CartItem.objects.create(userInfo=self.user, goods=self.heavy, price=30, num=1)
+            light = CartItem.objects.create(userInfo=self.user, goods=self.light, price=30, num=2)
+        # 行运费在购物车写入提交后保存，读取购物车不再写库
+        heavy.refresh_from_db()
+        self.assertEqual(heavy.post_fee, Decimal('10.00'))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with mock.patch('pricingapp.shipping.compute_quote', wraps=shipping.compute_quote) as compute:
+            with mock.patch.object(CartItem.objects, 'bulk_update', side_effect=AssertionError('cart read wrote')):
+                data = client.get(reverse('cart_detail')).data
+            client.get(reverse('cart_detail'))
+            self.assertEqual(compute.call_count, 0)  # 提交后保存运费时已按最终版本缓存报价
+
+            # 600 克落在 500 克档：15.00 按重量 400:200 分摊
+            self.assertEqual((data['shipping_zone'], data['shipping_fee']), ('北美', '15.00'))
+            self.assertEqual({line['id']: line['post_fee'] for line in data['cart']},
+                             {heavy.id: '10.00', light.id: '5.00'})
+
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(reverse('update_cart', args=[light.id]), {'num': 20})
+            data = client.get(reverse('cart_detail')).data
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual((data['shipping_fee'], data['free_shipping']), ('0.00', True))
+            heavy.refresh_from_db()
+            self.assertEqual(heavy.post_fee, Decimal('0.00'))
+
+    def test_checkout_charges_shipping(self):
+        RealName.objects.create(identity_card='1', realname='ship', rUserInfo=self.user)
+        CartItem.objects.create(userInfo=self.user, goods=self.heavy, price=30, num=1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        quote = client.get(reverse('checkout')).data
+        self.assertEqual((quote['shipping_fee'], quote['landed_total']), ('10.00', '40.00'))
+        created = client.post(reverse('checkout'), {'address_id': self.address.id}, format='json').data
+        self.assertEqual((created['total_amount'], created['shipping_amount']), (40.0, 10.0))
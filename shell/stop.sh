@@ -8,6 +8,11 @@ sleep 0.5
 
 echo -e '\n--------------------going to close--------------------'
 
-ps -ef |grep five_class_demo_uwsgi.ini | grep -v grep | awk '{print $2}' | xargs kill -9
+# 先发送 SIGINT 让 worker 正常退出（会写回缓冲中的销量/浏览量计数），超时后再强制结束
+ps -ef |grep five_class_demo_uwsgi.ini | grep -v grep | awk '{print $2}' | xargs -r kill -INT
+
+sleep 3
+
+ps -ef |grep five_class_demo_uwsgi.ini | grep -v grep | awk '{print $2}' | xargs -r kill -9
 
 sleep 0.5
\ No newline at end of file
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userapp', '0013_alter_realname_is_verified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='country',
+            field=models.CharField(default='CN', max_length=2, verbose_name='国家/地区'),
+        ),
+    ]
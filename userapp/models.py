@@ -58,6 +58,7 @@ class Address(models.Model):
     aname = models.CharField(verbose_name="姓名", max_length=30)
     aphone = models.CharField(verbose_name="手机号", max_length=11)
     addr = models.CharField(verbose_name="地址", max_length=100)
+    country = models.CharField(verbose_name="国家/地区", max_length=2, default='CN')  # ISO 3166-1 两位代码，决定进口税费
     isdefault = models.BooleanField(default=False)  # 这是什么？
     aUserInfo = models.ForeignKey(UserInfo, on_delete=models.CASCADE)
 
@@ -31,7 +31,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
-        fields = ['id', 'aname', 'aphone', 'addr', 'isdefault']
+        fields = ['id', 'aname', 'aphone', 'addr', 'country', 'isdefault']
         read_only_fields = ['id']
 
     def create(self, validated_data):